@@ -1,5 +1,7 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
 
+from .dispatch import rejudge_task
 from .models import *
 
 
@@ -9,7 +11,7 @@ class CourseAdmin(admin.ModelAdmin):
     search_fields     = ('title',)
 
     list_filter  = ('groups',)
-    list_display = ('title',)
+    list_display = ('title', 'judge_weight')
     ordering = ('title',)
 
 class CourseElementAdmin(admin.ModelAdmin):
@@ -24,17 +26,27 @@ class CourseElementAdmin(admin.ModelAdmin):
     autocomplete_fields = ('course',)
 
 class TaskAdmin(admin.ModelAdmin):
-    list_filter  = ('execute_answer', 'comments_is_on')
+    list_filter  = ('execute_answer', 'fail_fast', 'grading_policy', 'comments_is_on')
     list_display = ('course_element', 'title', 'comments_is_on')
     ordering     = ('title',)
 
     readonly_fields = ('id',)
     search_fields   = ('title',)
     autocomplete_fields = ('course_element',)
+    actions = ('rejudge',)
+
+    @admin.action(description='Перепроверить ответы на тестах задания')
+    def rejudge(self, request, queryset):
+        if settings.JUDGE_MODE != 'queue':
+            self.message_user(request, 'Повторная проверка доступна только в режиме очереди.', messages.ERROR)
+            return
+
+        queued = sum(rejudge_task(task) for task in queryset.filter(execute_answer=True).select_related('course_element'))
+        self.message_user(request, f'Ответов в очереди повторной проверки: {queued}')
 
 class TaskTestAdmin(admin.ModelAdmin):
     list_filter  = ('task__title',)
-    list_display = ('task', 'hidden')
+    list_display = ('task', 'hidden', 'weight', 'checker')
     ordering     = ('task',) # если в модели есть сортировка, то по умолчанию используется она
 
     readonly_fields = ('id',)
@@ -43,12 +55,35 @@ class TaskTestAdmin(admin.ModelAdmin):
 
 class TaskTestExecutionAdmin(admin.ModelAdmin):
     list_filter  = ('task_test', 'task_answer', 'execution_result') # task_answer не работает
-    list_display = ('task_test', 'task_answer', 'execution_result', 'duration', 'memory_Kbyte')
+    list_display = ('task_test', 'task_answer', 'execution_result', 'duration', 'cpu_duration', 'compile_duration', 'memory_Kbyte')
     ordering     = ('task_test',)
 
     readonly_fields = ('id',)
     autocomplete_fields = ('task_test', 'task_answer')
 
+class TaskAnswerCacheAdmin(admin.ModelAdmin):
+    list_display = ('task', 'code_hash', 'tests_version', 'datetime_create')
+    ordering     = ('task', '-datetime_create')
+
+    readonly_fields = ('id', 'datetime_create')
+    search_fields   = ('task__title', 'code_hash')
+    autocomplete_fields = ('task',)
+
+class JudgeJobAdmin(admin.ModelAdmin):
+    list_display = ('task_answer', 'course', 'student', 'state', 'deadline', 'datetime_create', 'datetime_start', 'worker', 'lease_expires', 'attempts')
+    list_filter  = ('state',)
+    ordering     = ('datetime_create',)
+
+    readonly_fields = ('id', 'datetime_create')
+    search_fields   = ('student__username', 'course__title')
+
+class JudgeWorkerAdmin(admin.ModelAdmin):
+    list_display = ('name', 'datetime_start', 'last_heartbeat')
+    ordering     = ('-last_heartbeat',)
+
+    readonly_fields = ('id', 'datetime_start')
+    search_fields   = ('name',)
+
 class TaskAnswerAdmin(admin.ModelAdmin):
     readonly_fields = ('datetime_load', 'files', 'code', 'id')
     radio_fields    = {'language': admin.VERTICAL}
@@ -107,6 +142,13 @@ class TestQuestionAnswerAdmin(admin.ModelAdmin):
     ordering     = ('datetime',)
 
 
+class GradebookEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'task', 'test', 'mark', 'refresh_at')
+    ordering     = ('user',)
+
+    readonly_fields = ('id', 'user', 'task', 'test', 'mark', 'refresh_at')
+    search_fields   = ('user__username', 'task__title', 'test__title')
+
 class NotificationAdmin(admin.ModelAdmin):
     readonly_fields = ('datetime', 'readed', 'deleted', 'id')
     search_fields   = ('user__username',)
@@ -144,14 +186,18 @@ admin.site.register(Task,TaskAdmin)
 
 admin.site.register(TaskTest,TaskTestAdmin)
 admin.site.register(TaskTestExecution,TaskTestExecutionAdmin)
+admin.site.register(TaskAnswerCache,TaskAnswerCacheAdmin)
 
 admin.site.register(TaskAnswer,TaskAnswerAdmin)
 admin.site.register(TaskAnswerMark,TaskAnswerMarkAdmin)
+admin.site.register(JudgeJob,JudgeJobAdmin)
+admin.site.register(JudgeWorker,JudgeWorkerAdmin)
 
 admin.site.register(Test,TestAdmin)
 admin.site.register(TestResult,TestResultAdmin)
 admin.site.register(TestQuestion,TestQuestionAdmin)
 admin.site.register(TestQuestionAnswer,TestQuestionAnswerAdmin)
+admin.site.register(GradebookEntry,GradebookEntryAdmin)
 
 admin.site.register(Notification,NotificationAdmin)
 admin.site.register(Comment,CommentAdmin)
@@ -0,0 +1,58 @@
+# ответы на несколько вопросов попытки теста (TestQuestionAnswer) одним запросом для TestResultAnswersView
+# - ответы попытки вместе с вопросами загружаются одним запросом, формат проверяется и баллы вычисляются в памяти
+#   (TestQuestionAnswer.is_valid_answer и compute_mark - те же проверка и оценка, что при сохранении одного ответа)
+# - изменённые ответы записываются одним bulk_update в транзакции, кол-во запросов не зависит от кол-ва ответов
+# - test_type 'one': как при ответах по одному, отвечать можно только по порядку - ответы должны быть
+#   первыми вопросами без ответа в порядке возрастания id
+#
+# bulk_update не посылает сигналы: запись журнала оценок пересчитывается явно (см. gradebook.py)
+
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
+
+from . import gradebook
+from .models import TestQuestionAnswer
+
+
+def save_answers(test_result, answers: dict) -> list:
+    '''
+    сохраняет непустые ответы {id TestQuestionAnswer: ответ} активной попытки test_result (test загружен).
+    возвращает ответы в порядке возрастания id.
+    ValidationError - ответ не из этой попытки или неверного формата, PermissionDenied - нарушен порядок ответов теста 'one'
+    '''
+    with transaction.atomic():
+        objects = {
+            x.id: x for x in
+            TestQuestionAnswer.objects.select_for_update(of=('self',)).select_related('test_question')
+            .filter(test_result=test_result).order_by('id')
+        }
+
+        not_found = [ pk for pk in answers if pk not in objects ]
+        if not_found:
+            raise ValidationError({ str(pk): ValidationError('not found') for pk in not_found })
+
+        if test_result.test.test_type == 'one':
+            unanswered = [ pk for pk, x in objects.items() if x.answer == '' ]
+            if sorted(answers) != unanswered[:len(answers)]:
+                raise PermissionDenied()
+
+        changed = []
+        errors = {}
+        for pk in sorted(answers):
+            obj = objects[pk]
+            if obj.answer == answers[pk]:
+                continue
+            obj.answer = answers[pk]
+            if obj.is_valid_answer():
+                obj.compute_mark()
+                changed.append(obj)
+            else:
+                errors[str(pk)] = ValidationError('incorrect')
+        if errors:
+            raise ValidationError(errors)
+
+        if changed:
+            TestQuestionAnswer.objects.bulk_update(changed, ['answer', 'mark'])
+            gradebook.schedule_test(test_result.test_id, test_result.user_id)
+
+    return [ objects[pk] for pk in sorted(answers) ]
@@ -13,6 +13,6 @@ class LmsConfig(AppConfig):
     def ready(self):
         import LMS.signals
 
-        from .celery_tasks import check_files
         print('ready')
-        check_files.delay() # .run ?
\ No newline at end of file
+
+        # результаты из каталогов в запасном режиме считывает check_files по расписанию (CELERY_BEAT_SCHEDULE)
\ No newline at end of file
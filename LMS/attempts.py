@@ -0,0 +1,57 @@
+# начало попытки теста (TestResult) для TestResultCreateView и Test.start_new_test
+# - всё в одной транзакции: проверка сроков, кол-ва попыток и активной попытки, создание попытки и пустых ответов на вопросы
+# - попытки пользователя читаются одним запросом (завершённость вычисляется в SQL, см. TestResultQuerySet.with_marks)
+#   с блокировкой строк попыток (select_for_update, только строки TestResult - тест не блокируется, студенты не ждут друг друга).
+#   SQLite select_for_update не поддерживает, поэтому одновременные запросы одного пользователя разделяет
+#   уникальность (test, user, attempt): вторая попытка с тем же номером не вставится
+# - порядок вопросов перемешивается по id без загрузки объектов TestQuestion, ответы создаются одним bulk_create
+#
+# bulk_create не посылает сигналы: курс ответов передаётся явно (см. course_ids.py)
+
+import random
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import TestQuestionAnswer, TestResult
+
+
+class AttemptError(Exception):
+    '''попытку начать нельзя. текст исключения - сообщение для пользователя'''
+
+
+def start_attempt(test, user, now=None) -> TestResult:
+    '''создаёт попытку теста с ответами на вопросы или бросает AttemptError'''
+    now = now or timezone.now()
+    if now < test.start:
+        raise AttemptError('Тестирование не началось.')
+    if test.end < now:
+        raise AttemptError('Тестирование завершено.')
+
+    try:
+        with transaction.atomic():
+            attempts = list(
+                TestResult.objects.select_for_update(of=('self',)).with_marks(now)
+                .filter(test=test, user=user).values_list('finished', 'attempt')
+            )
+            if not all(finished for finished, _ in attempts):
+                raise AttemptError('Есть активное прохождение теста.')
+            if test.number_of_attempts <= len(attempts):
+                raise AttemptError('Закончились попытки.')
+
+            # в номерах бывают пропуски (попытку удалил администратор): следующий номер - после наибольшего
+            attempt = max((x or 0 for _, x in attempts), default=0) + 1
+            test_result = TestResult.objects.create(test=test, user=user, attempt=attempt)
+
+            question_ids = list(test.test_questions.order_by('id').values_list('id', flat=True))
+            if test.shuffle:
+                random.shuffle(question_ids)
+            TestQuestionAnswer.objects.bulk_create(
+                TestQuestionAnswer(test_result=test_result, test_question_id=question_id, course_id=test_result.course_id)
+                for question_id in question_ids
+            )
+    except IntegrityError:
+        # попытку с этим номером только что начал параллельный запрос
+        raise AttemptError('Есть активное прохождение теста.')
+
+    return test_result
@@ -1,82 +1,475 @@
 # задания для celery
 
+import fcntl
+import json
 import logging
+from collections import defaultdict
 from datetime import timedelta
 from os import path, listdir, rename
-from time import sleep
+from shutil import move, rmtree
+from tempfile import TemporaryDirectory
+from time import perf_counter, time
 
 from django.conf import settings
-from .models import Comment, FileStorage, Notification, TaskAnswer, TaskTestExecution
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from .checkers import check_output, output_checker
+from .judge import JudgePool
+from .languages import get_language
+from .result_cache import cache_executions, delete_expired, get_cached_executions, get_stats
+from .scheduler import pick_jobs
+from .models import SAFE_IMPORTS, Comment, Course, FileStorage, JudgeJob, Notification, TaskAnswer, TaskAnswerMark, TaskTest, TaskTestExecution
 from .celery import app
+from . import gradebook, health, progress, spool
+from celery.signals import worker_process_init, worker_process_shutdown
 
 logger = logging.getLogger(__name__)
 
+# пул создаётся в каждом рабочем процессе celery при первом обращении
+_judge_pool = None
 
-@app.task
-def check_files() -> None:
-    """Считывает результаты выполнения программ и заносит их в базу данных."""
-    while True:
-        #
-        dirs = [ x for x in listdir('/test_dir_executed') if x.endswith('+') and path.isdir(path.join('/test_dir_executed', x)) ]
-        print(dirs)
-
-        if len(dirs) == 0:
-            sleep(1)
-
-        #
-        for dir in dirs:
-            # именем каталога является id соответствующего TaskAnswer
-            try:
-                task_answer = TaskAnswer.objects.get(pk=int(dir[:-1]))
-            except:
-                print('pk dir')
-                return
-
-            assert(task_answer.task.execute_answer)
-
-            files = listdir(path.join('/test_dir_executed', dir))
-            try:
-                [ int(filename) for filename in files ]
-            except:
-                print('files')
-                return
-
-            files.sort()
-            assert(all(str(x1) == str(x2) for (x1, x2) in zip(files, range(len(files)))))
-            assert(len(files) == task_answer.task.task_tests.count())
-
-            # вывод при запуске на тестах обозначаемых от 0 до n-1
-            outputs = []
-            for file in files:
-                with open(path.join('/test_dir_executed', dir, file), 'rt') as fin:
-                    outputs.append(fin.read())
-
-            #
-            task_test_executions = []
-            for i, task_test in enumerate(task_answer.task.task_tests.all().order_by('id')):
-                task_test_executions.append(TaskTestExecution(
+def get_judge_pool() -> JudgePool:
+    """пул для параллельного запуска тестов в текущем процессе"""
+    global _judge_pool
+    if _judge_pool is None:
+        _judge_pool = JudgePool(
+            workers=settings.JUDGE_WORKERS,
+            cpus=settings.JUDGE_CPUS,
+            max_submissions=settings.JUDGE_MAX_SUBMISSIONS,
+            preload=SAFE_IMPORTS if settings.JUDGE_FORKSERVER else None,
+            user=settings.JUDGE_SANDBOX_USER,
+        )
+    return _judge_pool
+
+def get_execution_result(task_test, result) -> str:
+    """Результат запуска на тесте: ошибка выполнения из judge.run_code или сравнение вывода (TaskTest.checker)"""
+    if result['execution_result'] is not None:
+        return result['execution_result']
+    return '0' if check_output(task_test.checker, task_test.output, result['stdout'], task_test.tolerance) else '1'
+
+def build_task_test_executions(task_answer, task_tests, results) -> list:
+    """
+    Создаёт (не сохраняя) TaskTestExecution по результатам запуска программы на тестах (см. judge.run_code). results в порядке task_tests
+    None вместо результата - тест не запускался (Task.fail_fast), он отмечается как пропущенный
+    """
+    task_test_executions = []
+    for task_test, result in zip(task_tests, results):
+        if result is None:
+            task_test_executions.append(TaskTestExecution(
                 task_test=task_test,
                 task_answer=task_answer,
-                stdout=outputs[i],
+                stdout='',
                 stderr='',
                 returncode=0,
-                execution_result='0' if task_test.output == outputs[i] else '1',
-                duration=timedelta(seconds=1),
-                memory_Kbyte=1024,
+                execution_result='8',
+                duration=timedelta(),
+                memory_Kbyte=0,
             ))
+            continue
+
+        task_test_executions.append(TaskTestExecution(
+            task_test=task_test,
+            task_answer=task_answer,
+            stdout=result['stdout'][:1000],
+            # вывод в результатах из каталогов старой версии execute_code.py не обрезан
+            stdout_truncated=result.get('stdout_truncated', False) or 1000 < len(result['stdout']),
+            # в конце трассировки тип и текст исключения, в начале вывода компилятора - первая ошибка
+            stderr=result['stderr'][:100] if result['execution_result'] == '4' else result['stderr'][-100:],
+            returncode=result['returncode'],
+            execution_result=get_execution_result(task_test, result),
+            duration=timedelta(seconds=result['duration']),
+            cpu_duration=timedelta(seconds=result['cpu_time']),
+            compile_duration=timedelta(seconds=result.get('compile_duration', 0)),
+            memory_Kbyte=result['memory_Kbyte'],
+        ))
+
+    return task_test_executions
+
+def store_task_test_executions(task_answers, task_test_executions) -> dict:
+    """
+    Заносит в базу данных результаты запуска нескольких ответов одной транзакцией и снимает с них is_running
+    старые результаты ответов удаляются. по Task.grading_policy ставятся автоматические оценки (teacher=None),
+    оценки преподавателей не меняются
+
+    после занесения публикует событие 'done' для каждого ответа (см. progress.py)
+    возвращает автоматические оценки { id ответа: оценка или None }
+    """
+    task_answer_executions = defaultdict(list)
+    for task_test_execution in task_test_executions:
+        task_answer_executions[task_test_execution.task_answer_id].append(task_test_execution)
+
+    marks, task_answer_marks = {}, []
+    for task_answer in task_answers:
+        marks[task_answer.id] = task_answer.task.get_auto_mark(task_answer_executions[task_answer.id])
+        if marks[task_answer.id] is not None:
+            task_answer_marks.append(TaskAnswerMark(task_answer=task_answer, teacher=None, mark=marks[task_answer.id]))
+
+    ids = [ task_answer.id for task_answer in task_answers ]
+    with transaction.atomic():
+        TaskTestExecution.objects.filter(task_answer_id__in=ids).delete()
+        TaskTestExecution.objects.bulk_create(task_test_executions, batch_size=settings.JUDGE_INGEST_BATCH_SIZE)
+
+        TaskAnswerMark.objects.filter(task_answer_id__in=ids, teacher__isnull=True).delete()
+        # ответы с оценкой преподавателя пропускаются
+        TaskAnswerMark.objects.bulk_create(task_answer_marks, batch_size=settings.JUDGE_INGEST_BATCH_SIZE, ignore_conflicts=True)
+
+        TaskAnswer.objects.filter(pk__in=ids).update(is_running=False)
+
+        # bulk_create не посылает сигналы: журнал оценок пересчитывается одним запросом после фиксации
+        for task_answer in task_answers:
+            gradebook.schedule_task(task_answer.task_id, task_answer.student_id)
+
+    for task_answer in task_answers:
+        task_answer.is_running = False
+        progress.publish(task_answer.id, progress.done_event(task_answer_executions[task_answer.id], marks[task_answer.id]))
+
+    return marks
+
+# средняя продолжительность проверки одного ответа (сек) для оценки ожидания в очереди
+JOB_DURATION_KEY = 'judge:job_duration'
+# счётчики повторной проверки задания (см. dispatch.rejudge_task)
+REJUDGE_TOTAL_KEY = 'rejudge:{}:total'
+REJUDGE_CHANGED_KEY = 'rejudge:{}:changed'
+
+def get_job_duration() -> float:
+    return cache.get(JOB_DURATION_KEY, settings.JUDGE_JOB_DURATION)
+
+def _update_job_duration(duration) -> None:
+    # скользящее среднее, гонка между процессами только сдвигает оценку
+    cache.set(JOB_DURATION_KEY, 0.8 * get_job_duration() + 0.2 * duration, timeout=None)
+
+def get_priority(now):
+    """
+    класс задания для scheduler.fair_order: 0 - дедлайн в ближайшие settings.JUDGE_DEADLINE_PRIORITY,
+    1 - остальные ответы, 2 - повторная проверка после изменения тестов
+    """
+    return lambda job: 2 if job.rejudge else 0 if job.deadline - now <= settings.JUDGE_DEADLINE_PRIORITY else 1
+
+def get_course_weights(jobs) -> dict:
+    return dict(Course.objects.filter(pk__in={ job.course_id for job in jobs }).values_list('id', 'judge_weight'))
+
+@app.task
+def schedule_judge_jobs() -> int:
+    """
+    Передаёт ожидающие ответы рабочим процессам, пока выполняется меньше settings.JUDGE_MAX_IN_FLIGHT (порядок см. scheduler.py)
+    вызывается после постановки ответа в очередь, после проверки каждого ответа и по расписанию.
+    вызывать вне транзакции: рабочий процесс должен увидеть ответ. возвращает кол-во переданных ответов
+    """
+    running = list(JudgeJob.objects.filter(state='1').only('course_id', 'student_id', 'rejudge'))
+    capacity = settings.JUDGE_MAX_IN_FLIGHT - len(running)
+    if capacity <= 0:
+        return 0
+
+    waiting = list(JudgeJob.objects.filter(state='0').only('id', 'course_id', 'student_id', 'deadline', 'rejudge', 'task_answer_id'))
+    now = timezone.now()
+    jobs = pick_jobs(waiting, running, capacity, get_course_weights(waiting), get_priority(now), settings.JUDGE_MAX_IN_FLIGHT_PER_USER)
+
+    # повторная проверка занимает не больше settings.JUDGE_REJUDGE_MAX_IN_FLIGHT мест, остальные остаются новым ответам
+    rejudge_capacity = settings.JUDGE_REJUDGE_MAX_IN_FLIGHT - sum(job.rejudge for job in running)
+
+    started = 0
+    for job in jobs:
+        if job.rejudge:
+            if rejudge_capacity <= 0:
+                continue
+            rejudge_capacity -= 1
+
+        # ответ передаётся один раз, даже если одновременно работают несколько планировщиков
+        if JudgeJob.objects.filter(pk=job.pk, state='0').update(state='1', datetime_start=now, lease_expires=now + settings.JUDGE_LEASE_TIMEOUT, attempts=F('attempts') + 1):
+            if job.rejudge:
+                execute_task_answer.delay(job.task_answer_id, rejudge=True)
+            else:
+                execute_task_answer.delay(job.task_answer_id)
+            started += 1
+    return started
+
+# поля TaskTestExecution, по которым сравниваются результаты повторной проверки. время и память меняются от запуска к запуску
+REJUDGE_COMPARED_FIELDS = ('execution_result', 'stdout', 'stdout_truncated', 'stderr', 'returncode')
+REJUDGE_UPDATED_FIELDS = ('stdout', 'stdout_truncated', 'stderr', 'returncode', 'execution_result', 'duration', 'cpu_duration', 'compile_duration', 'memory_Kbyte')
+
+def store_rejudged_executions(task_answer, task_test_executions) -> bool:
+    """
+    Заносит в базу данных результаты повторной проверки ответа: записываются только изменившиеся результаты
+    (по REJUDGE_COMPARED_FIELDS), автоматическая оценка пересчитывается только при изменении. is_running не меняется
+    возвращает True, если результаты изменились
+    """
+    stored = { x.task_test_id: x for x in TaskTestExecution.objects.filter(task_answer=task_answer) }
+
+    created, updated = [], []
+    for task_test_execution in task_test_executions:
+        old = stored.pop(task_test_execution.task_test_id, None)
+        if old is None:
+            created.append(task_test_execution)
+        elif any(getattr(old, field) != getattr(task_test_execution, field) for field in REJUDGE_COMPARED_FIELDS):
+            task_test_execution.pk = old.pk
+            updated.append(task_test_execution)
+    # результаты удалённых тестов
+    deleted = [ x.pk for x in stored.values() ]
+
+    if not (created or updated or deleted):
+        return False
+
+    mark = task_answer.task.get_auto_mark(task_test_executions)
+    with transaction.atomic():
+        TaskTestExecution.objects.filter(pk__in=deleted).delete()
+        TaskTestExecution.objects.bulk_create(created)
+        TaskTestExecution.objects.bulk_update(updated, REJUDGE_UPDATED_FIELDS)
+
+        TaskAnswerMark.objects.filter(task_answer=task_answer, teacher__isnull=True).delete()
+        if mark is not None:
+            # ответ с оценкой преподавателя пропускается
+            TaskAnswerMark.objects.bulk_create([TaskAnswerMark(task_answer=task_answer, teacher=None, mark=mark)], ignore_conflicts=True)
+        gradebook.schedule_task(task_answer.task_id, task_answer.student_id)
+
+    progress.publish(task_answer.id, progress.done_event(task_test_executions, mark))
+    return True
+
+@app.task
+def execute_task_answer(task_answer_id, rejudge=False) -> None:
+    """
+    Запускает код ответа на задание на тестах задания и заносит результаты в базу данных.
+    rejudge - повторная проверка после изменения тестов (см. dispatch.rejudge_task)
+    """
+    worker = spool.worker_name()
+    health.claim_job(task_answer_id, worker)
+    try:
+        start = perf_counter()
+        _execute_task_answer(task_answer_id, rejudge, worker)
+        _update_job_duration(perf_counter() - start)
+    finally:
+        # место в очереди освобождается, даже если проверка завершилась ошибкой.
+        # удаляется только запись этого процесса: после просрочки аренды reap_judge_jobs мог вернуть ответ в очередь,
+        # и его уже проверяет другой процесс
+        JudgeJob.objects.filter(task_answer_id=task_answer_id, worker=worker).delete()
+        schedule_judge_jobs()
+
+def _execute_task_answer(task_answer_id, rejudge, worker) -> None:
+    # код и тесты берутся из БД, рабочему процессу передаётся только id ответа
+    task_answer = TaskAnswer.objects.select_related('task').filter(pk=task_answer_id).first()
+    if task_answer is None:
+        # ответ удалили, пока он ждал в очереди
+        logger.warning(f'execute_task_answer: TaskAnswer {task_answer_id} not found')
+        return
+
+    renewed = perf_counter()
+
+    if rejudge:
+        # ответы с одинаковым кодом проверяются один раз
+        task_test_executions = get_cached_executions(task_answer)
+        if task_test_executions is not None:
+            _count_rejudged(task_answer, store_rejudged_executions(task_answer, task_test_executions))
+            return
 
-            # записываем в БД результаты запуска тестов. учитывать batch_size
-            task_answer.task_answer_executions.all().delete()
-            TaskTestExecution.objects.bulk_create(task_test_executions)
+    # версия читается до тестов: если тесты изменят во время проверки, то результаты попадут в кэш под старой версией
+    tests_version = task_answer.task.tests_version
+    task_tests = list(task_answer.task.task_tests.all().order_by('id'))
 
-            # ставим макс. оценку если везде вывод совпадает, иначе 0
-            #success = all(x.execution_result == '0' for x in task_test_executions)
+    if not rejudge:
+        progress.publish(task_answer.id, { 'event': 'start', 'tests': len(task_tests) })
+    def on_result(i, result):
+        nonlocal renewed
+        if not rejudge:
+            progress.publish(task_answer.id, { 'event': 'test', 'test': i, 'execution_result': get_execution_result(task_tests[i], result) })
+        # аренда продлевается не чаще, чем раз в четверть срока
+        if settings.JUDGE_LEASE_TIMEOUT.total_seconds() / 4 < perf_counter() - renewed:
+            health.renew_lease(task_answer.id, worker)
+            renewed = perf_counter()
 
-            task_answer.is_running = False
-            task_answer.save(update_fields=['is_running'])
+    with TemporaryDirectory() as dir:
+        code_path = path.join(dir, get_language(task_answer.language).source_name)
+        with open(code_path, 'wt') as fout:
+            fout.write(task_answer.code)
 
-            dir_res = path.join('/test_dir_executed', dir)
-            rename(dir_res, dir_res[:-1])
+        results = get_judge_pool().run_tests(
+            code_path,
+            [ task_test.input for task_test in task_tests ],
+            limit_time=task_answer.task.limit_time.total_seconds(),
+            limit_memory_Mbyte=task_answer.task.limit_memory_Mbyte,
+            accepted=output_checker([ task_test.get_checker() for task_test in task_tests ]) if task_answer.task.fail_fast else None,
+            on_result=on_result,
+            language=get_language(task_answer.language).code,
+        )
+
+    task_test_executions = build_task_test_executions(task_answer, task_tests, results)
+    if rejudge:
+        _count_rejudged(task_answer, store_rejudged_executions(task_answer, task_test_executions))
+    else:
+        store_task_test_executions([task_answer], task_test_executions)
+    cache_executions(task_answer, tests_version, task_test_executions)
+
+def _count_rejudged(task_answer, changed) -> None:
+    if changed:
+        cache.add(REJUDGE_CHANGED_KEY.format(task_answer.task_id), 0, timeout=None)
+        try:
+            cache.incr(REJUDGE_CHANGED_KEY.format(task_answer.task_id))
+        except ValueError:
+            pass
+
+
+# ключи результата запуска на тесте (см. judge.run_code)
+RESULT_KEYS = {'stdout', 'stderr', 'returncode', 'execution_result', 'duration', 'cpu_time', 'memory_Kbyte'}
+
+def _read_results(dir_path, tests_count) -> list:
+    """
+    Считывает результаты запуска на тестах из каталога: файлы от 0 до n-1 в формате json
+    при Task.fail_fast файлов может быть меньше, чем тестов: тесты без файла не запускались (None)
+    при ошибке в формате вызывает ValueError
+    """
+    results = [None] * tests_count
+    for file in listdir(dir_path):
+        if not file.isdigit() or tests_count <= int(file):
+            raise ValueError(f'unexpected file {file}')
+
+        with open(path.join(dir_path, file), 'rt') as fin:
+            result = json.load(fin)
+        if not isinstance(result, dict) or not RESULT_KEYS <= result.keys():
+            raise ValueError(f'bad result in file {file}')
+
+        results[int(file)] = result
+    return results
+
+def _quarantine(dir, reason) -> None:
+    """Переносит каталог с результатами, которые не удалось занести в БД, в settings.JUDGE_SPOOL_QUARANTINE_DIR"""
+    logger.warning(f'ingest_results: {dir} quarantined: {reason}')
+    dir_quarantine = path.join(settings.JUDGE_SPOOL_QUARANTINE_DIR, dir[:-1])
+    if path.exists(dir_quarantine):
+        rmtree(dir_quarantine)
+    move(path.join(settings.JUDGE_SPOOL_RESULT_DIR, dir), dir_quarantine)
+
+def _mark_ingested(dir) -> None:
+    """Каталог <id>+ переименовывается в <id>: результаты занесены в БД"""
+    dir_res = path.join(settings.JUDGE_SPOOL_RESULT_DIR, dir)
+    if path.exists(dir_res[:-1]):
+        rmtree(dir_res[:-1]) # результаты предыдущего запуска этого же ответа
+    rename(dir_res, dir_res[:-1])
+
+def waiting_results() -> list:
+    """Каталоги с готовыми результатами, которые ещё не занесены в БД (<id ответа>+), от старых к новым"""
+    dirs = [ x for x in listdir(settings.JUDGE_SPOOL_RESULT_DIR) if x.endswith('+') and path.isdir(path.join(settings.JUDGE_SPOOL_RESULT_DIR, x)) ]
+    return sorted(dirs, key=lambda x: path.getmtime(path.join(settings.JUDGE_SPOOL_RESULT_DIR, x)))
+
+def ingest_results(max_submissions=None) -> int:
+    """
+    Заносит в БД результаты не более max_submissions ответов (по умолчанию settings.JUDGE_INGEST_SUBMISSIONS) одной транзакцией
+    возвращает кол-во обработанных каталогов
+
+    повторный запуск после сбоя безопасен: каталог помечается обработанным только после фиксации транзакции,
+    а старые TaskTestExecution ответа удаляются перед записью новых
+    """
+    dirs = waiting_results()[:max_submissions or settings.JUDGE_INGEST_SUBMISSIONS]
+
+    # именем каталога является id соответствующего TaskAnswer
+    ids = {}
+    for dir in dirs:
+        if dir[:-1].isdigit():
+            ids[dir] = int(dir[:-1])
+        else:
+            _quarantine(dir, 'bad directory name')
+
+    task_answers = TaskAnswer.objects.select_related('task').in_bulk(ids.values())
+    task_tests = defaultdict(list)
+    for task_test in TaskTest.objects.filter(task_id__in={ x.task_id for x in task_answers.values() }).order_by('id'):
+        task_tests[task_test.task_id].append(task_test)
+
+    ingested, task_test_executions = {}, []
+    for dir, task_answer_id in ids.items():
+        task_answer = task_answers.get(task_answer_id)
+        if task_answer is None:
+            # ответ удалили, пока он выполнялся
+            logger.warning(f'ingest_results: TaskAnswer {task_answer_id} not found')
+            rmtree(path.join(settings.JUDGE_SPOOL_RESULT_DIR, dir))
+            continue
+
+        if not task_answer.task.execute_answer:
+            _quarantine(dir, 'task without automatic check')
+            continue
+
+        try:
+            results = _read_results(path.join(settings.JUDGE_SPOOL_RESULT_DIR, dir), len(task_tests[task_answer.task_id]))
+        except (OSError, ValueError) as e:
+            _quarantine(dir, e)
+            continue
+
+        task_test_executions += build_task_test_executions(task_answer, task_tests[task_answer.task_id], results)
+        ingested[dir] = task_answer
+
+    store_task_test_executions(list(ingested.values()), task_test_executions)
+
+    for dir in ingested:
+        _mark_ingested(dir)
+
+    return len(dirs)
+
+def judge_status() -> dict:
+    """
+    Сколько ответов ждут проверки и результатов ждут занесения в БД, и как долго ждут самые старые из них (сек),
+    сколько ответов в очереди планировщика и передано рабочим процессам, средняя продолжительность проверки (сек),
+    рабочие процессы и аренда ответов (см. health.get_health)
+    и счётчики попаданий и промахов кэша результатов (счётчики процесса, если django cache локальный)
+    """
+    now = timezone.now()
+    running = TaskAnswer.objects.filter(is_running=True).aggregate(count=Count('id'), oldest=Min('datetime_load'))
+
+    jobs = dict(JudgeJob.objects.values_list('state').annotate(count=Count('id')))
+
+    status = {
+        'mode': settings.JUDGE_MODE,
+        **health.get_health(),
+        'running': running['count'],
+        'running_lag': (now - running['oldest']).total_seconds() if running['oldest'] else 0,
+        'queued': jobs.get('0', 0),
+        'in_flight': jobs.get('1', 0),
+        'job_duration': get_job_duration(),
+        'results_waiting': 0,
+        'ingest_lag': 0,
+        'quarantined': 0,
+        **get_stats(),
+    }
+
+    if settings.JUDGE_MODE == 'spool':
+        dirs = waiting_results()
+        status['results_waiting'] = len(dirs)
+        if dirs:
+            status['ingest_lag'] = max(0, time() - path.getmtime(path.join(settings.JUDGE_SPOOL_RESULT_DIR, dirs[0])))
+        if path.isdir(settings.JUDGE_SPOOL_QUARANTINE_DIR):
+            status['quarantined'] = len(listdir(settings.JUDGE_SPOOL_QUARANTINE_DIR))
+
+    return status
+
+@app.task
+def check_files() -> None:
+    """Заносит в базу данных все готовые результаты выполнения программ партиями (settings.JUDGE_MODE = 'spool'). запускается по расписанию"""
+    if settings.JUDGE_MODE != 'spool':
+        return
+
+    # если предыдущий запуск ещё не завершился, то он и занесёт новые результаты
+    with open(path.join(settings.JUDGE_SPOOL_RESULT_DIR, '.lock'), 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+
+        while ingest_results():
+            pass
+
+
+@app.task
+def reap_judge_jobs() -> dict:
+    """Возвращает в очередь или снимает с проверки ответы после сбоев рабочих процессов (см. health.py). запускается по расписанию"""
+    result = health.reap_judge_jobs()
+    if result['requeued']:
+        schedule_judge_jobs()
+    return result
+
+@worker_process_init.connect
+def start_judge_heartbeat(**kwargs) -> None:
+    health.start_heartbeat()
+
+@worker_process_shutdown.connect
+def stop_judge_heartbeat(**kwargs) -> None:
+    health.stop_heartbeat()
 
 
 #@shared_task(name='everyday')
@@ -85,6 +478,9 @@ def everyday() -> None:
     """периодическое удаление данных с сервера"""
     print('everyday start')
 
+    # устаревшие результаты в кэше проверки
+    delete_expired()
+
     return
     # удаление помеченных записей из БД
     # если не переопределён delete, нет каскадного удаления и сигналов, то можно удалять in bulk через QuerySet?
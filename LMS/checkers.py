@@ -0,0 +1,97 @@
+# сравнение вывода программы с ожидаемым выводом теста (TaskTest.checker)
+# модуль не зависит от django: его используют рабочие процессы celery и execute_code.py
+# выводы разбираются генераторами по строкам и словам, без полных копий (split, replace)
+
+import re
+from collections import Counter
+from itertools import zip_longest
+
+_TOKEN = re.compile(r'\S+')
+_LINE = re.compile(r'[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+$')
+
+
+def _lines(text):
+    '''строки текста без '\\r\\n', '\\n', '\\r' и пробелов в конце'''
+    return (match.group().rstrip() for match in _LINE.finditer(text))
+
+def _without_trailing_blank(lines):
+    '''пустые строки выдаются только если за ними есть непустая строка'''
+    blank = 0
+    for line in lines:
+        if line:
+            yield from [''] * blank
+            blank = 0
+            yield line
+        else:
+            blank += 1
+
+def _tokens(text):
+    return (match.group() for match in _TOKEN.finditer(text))
+
+def _equal(first, second) -> bool:
+    '''поэлементное сравнение двух последовательностей с остановкой на первом отличии'''
+    missing = object()
+    return all(x == y for x, y in zip_longest(first, second, fillvalue=missing))
+
+
+def check_exact(expected, actual, tolerance=0) -> bool:
+    '''побайтовое совпадение'''
+    return expected == actual
+
+def check_normalized(expected, actual, tolerance=0) -> bool:
+    '''совпадение строк без учёта окончаний строк, пробелов в конце строк и пустых строк в конце'''
+    return _equal(_without_trailing_blank(_lines(expected)), _without_trailing_blank(_lines(actual)))
+
+def check_tokens(expected, actual, tolerance=0) -> bool:
+    '''совпадение последовательности слов, разделённых любыми пробельными символами'''
+    return _equal(_tokens(expected), _tokens(actual))
+
+def _float_equal(expected, actual, tolerance) -> bool:
+    if expected == actual:
+        return True
+    try:
+        x, y = float(expected), float(actual)
+    except ValueError:
+        return False
+    # абсолютная погрешность для небольших чисел, относительная для больших
+    return abs(x - y) <= tolerance * max(1, abs(x))
+
+def check_float(expected, actual, tolerance=0) -> bool:
+    '''совпадение слов, числа сравниваются с погрешностью tolerance'''
+    missing = object()
+    for x, y in zip_longest(_tokens(expected), _tokens(actual), fillvalue=missing):
+        if x is missing or y is missing or not _float_equal(x, y, tolerance):
+            return False
+    return True
+
+def check_unordered(expected, actual, tolerance=0) -> bool:
+    '''совпадение множеств строк (с повторами) без учёта порядка, строки нормализуются как в check_normalized'''
+    lines = Counter(line for line in _lines(expected) if line)
+    for line in _lines(actual):
+        if not line:
+            continue
+        if lines[line] == 0:
+            return False
+        lines[line] -= 1
+    return not +lines
+
+
+# коды совпадают с TaskTest.CHECKER
+CHECKERS = {
+    '0': check_exact,
+    '1': check_normalized,
+    '2': check_tokens,
+    '3': check_float,
+    '4': check_unordered,
+}
+
+def check_output(checker, expected, actual, tolerance=0) -> bool:
+    '''сравнивает вывод программы actual с ожидаемым expected способом checker (код из CHECKERS)'''
+    return CHECKERS[checker](expected, actual, tolerance)
+
+def output_checker(tests):
+    '''
+    accepted для judge.run_tests: программа завершилась без ошибок и её вывод прошёл проверку
+    tests - список словарей { 'output', 'checker', 'tolerance' } в порядке тестов
+    '''
+    return lambda i, result: result['execution_result'] is None and check_output(tests[i]['checker'], tests[i]['output'], result['stdout'], tests[i]['tolerance'])
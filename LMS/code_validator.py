@@ -0,0 +1,66 @@
+# статическая проверка кода ответа на задание перед запуском (TaskAnswer.clean)
+# код разбирается в синтаксическое дерево (ast) и проверяется за один обход:
+# - импортируются только разрешённые модули (models.SAFE_IMPORTS)
+# - не используются запрещённые встроенные функции (models.NOT_ALLOW_BUILT_IN_FUNCTIONS), в том числе без вызова: f = open,
+#   и атрибуты с теми же именами: print.__self__.open (как и прежнее регулярное выражение, запрещает и re.compile)
+# - нет обращений к служебным атрибутам, через которые можно получить встроенные функции: ().__class__.__bases__[0].__subclasses__()
+# в отличие от регулярных выражений не срабатывает на строки и комментарии
+# код, который не разбирается, не проверен: он отклоняется с SYNTAX_ERROR, а не пропускается
+#
+# проверка не заменяет ограничения при запуске (judge._set_limits): код с динамическими именами (getattr(x, 'a' + 'b')) она пропускает
+# модуль не зависит от django
+
+import ast
+from functools import lru_cache
+
+IMPORT_ERROR = 'import now allowed'
+BUILT_IN_FUNCTION_ERROR = 'this built-in function not allowed'
+ATTRIBUTE_ERROR = 'this attribute not allowed'
+SYNTAX_ERROR = 'syntax error'
+
+
+class CodeValidator:
+    '''
+    результат проверки кэшируется по коду (lru_cache, ключ - хеш строки): повторная проверка того же кода
+    (форма, full_clean, повторная загрузка ответа) не разбирает его заново
+    '''
+    def __init__(self, safe_imports, forbidden_names, forbidden_attributes, cache_size=4096):
+        self.safe_imports = frozenset(safe_imports)
+        self.forbidden_names = frozenset(forbidden_names)
+        self.forbidden_attributes = frozenset(forbidden_attributes)
+        self.validate = lru_cache(maxsize=cache_size)(self._validate)
+
+    def _import_allowed(self, name) -> bool:
+        '''import os.path проверяется по модулю верхнего уровня'''
+        return name.split('.')[0] in self.safe_imports
+
+    def _validate(self, code) -> tuple:
+        '''сообщения об ошибках (каждое не больше одного раза), пустой кортеж - код допустим'''
+        # код разбирается всегда: без разбора нельзя сказать, что код допустим
+        try:
+            tree = ast.parse(code)
+        except (SyntaxError, ValueError) as e:
+            # у ошибки из-за нулевого символа в коде нет номера строки (в старых версиях python это ValueError)
+            lineno = getattr(e, 'lineno', None)
+            return (f'{SYNTAX_ERROR}: line {lineno}' if lineno else SYNTAX_ERROR,)
+
+        errors = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                if not all(self._import_allowed(alias.name) for alias in node.names):
+                    errors.add(IMPORT_ERROR)
+            elif isinstance(node, ast.ImportFrom):
+                # относительный импорт (from . import x) запрещён
+                if node.level or not self._import_allowed(node.module):
+                    errors.add(IMPORT_ERROR)
+            elif isinstance(node, ast.Name):
+                if node.id in self.forbidden_names:
+                    errors.add(BUILT_IN_FUNCTION_ERROR)
+            elif isinstance(node, ast.Attribute):
+                if node.attr in self.forbidden_attributes:
+                    errors.add(ATTRIBUTE_ERROR)
+                # встроенная функция как атрибут: print.__self__.open, builtins_module.eval
+                if node.attr in self.forbidden_names:
+                    errors.add(BUILT_IN_FUNCTION_ERROR)
+
+        return tuple(message for message in (IMPORT_ERROR, BUILT_IN_FUNCTION_ERROR, ATTRIBUTE_ERROR) if message in errors)
@@ -0,0 +1,135 @@
+# денормализованный курс (поле course) у потомков элемента курса: Task, Test, TestQuestion, TestResult,
+# TestQuestionAnswer, TaskAnswer, Comment, FileStorage
+# - проверкам прав и выборкам по курсу не нужно идти до Course через 2-4 внешних ключа
+# - поле заполняется перед сохранением по родителю (сигнал pre_save в signals.py): по закэшированному объекту
+#   родителя без запросов, иначе одним запросом по первичному ключу
+# - если курс объекта изменился (элемент курса перенесён в другой курс, задание - в другой элемент), курс потомков
+#   обновляется одним UPDATE на модель потомков (post_save)
+# - bulk_create и update сигналов не посылают: вызывающий код передаёт course_id сам
+# - строки, созданные до появления поля, заполняет backfill (python manage.py backfill_course_ids)
+
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, CourseElement, FileStorage, Task, TaskAnswer, Test, TestQuestion, TestQuestionAnswer, TestResult
+
+# внешние ключи на родителей, от которых берётся курс. у FileStorage родитель один из двух
+PARENTS = {
+    Task: ('course_element',),
+    Test: ('course_element',),
+    TestQuestion: ('test',),
+    TestResult: ('test',),
+    TestQuestionAnswer: ('test_result', 'test_question'),
+    TaskAnswer: ('task',),
+    Comment: ('task',),
+    FileStorage: ('course_element', 'task_answer'),
+}
+
+# все потомки модели (модель, путь до родителя) для обновления курса одним запросом на модель
+DESCENDANTS = {
+    CourseElement: (
+        (Task, 'course_element'),
+        (Test, 'course_element'),
+        (TestQuestion, 'test__course_element'),
+        (TestResult, 'test__course_element'),
+        (TestQuestionAnswer, 'test_result__test__course_element'),
+        (TaskAnswer, 'task__course_element'),
+        (Comment, 'task__course_element'),
+        (FileStorage, 'course_element'),
+        (FileStorage, 'task_answer__task__course_element'),
+    ),
+    Task: (
+        (TaskAnswer, 'task'),
+        (Comment, 'task'),
+        (FileStorage, 'task_answer__task'),
+    ),
+    Test: (
+        (TestQuestion, 'test'),
+        (TestResult, 'test'),
+        (TestQuestionAnswer, 'test_result__test'),
+    ),
+    TestResult: (
+        (TestQuestionAnswer, 'test_result'),
+    ),
+    TaskAnswer: (
+        (FileStorage, 'task_answer'),
+    ),
+}
+
+
+def _parent_course_id(instance, fields):
+    # родитель уже загружен
+    for name in fields:
+        field = instance._meta.get_field(name)
+        if getattr(instance, field.attname) is not None and field.is_cached(instance):
+            return getattr(instance, name).course_id
+
+    for name in fields:
+        field = instance._meta.get_field(name)
+        pk = getattr(instance, field.attname)
+        if pk is not None:
+            return field.related_model.objects.filter(pk=pk).values_list('course_id', flat=True).first()
+    return None
+
+def _changes_parent(fields, update_fields) -> bool:
+    return update_fields is None or any(name in update_fields for name in fields)
+
+def assign(instance, update_fields=None) -> None:
+    '''
+    заполняет instance.course_id по родителю перед сохранением.
+    прежнее значение запоминается для post_save, если курс изменился у сохранённого объекта
+    '''
+    model = type(instance)
+    if model is CourseElement:
+        # курс задан явно, прежний читается только при возможном переносе
+        if not instance._state.adding and _changes_parent(('course',), update_fields):
+            old = CourseElement.objects.filter(pk=instance.pk).values_list('course_id', flat=True).first()
+            if old != instance.course_id:
+                instance._course_id_changed = True
+        return
+
+    fields = PARENTS[model]
+    if not _changes_parent(fields, update_fields):
+        return
+
+    old = instance.course_id
+    instance.course_id = _parent_course_id(instance, fields)
+    if not instance._state.adding and old != instance.course_id:
+        instance._course_id_changed = True
+
+def propagate(instance, update_fields=None) -> None:
+    '''после сохранения: курс объекта изменился - обновить курс у всех его потомков'''
+    if not instance.__dict__.pop('_course_id_changed', False):
+        return
+
+    model = type(instance)
+    if model is not CourseElement and update_fields is not None and 'course' not in update_fields:
+        model.objects.filter(pk=instance.pk).update(course_id=instance.course_id)
+
+    for descendant, path in DESCENDANTS.get(model, ()):
+        descendant.objects.filter(**{ path: instance }).exclude(course_id=instance.course_id).update(course_id=instance.course_id)
+
+def backfill(all_rows=False) -> int:
+    '''
+    заполняет курс по родителям одним UPDATE на модель, от элементов курса вниз.
+    по умолчанию только пустые значения, all_rows - пересчитать все строки. возвращает кол-во обновлённых строк
+    '''
+    def course_of(model, field):
+        return Subquery(model.objects.filter(pk=OuterRef(field)).values('course_id')[:1])
+
+    updates = (
+        (Task, course_of(CourseElement, 'course_element')),
+        (Test, course_of(CourseElement, 'course_element')),
+        (TestQuestion, course_of(Test, 'test')),
+        (TestResult, course_of(Test, 'test')),
+        (TestQuestionAnswer, course_of(TestResult, 'test_result')),
+        (TaskAnswer, course_of(Task, 'task')),
+        (Comment, course_of(Task, 'task')),
+        (FileStorage, Coalesce(course_of(CourseElement, 'course_element'), course_of(TaskAnswer, 'task_answer'))),
+    )
+
+    count = 0
+    for model, value in updates:
+        queryset = model.objects.all() if all_rows else model.objects.filter(course__isnull=True)
+        count += queryset.update(course_id=value)
+    return count
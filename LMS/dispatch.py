@@ -0,0 +1,134 @@
+# передача ответов на задания на автоматическую проверку
+
+import json
+import logging
+from os import mkdir, path, rename
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from django.core.cache import cache
+
+from .celery_tasks import (
+    REJUDGE_CHANGED_KEY,
+    REJUDGE_TOTAL_KEY,
+    get_course_weights,
+    get_job_duration,
+    get_priority,
+    schedule_judge_jobs,
+    store_task_test_executions,
+)
+from .languages import get_language
+from .models import JudgeJob, TaskAnswer
+from .result_cache import get_cached_executions
+from .scheduler import estimate_wait, queue_position
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch_task_answer(task_answer) -> dict:
+    '''
+    передаёт ответ на задание на автоматическую проверку
+
+    settings.JUDGE_MODE:
+    - 'queue': ответ ставится в очередь (JudgeJob), планировщик передаёт рабочему процессу celery id ответа,
+      код и тесты он берёт из БД
+    - 'spool': код и входные данные тестов записываются в каталог, его подхватывает execute_code.py
+
+    если такой же код уже проверяли на текущих тестах задания, то результаты копируются из кэша без запуска
+    возвращает место в очереди и оценку ожидания в секундах { 'queue_position', 'estimated_wait' }
+    '''
+    task_test_executions = get_cached_executions(task_answer)
+    if task_test_executions is not None:
+        store_task_test_executions([task_answer], task_test_executions)
+    elif settings.JUDGE_MODE == 'spool':
+        write_spool(task_answer)
+    else:
+        return enqueue_task_answer(task_answer)
+    return { 'queue_position': 0, 'estimated_wait': 0 }
+
+def enqueue_task_answer(task_answer) -> dict:
+    '''ставит ответ в очередь проверки и оценивает его место в ней (см. scheduler.py)'''
+    job = JudgeJob.objects.create(
+        task_answer=task_answer,
+        course_id=task_answer.task.course_id,
+        student_id=task_answer.student_id,
+        deadline=task_answer.task.deadline_true,
+    )
+    # рабочий процесс не должен прочитать ответ до завершения транзакции
+    transaction.on_commit(schedule_judge_jobs)
+
+    running = list(JudgeJob.objects.filter(state='1').only('course_id', 'student_id'))
+    waiting = list(JudgeJob.objects.filter(state='0').only('id', 'course_id', 'student_id', 'deadline', 'rejudge'))
+    capacity = max(0, settings.JUDGE_MAX_IN_FLIGHT - len(running))
+
+    position = queue_position(
+        job, waiting, running, capacity, get_course_weights(waiting), get_priority(timezone.now()),
+        limit=settings.JUDGE_QUEUE_POSITION_LIMIT,
+    )
+    return {
+        'queue_position': position,
+        'estimated_wait': round(estimate_wait(position, settings.JUDGE_MAX_IN_FLIGHT, get_job_duration()), 1),
+    }
+
+def can_enqueue(user) -> bool:
+    '''у пользователя меньше settings.JUDGE_MAX_QUEUED_PER_USER ответов в очереди проверки (без повторной проверки)'''
+    return JudgeJob.objects.filter(student=user, rejudge=False).count() < settings.JUDGE_MAX_QUEUED_PER_USER
+
+def rejudge_task(task) -> int:
+    '''
+    ставит все проверенные ответы на задание в очередь повторной проверки (после изменения тестов)
+    ответы передаются рабочим процессам после остальных, не больше settings.JUDGE_REJUDGE_MAX_IN_FLIGHT одновременно,
+    в БД записываются только изменившиеся результаты (см. celery_tasks.store_rejudged_executions)
+    ответы, которые ждут проверки, пропускаются. возвращает кол-во ответов в очереди
+    '''
+    course_id = task.course_id
+    task_answers = TaskAnswer.objects.filter(task=task, is_running=False, judge_job__isnull=True).exclude(code='').values_list('id', 'student_id')
+    jobs = [
+        JudgeJob(task_answer_id=task_answer_id, course_id=course_id, student_id=student_id, deadline=task.deadline_true, rejudge=True)
+        for task_answer_id, student_id in task_answers
+    ]
+    JudgeJob.objects.bulk_create(jobs, batch_size=settings.JUDGE_INGEST_BATCH_SIZE, ignore_conflicts=True)
+
+    cache.set(REJUDGE_TOTAL_KEY.format(task.id), len(jobs), timeout=None)
+    cache.set(REJUDGE_CHANGED_KEY.format(task.id), 0, timeout=None)
+    transaction.on_commit(schedule_judge_jobs)
+    return len(jobs)
+
+def get_rejudge_progress(task) -> dict:
+    '''ход последней повторной проверки задания: сколько ответов поставлено в очередь, осталось и с изменившимися результатами'''
+    return {
+        'total': cache.get(REJUDGE_TOTAL_KEY.format(task.id), 0),
+        'remaining': JudgeJob.objects.filter(task_answer__task=task, rejudge=True).count(),
+        'changed': cache.get(REJUDGE_CHANGED_KEY.format(task.id), 0),
+    }
+
+def write_spool(task_answer) -> None:
+    '''записывает код, язык, ограничения и входные данные тестов в каталог settings.JUDGE_SPOOL_DIR/<id ответа>+'''
+    dir_path = path.join(settings.JUDGE_SPOOL_DIR, str(task_answer.id))
+    mkdir(dir_path)
+
+    language = get_language(task_answer.language)
+    with open(path.join(dir_path, language.source_name), 'wt') as fout:
+        fout.write(task_answer.code)
+
+    with open(path.join(dir_path, 'limits.json'), 'wt') as fout:
+        json.dump({
+            'limit_time': task_answer.task.limit_time.total_seconds(),
+            'limit_memory_Mbyte': task_answer.task.limit_memory_Mbyte,
+            'language': language.code,
+        }, fout)
+
+    task_tests = list(task_answer.task.task_tests.all().order_by('id'))
+    for i, test in enumerate(task_tests):
+        with open(path.join(dir_path, str(i)), 'wt') as fout:
+            fout.write(test.input)
+
+    # ожидаемые выводы и способы сравнения нужны для прекращения проверки на первом непройденном тесте
+    if task_answer.task.fail_fast:
+        with open(path.join(dir_path, 'outputs.json'), 'wt') as fout:
+            json.dump([ test.get_checker() for test in task_tests ], fout)
+
+    # каталог готов к выполнению
+    rename(dir_path, dir_path+'+')
@@ -0,0 +1,103 @@
+# потоковая выгрузка таблиц в CSV и XLSX: строки записываются по одной, в памяти не держится вся таблица
+# - CSV с BOM, чтобы Excel открывал русский текст в utf-8
+# - XLSX собирается без сторонних библиотек: zip-архив с минимальным набором частей SpreadsheetML,
+#   строки без общих строк (inline strings). zipfile пишет в поток без seek (data descriptor после каждой части)
+#
+# модуль не зависит от django: строки - списки значений (None - пустая ячейка, числа - числовые ячейки)
+
+import csv
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+# символы, недопустимые в XML 1.0
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>'''
+
+_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+_WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+_WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>'''
+
+_SHEET_START = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'''
+
+_SHEET_END = '</sheetData></worksheet>'
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class _Buffer:
+    '''поток только для записи: накопленные байты забираются после каждой строки'''
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+class _Line:
+    '''csv.writer пишет строку в write, writerow возвращает её'''
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    '''генератор байтов CSV'''
+    writer = csv.writer(_Line())
+    yield '\ufeff'.encode()
+    for row in rows:
+        yield writer.writerow([ '' if value is None else value for value in row ]).encode()
+
+def _cell(value) -> str:
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_XML_ILLEGAL.sub("", str(value)))}</t></is></c>'
+
+def stream_xlsx(rows, sheet_name='Sheet1'):
+    '''генератор байтов XLSX с одним листом. имя листа - до 31 символа без []:*?/\\'''
+    sheet_name = re.sub(r'[\[\]:*?/\\]', '', sheet_name)[:31] or 'Sheet1'
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK.format(name=escape(sheet_name, { '"': '&quot;' })))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(_SHEET_START.encode())
+            for row in rows:
+                sheet.write(('<row>' + ''.join(_cell(value) for value in row) + '</row>').encode())
+                data = buffer.pop()
+                if data:
+                    yield data
+            sheet.write(_SHEET_END.encode())
+    yield buffer.pop()
@@ -0,0 +1,191 @@
+# запуск кода на python через заранее запущенный интерпретатор (fork server)
+# запуск нового интерпретатора занимает больше времени, чем выполнение небольших программ на тестах.
+# сервер один раз импортирует разрешённые модули (models.SAFE_IMPORTS), а на каждый тест делает fork
+# и выполняет программу в дочернем процессе. ограничения ресурсов и переход к пользователю песочницы
+# (см. judge.py) выполняются после fork.
+#
+# модуль не зависит от django. сервер запускается интерпретатором judge.PYTHON как скрипт:
+# python3.9 LMS/forkserver.py math random ...
+# запросы и ответы передаются через stdin/stdout сервера строками json
+
+import importlib
+import json
+import os
+import runpy
+import shutil
+import subprocess
+import sys
+import traceback
+from threading import Lock
+from time import perf_counter
+
+try:
+    from . import judge
+except ImportError:
+    import judge # сервер запущен как скрипт
+
+SERVER_PATH = os.path.abspath(__file__)
+
+
+def _run_child(filepath, cwd, user, limit_time, limit_memory_Mbyte, cpu, stdin_r, stdout_w, stderr_w) -> None:
+    '''выполняется в дочернем процессе после fork. не возвращает управление'''
+    returncode = 1
+    try:
+        # каналы сервера 0 и 1 заменяются каналами программы, остальные дескрипторы закрываются
+        os.dup2(stdin_r, 0)
+        os.dup2(stdout_w, 1)
+        os.dup2(stderr_w, 2)
+        os.closerange(3, max(int(fd) for fd in os.listdir('/proc/self/fd')) + 1)
+
+        # то же, что judge.run_code: своя группа процессов, пустой каталог, минимальное окружение, пользователь песочницы
+        os.setsid()
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(judge._sandbox_env(cwd))
+        sys.path[0] = cwd
+        judge._set_limits(limit_time, limit_memory_Mbyte, cpu)
+        judge._drop_privileges(user)
+
+        sys.stdin = open(0, 'rt', encoding='utf-8', closefd=False)
+        sys.stdout = open(1, 'wt', encoding='utf-8', closefd=False)
+        sys.stderr = open(2, 'wt', encoding='utf-8', closefd=False)
+        sys.argv = [filepath]
+
+        try:
+            runpy.run_path(filepath, run_name='__main__')
+            returncode = 0
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                returncode = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+        except BaseException:
+            traceback.print_exc()
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except BaseException:
+        returncode = 1
+    finally:
+        os._exit(returncode)
+
+def _run_request(request) -> dict:
+    '''выполняет программу в дочернем процессе сервера. результат как у judge.run_code'''
+    user = request.get('user')
+    cwd, filepath = judge._make_sandbox(user, request['filepath'])
+    try:
+        start = perf_counter()
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+
+        pid = os.fork()
+        if pid == 0:
+            _run_child(filepath, cwd, user, request['limit_time'], request['limit_memory_Mbyte'], request['cpu'], stdin_r, stdout_w, stderr_w)
+
+        for fd in (stdin_r, stdout_w, stderr_w):
+            os.close(fd)
+
+        return judge._collect(
+            pid,
+            os.fdopen(stdin_w, 'wb'),
+            os.fdopen(stdout_r, 'rb'),
+            os.fdopen(stderr_r, 'rb'),
+            request['input'],
+            request['limit_time'],
+            request['limit_memory_Mbyte'],
+            start,
+        )
+    finally:
+        shutil.rmtree(cwd, ignore_errors=True)
+
+def serve(preload) -> None:
+    '''цикл сервера: импорт модулей, затем обработка запросов до закрытия stdin'''
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass # модуля нет в этой версии python, программа получит ошибку сама
+
+    requests, responses = sys.stdin.buffer, sys.stdout.buffer
+    responses.write(b'ready\n')
+    responses.flush()
+
+    for line in iter(requests.readline, b''):
+        result = _run_request(json.loads(line))
+        responses.write(json.dumps(result).encode('utf-8') + b'\n')
+        responses.flush()
+
+
+class ForkServer:
+    '''
+    клиент сервера. запросы выполняются по одному, для параллельного запуска нужно несколько серверов (см. judge.JudgePool)
+    сервер запускается при первом запросе и перезапускается, если завершился
+
+    memory_Kbyte у программ больше, чем при запуске нового интерпретатора: в RSS входят страницы сервера с импортированными модулями
+    '''
+    def __init__(self, preload=()):
+        self.preload = list(preload)
+        self._lock = Lock()
+        self._process = None
+
+    def _start(self) -> None:
+        self._process = subprocess.Popen(
+            [judge.PYTHON, SERVER_PATH, *self.preload],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        if self._process.stdout.readline() != b'ready\n':
+            self._stop()
+            raise RuntimeError('fork server did not start')
+
+    def _stop(self) -> None:
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process.stdin.close()
+            self._process.stdout.close()
+            self._process = None
+
+    def run_code(self, filepath, input, limit_time=1, limit_memory_Mbyte=256, cpu=None, user=None) -> dict:
+        '''то же, что judge.run_code, но без запуска нового интерпретатора'''
+        request = json.dumps({
+            'filepath': os.path.abspath(filepath),
+            'user': user,
+            'input': input,
+            'limit_time': limit_time,
+            'limit_memory_Mbyte': limit_memory_Mbyte,
+            'cpu': cpu,
+        }).encode('utf-8') + b'\n'
+
+        with self._lock:
+            # если сервер завершился, то запускаем его заново и повторяем запрос один раз
+            for _ in range(2):
+                if self._process is None or self._process.poll() is not None:
+                    self._stop()
+                    self._start()
+
+                try:
+                    self._process.stdin.write(request)
+                    self._process.stdin.flush()
+                    line = self._process.stdout.readline()
+                except (BrokenPipeError, OSError):
+                    line = b''
+
+                if line:
+                    return json.loads(line)
+                self._stop()
+
+        raise RuntimeError('fork server failed')
+
+    def close(self) -> None:
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close() # сервер завершается после закрытия stdin
+                self._process.wait()
+                self._process.stdout.close()
+                self._process = None
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1:])
@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.admin.widgets import AdminSplitDateTime
 from django.contrib.auth.models import User
 
+from .languages import LANGUAGES
 from .models import PROGRAMMING_LANGUAGE, TestResult
 from .models import (
     Course,
@@ -102,6 +103,9 @@ class TaskExecOnModelForm(forms.ModelForm):
             'start_code',
             'limit_time',
             'limit_memory_Mbyte',
+            'fail_fast',
+            'languages',
+            'grading_policy',
             ]
         widgets = {
             'title':forms.TextInput(attrs={ 'size':100 }),
@@ -137,6 +141,9 @@ class TaskModelForm(forms.ModelForm):
             'start_code',
             'limit_time',
             'limit_memory_Mbyte',
+            'fail_fast',
+            'languages',
+            'grading_policy',
             #'STACK_Kbyte',
             ]
 
@@ -180,22 +187,46 @@ class TaskTestModelForm(forms.ModelForm):
     ''''''
     class Meta:
         model = TaskTest
-        fields = ['task', 'input', 'output', 'hidden']
+        fields = ['task', 'input', 'output', 'hidden', 'weight', 'checker', 'tolerance']
 
     def __init__(self, *args, **kwargs):
         super(TaskTestModelForm, self).__init__(*args, **kwargs)
 
         self.fields['input'].required = False
+        self.fields['weight'].required = False
+        self.fields['checker'].required = False
+        self.fields['tolerance'].required = False
         self.fields['hidden'].required = True
 
+    def _clean_default(self, name):
+        '''пустое необязательное поле - значение по умолчанию модели (None не сохраняется)'''
+        value = self.cleaned_data[name]
+        if value in self.fields[name].empty_values:
+            return TaskTest._meta.get_field(name).get_default()
+        return value
+
+    def clean_weight(self):
+        return self._clean_default('weight')
+
+    def clean_checker(self):
+        return self._clean_default('checker')
+
+    def clean_tolerance(self):
+        return self._clean_default('tolerance')
+
 class CodeForm(forms.Form):
     '''форма для загрузки кода'''
     language = forms.ChoiceField(choices=PROGRAMMING_LANGUAGE, required=True, label='язык программирования')
 
     def __init__(self,*args,**kwargs):
         initial_code = kwargs.pop('initial_code')
+        # языки задания (Task.get_languages)
+        languages = kwargs.pop('languages', None)
         super(CodeForm, self).__init__(*args,**kwargs)
 
+        if languages is not None:
+            self.fields['language'].choices = [ (code, LANGUAGES[code].name) for code in languages ]
+
         self.fields['code'] = forms.CharField(widget=forms.Textarea(attrs={'placeholder':'добавить код'}), label='put your code here', max_length=1000, initial=initial_code)
 
 class TestCreateModelForm(forms.ModelForm):
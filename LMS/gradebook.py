@@ -0,0 +1,263 @@
+# журнал оценок (models.GradebookEntry): оценки пользователей за задания и тесты без пересчёта на каждой странице
+# - записи пересчитываются после фиксации транзакции, в которой изменились ответ на задание, оценка за ответ,
+#   попытка теста или ответ на вопрос (сигналы в signals.py). изменения через bulk_create/update сигналов не посылают,
+#   их пересчитывает вызывающий код (см. celery_tasks.store_task_test_executions)
+# - оценка, которая зависит только от времени (нет ответа до/после дедлайна, нет попыток до/после окончания теста),
+#   вычисляется при чтении (get_marks)
+# - попытка теста завершается по времени без изменения БД: запись с незавершённой попыткой хранит время её завершения
+#   (refresh_at) и пересчитывается при первом чтении после него
+# - таблица оценок курса для преподавателя (course_marks, course_rows) читает журнал частями по студентам
+#
+# значения совпадают с Task.get_mark и Test.get_user_mark
+
+import threading
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import GradebookEntry, TaskAnswer, TestResult
+
+# точность GradebookEntry.mark
+MARK_PLACES = Decimal('0.0001')
+# точность оценок в выгрузке (как на странице оценок)
+EXPORT_PLACES = Decimal('0.01')
+
+# (id задания или теста, id пользователя), ожидающие пересчёта после фиксации транзакции
+_pending = threading.local()
+
+
+def _quantize(mark):
+    return None if mark is None else mark.quantize(MARK_PLACES)
+
+def _save(field, entries, existing) -> None:
+    '''
+    entries - { (id задания или теста, id пользователя): (mark, refresh_at) }, None - записи быть не должно
+    existing - { (id, id пользователя): GradebookEntry }
+    '''
+    created, updated, deleted = [], [], []
+    for key, value in entries.items():
+        entry = existing.get(key)
+        if value is None:
+            if entry is not None:
+                deleted.append(entry.pk)
+        elif entry is None:
+            created.append(GradebookEntry(**{ field + '_id': key[0] }, user_id=key[1], mark=value[0], refresh_at=value[1]))
+        elif (entry.mark, entry.refresh_at) != value:
+            entry.mark, entry.refresh_at = value
+            updated.append(entry)
+
+    with transaction.atomic():
+        GradebookEntry.objects.filter(pk__in=deleted).delete()
+        GradebookEntry.objects.bulk_update(updated, ['mark', 'refresh_at'])
+        # ignore_conflicts: запись могли создать одновременно в другом процессе, она посчитана по тем же данным
+        GradebookEntry.objects.bulk_create(created, ignore_conflicts=True)
+
+def _existing(field, keys) -> dict:
+    entries = GradebookEntry.objects.filter(**{ field + '_id__in': { x for x, _ in keys } }, user_id__in={ x for _, x in keys })
+    return { (getattr(x, field + '_id'), x.user_id): x for x in entries }
+
+def refresh_tasks(keys) -> None:
+    '''пересчитывает записи заданий. keys - [ (id задания, id пользователя) ]'''
+    keys = set(keys)
+    if not keys:
+        return
+
+    task_answers = TaskAnswer.objects.select_related('task', 'task_answer_mark').filter(
+        task_id__in={ x for x, _ in keys },
+        student_id__in={ x for _, x in keys },
+    )
+    entries = dict.fromkeys(keys)
+    for task_answer in task_answers:
+        key = (task_answer.task_id, task_answer.student_id)
+        if key not in entries:
+            continue
+
+        # ответ есть, оценки нет - None (как в Task.get_mark)
+        task = task_answer.task
+        task_answer_mark = getattr(task_answer, 'task_answer_mark', None)
+        if task_answer_mark is None:
+            mark = None
+        else:
+            mark = task_answer_mark.mark / task.mark_max * task.mark_outer if task.mark_max else Decimal(0)
+        entries[key] = (_quantize(mark), None)
+
+    _save('task', entries, _existing('task', keys))
+
+def refresh_tests(keys) -> None:
+    '''пересчитывает записи тестов. keys - [ (id теста, id пользователя) ]'''
+    keys = set(keys)
+    if not keys:
+        return
+
+    test_results = TestResult.objects.with_marks().filter(
+        test_id__in={ x for x, _ in keys },
+        user_id__in={ x for _, x in keys },
+    )
+    results = { key: [] for key in keys }
+    for test_result in test_results:
+        key = (test_result.test_id, test_result.user_id)
+        if key in results:
+            results[key].append(test_result)
+
+    entries = {}
+    for key, test_results in results.items():
+        if not test_results:
+            entries[key] = None
+            continue
+
+        finished = [ x.evaluate_mark() for x in test_results if x.finished ]
+        # незавершённые попытки завершатся не позже окончания теста
+        pending = [ x.effective_end for x in test_results if not x.finished ]
+        entries[key] = (_quantize(max(finished, default=None)), min(pending, default=None))
+
+    _save('test', entries, _existing('test', keys))
+
+def _flush() -> None:
+    tasks, tests = getattr(_pending, 'tasks', set()), getattr(_pending, 'tests', set())
+    _pending.tasks, _pending.tests = set(), set()
+    refresh_tasks(tasks)
+    refresh_tests(tests)
+
+def _schedule(kind, key) -> None:
+    if not hasattr(_pending, 'tasks'):
+        _pending.tasks, _pending.tests = set(), set()
+    getattr(_pending, kind).add(key)
+    # после отката транзакции ключи остаются и пересчитываются со следующей: пересчёт идёт по данным БД, лишний безвреден
+    transaction.on_commit(_flush)
+
+def schedule_task(task_id, user_id) -> None:
+    '''
+    запись задания будет пересчитана после фиксации текущей транзакции (сразу, если транзакции нет).
+    изменения одной транзакции пересчитываются вместе, а при удалении каскадом пересчёт видит уже удалённые данные
+    '''
+    _schedule('tasks', (task_id, user_id))
+
+def schedule_test(test_id, user_id) -> None:
+    '''запись теста будет пересчитана после фиксации текущей транзакции (см. schedule_task)'''
+    _schedule('tests', (test_id, user_id))
+
+def rebuild(user_ids=None) -> int:
+    '''пересчитывает журнал по всем ответам и попыткам (или только пользователей user_ids). возвращает кол-во записей'''
+    task_answers = TaskAnswer.objects.all()
+    test_results = TestResult.objects.all()
+    entries = GradebookEntry.objects.all()
+    if user_ids is not None:
+        task_answers = task_answers.filter(student_id__in=user_ids)
+        test_results = test_results.filter(user_id__in=user_ids)
+        entries = entries.filter(user_id__in=user_ids)
+
+    task_keys = set(task_answers.values_list('task_id', 'student_id')) | set(entries.filter(task__isnull=False).values_list('task_id', 'user_id'))
+    test_keys = set(test_results.values_list('test_id', 'user_id')) | set(entries.filter(test__isnull=False).values_list('test_id', 'user_id'))
+    refresh_tasks(task_keys)
+    refresh_tests(test_keys)
+    return entries.count()
+
+def _read_entries(entries, now) -> list:
+    '''записи журнала из queryset, записи с завершившейся попыткой теста пересчитываются'''
+    result = list(entries)
+    stale = [ (x.test_id, x.user_id) for x in result if x.refresh_at is not None and x.refresh_at <= now ]
+    if stale:
+        refresh_tests(stale)
+        result = list(entries.all())
+    return result
+
+def _task_mark(entry, task, now):
+    # нет ответа
+    if entry is None:
+        return None if now < task.deadline_true else Decimal(0)
+    return entry.mark
+
+def _test_mark(entry, test, now):
+    # нет завершённых попыток. после окончания теста все попытки завершены
+    if entry is None or entry.mark is None:
+        return Decimal(0) if test.end < now else None
+    return entry.mark
+
+def get_marks(user, tasks, tests) -> tuple:
+    '''
+    оценки пользователя ({ id задания: оценка }, { id теста: оценка }) - значения Task.get_mark и Test.get_user_mark
+    одним запросом к журналу (и пересчёт записей, у которых завершилась попытка теста)
+    '''
+    now = timezone.now()
+    entries = _read_entries(GradebookEntry.objects.filter(user=user), now)
+
+    task_entries = { x.task_id: x for x in entries if x.task_id is not None }
+    test_entries = { x.test_id: x for x in entries if x.test_id is not None }
+
+    task_marks = { task.id: _task_mark(task_entries.get(task.id), task, now) for task in tasks }
+    test_marks = { test.id: _test_mark(test_entries.get(test.id), test, now) for test in tests }
+    return task_marks, test_marks
+
+def course_elements(course) -> list:
+    '''элементы курса с заданиями и тестами (elem.task_list, elem.test_list) по возрастанию id'''
+    elements = list(course.course_elements.prefetch_related('tasks', 'tests').order_by('id'))
+    for elem in elements:
+        elem.task_list = sorted(elem.tasks.all(), key=lambda x: x.id)
+        elem.test_list = sorted(elem.tests.all(), key=lambda x: x.id)
+    return elements
+
+def course_marks(course, elements, chunk_size=500):
+    '''
+    генератор оценок студентов курса по возрастанию id:
+    (студент, { id задания: оценка }, { id теста: оценка }, { id элемента: сумма }, сумма по курсу)
+    суммы считаются как на странице оценок (user_marks): оценка None - 0 баллов
+    студенты читаются частями по chunk_size, записи журнала - одним запросом на часть
+    '''
+    task_ids = [ task.id for elem in elements for task in elem.task_list ]
+    test_ids = [ test.id for elem in elements for test in elem.test_list ]
+
+    last_id = 0
+    while True:
+        students = list(course.students.filter(pk__gt=last_id).order_by('pk')[:chunk_size])
+        if not students:
+            return
+        last_id = students[-1].pk
+
+        now = timezone.now()
+        entries = _read_entries(GradebookEntry.objects.filter(Q(task_id__in=task_ids) | Q(test_id__in=test_ids), user__in=students), now)
+        task_entries = { (x.task_id, x.user_id): x for x in entries if x.task_id is not None }
+        test_entries = { (x.test_id, x.user_id): x for x in entries if x.test_id is not None }
+
+        for student in students:
+            task_marks, test_marks, element_marks = {}, {}, {}
+            for elem in elements:
+                for task in elem.task_list:
+                    task_marks[task.id] = _task_mark(task_entries.get((task.id, student.pk)), task, now)
+                for test in elem.test_list:
+                    test_marks[test.id] = _test_mark(test_entries.get((test.id, student.pk)), test, now)
+
+                marks = [ task_marks[x.id] for x in elem.task_list ] + [ test_marks[x.id] for x in elem.test_list ]
+                element_marks[elem.id] = sum(0 if mark is None else mark for mark in marks)
+
+            yield student, task_marks, test_marks, element_marks, sum(element_marks.values())
+
+def course_rows(course, chunk_size=500):
+    '''
+    генератор строк таблицы оценок курса для выгрузки (см. export.py): заголовок, максимальные баллы, строки студентов
+    по каждому элементу курса - задания, тесты и сумма по элементу, в конце - сумма по курсу. оценки округлены до 0.01
+    '''
+    elements = course_elements(course)
+
+    header, mark_max, total_max = ['id', 'пользователь'], ['', 'максимум'], 0
+    for elem in elements:
+        items = elem.task_list + elem.test_list
+        header += [ x.title for x in items ] + [ f'{elem.title}: итого' ]
+        mark_max += [ x.mark_outer for x in items ] + [ sum(x.mark_outer for x in items) ]
+        total_max += mark_max[-1]
+    header.append('итого')
+    mark_max.append(total_max)
+    yield header
+    yield mark_max
+
+    def round_mark(mark):
+        return None if mark is None else Decimal(mark).quantize(EXPORT_PLACES)
+
+    for student, task_marks, test_marks, element_marks, total in course_marks(course, elements, chunk_size):
+        row = [ student.pk, student.username ]
+        for elem in elements:
+            row += [ round_mark(task_marks[x.id]) for x in elem.task_list ] + [ round_mark(test_marks[x.id]) for x in elem.test_list ]
+            row.append(round_mark(element_marks[elem.id]))
+        row.append(round_mark(total))
+        yield row
@@ -0,0 +1,172 @@
+# состояние автоматической проверки и восстановление после сбоев рабочих процессов
+# - рабочие процессы celery раз в settings.JUDGE_HEARTBEAT_INTERVAL секунд обновляют JudgeWorker,
+#   процессы execute_code.py - файлы heartbeat в каталоге spool (см. spool.py)
+# - ответ в проверке арендуется рабочим процессом (JudgeJob.lease_expires или файл .lease каталога spool),
+#   аренда продлевается во время проверки
+# - reap_judge_jobs (по расписанию) возвращает в очередь ответы с просроченной арендой, после settings.JUDGE_MAX_ATTEMPTS
+#   попыток снимает их с проверки с результатом 'other'. ответы с is_running=True, которых нет ни в очереди, ни в spool,
+#   тоже снимаются с проверки: иначе студент не сможет загрузить новый ответ
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from os import listdir, path
+from shutil import rmtree
+from threading import Thread
+from time import sleep
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from . import progress, spool
+from .models import JudgeJob, JudgeWorker, TaskAnswer, TaskTest, TaskTestExecution
+
+logger = logging.getLogger(__name__)
+
+# через сколько после последнего сигнала запись о рабочем процессе удаляется
+WORKER_FORGET = timedelta(hours=1)
+
+
+def heartbeat(name) -> None:
+    JudgeWorker.objects.update_or_create(name=name, defaults={ 'last_heartbeat': timezone.now() })
+
+def start_heartbeat() -> None:
+    '''поток, который сообщает о текущем процессе (запускается в каждом процессе celery worker)'''
+    name = spool.worker_name()
+
+    def loop():
+        while True:
+            try:
+                heartbeat(name)
+            except Exception as e:
+                logger.warning(f'heartbeat: {name}: {e}')
+            sleep(settings.JUDGE_HEARTBEAT_INTERVAL)
+
+    Thread(target=loop, name='judge-heartbeat', daemon=True).start()
+
+def stop_heartbeat() -> None:
+    JudgeWorker.objects.filter(name=spool.worker_name()).delete()
+
+def claim_job(task_answer_id, worker) -> None:
+    '''рабочий процесс начал проверку ответа'''
+    JudgeJob.objects.filter(task_answer_id=task_answer_id).update(worker=worker, lease_expires=timezone.now() + settings.JUDGE_LEASE_TIMEOUT)
+
+def renew_lease(task_answer_id, worker) -> None:
+    JudgeJob.objects.filter(task_answer_id=task_answer_id, worker=worker).update(lease_expires=timezone.now() + settings.JUDGE_LEASE_TIMEOUT)
+
+def fail_task_answers(task_answer_ids, reason) -> None:
+    '''снимает ответы с проверки: все тесты получают результат 'other' (без оценки), студент может загрузить новый ответ'''
+    task_answers = list(TaskAnswer.objects.filter(pk__in=task_answer_ids))
+    task_tests = defaultdict(list)
+    for task_test in TaskTest.objects.filter(task_id__in={ x.task_id for x in task_answers }).order_by('id'):
+        task_tests[task_test.task_id].append(task_test)
+
+    task_test_executions = defaultdict(list)
+    for task_answer in task_answers:
+        for task_test in task_tests[task_answer.task_id]:
+            task_test_executions[task_answer.id].append(TaskTestExecution(
+                task_test=task_test,
+                task_answer=task_answer,
+                stdout='',
+                stderr=reason[-100:],
+                returncode=0,
+                execution_result='7',
+                duration=timedelta(),
+                memory_Kbyte=0,
+            ))
+
+    ids = [ x.id for x in task_answers ]
+    with transaction.atomic():
+        TaskTestExecution.objects.filter(task_answer_id__in=ids).delete()
+        TaskTestExecution.objects.bulk_create([ x for executions in task_test_executions.values() for x in executions ])
+        JudgeJob.objects.filter(task_answer_id__in=ids).delete()
+        TaskAnswer.objects.filter(pk__in=ids).update(is_running=False)
+
+    for task_answer in task_answers:
+        logger.warning(f'fail_task_answers: TaskAnswer {task_answer.id}: {reason}')
+        progress.publish(task_answer.id, progress.done_event(task_test_executions[task_answer.id], None))
+
+def _reap_queue(now) -> dict:
+    expired = list(JudgeJob.objects.filter(state='1', lease_expires__lt=now))
+    failed = [ job.task_answer_id for job in expired if settings.JUDGE_MAX_ATTEMPTS <= job.attempts ]
+    requeued = [ job.id for job in expired if job.attempts < settings.JUDGE_MAX_ATTEMPTS ]
+
+    # условие повторяется: рабочий процесс мог продлить аренду после чтения
+    requeued = JudgeJob.objects.filter(pk__in=requeued, state='1', lease_expires__lt=now).update(state='0', worker='', lease_expires=None)
+    if failed:
+        fail_task_answers(failed, 'judge lease expired')
+
+    # ответы без записи в очереди: сбой между загрузкой ответа и постановкой в очередь
+    orphans = list(TaskAnswer.objects.filter(is_running=True, judge_job__isnull=True, datetime_load__lt=now - settings.JUDGE_LEASE_TIMEOUT).values_list('id', flat=True))
+    if orphans:
+        fail_task_answers(orphans, 'judge job lost')
+
+    return { 'requeued': requeued, 'failed': len(failed), 'orphans': len(orphans) }
+
+def _reap_spool(now) -> dict:
+    failed = []
+    for dir in listdir(settings.JUDGE_SPOOL_DIR):
+        if not dir.endswith('+') or not dir[:-1].isdigit():
+            continue
+        lease = spool.read_lease(path.join(settings.JUDGE_SPOOL_DIR, dir))
+        if lease is not None and settings.JUDGE_LEASE_TIMEOUT.total_seconds() <= lease[1] and settings.JUDGE_MAX_ATTEMPTS <= lease[0]['attempt']:
+            rmtree(path.join(settings.JUDGE_SPOOL_DIR, dir), ignore_errors=True)
+            failed.append(int(dir[:-1]))
+    if failed:
+        fail_task_answers(failed, 'judge lease expired')
+
+    # каталоги читаются после ответов: execute_code.py сначала создаёт каталог результатов, затем переименовывает каталог кода
+    running = list(TaskAnswer.objects.filter(is_running=True, datetime_load__lt=now - settings.JUDGE_LEASE_TIMEOUT).values_list('id', flat=True))
+    dirs = set(listdir(settings.JUDGE_SPOOL_DIR)) | set(listdir(settings.JUDGE_SPOOL_RESULT_DIR))
+    orphans = [ x for x in running if f'{x}+' not in dirs ]
+    if orphans:
+        fail_task_answers(orphans, 'judge directory lost')
+
+    # в spool каталог с просроченной арендой берёт другой процесс execute_code.py
+    return { 'requeued': 0, 'failed': len(failed), 'orphans': len(orphans) }
+
+def reap_judge_jobs() -> dict:
+    '''возвращает в очередь и снимает с проверки ответы после сбоев рабочих процессов. возвращает кол-во ответов каждого вида'''
+    now = timezone.now()
+    JudgeWorker.objects.filter(last_heartbeat__lt=now - WORKER_FORGET).delete()
+
+    if settings.JUDGE_MODE == 'spool':
+        return _reap_spool(now)
+    return _reap_queue(now)
+
+def get_health() -> dict:
+    '''
+    кол-во живых рабочих процессов, ответов в проверке с действующей и просроченной арендой,
+    сколько секунд ждёт проверки самый старый ответ
+    '''
+    now = timezone.now()
+    workers = JudgeWorker.objects.filter(last_heartbeat__gte=now - settings.JUDGE_WORKER_TIMEOUT).count()
+    leases = JudgeJob.objects.filter(state='1', lease_expires__gte=now).count()
+    expired_leases = JudgeJob.objects.filter(state='1', lease_expires__lt=now).count()
+    oldest = JudgeJob.objects.filter(state='0').aggregate(oldest=Min('datetime_create'))['oldest']
+    pending_age = (now - oldest).total_seconds() if oldest else 0
+
+    if settings.JUDGE_MODE == 'spool' and path.isdir(settings.JUDGE_SPOOL_DIR):
+        timeout = settings.JUDGE_LEASE_TIMEOUT.total_seconds()
+        workers += sum(1 for _, age in spool.read_heartbeats(settings.JUDGE_SPOOL_DIR) if age < settings.JUDGE_WORKER_TIMEOUT.total_seconds())
+
+        for dir in listdir(settings.JUDGE_SPOOL_DIR):
+            dir_path = path.join(settings.JUDGE_SPOOL_DIR, dir)
+            if not dir.endswith('+') or not path.isdir(dir_path):
+                continue
+            lease = spool.read_lease(dir_path)
+            if lease is None:
+                pending_age = max(pending_age, now.timestamp() - path.getmtime(dir_path))
+            elif lease[1] < timeout:
+                leases += 1
+            else:
+                expired_leases += 1
+
+    return {
+        'workers': workers,
+        'leases': leases,
+        'expired_leases': expired_leases,
+        'pending_age': pending_age,
+    }
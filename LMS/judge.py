@@ -0,0 +1,492 @@
+# запуск кода ответов на задания с автоматической проверкой
+# модуль не зависит от django: его используют рабочие процессы celery и execute_code.py
+#
+# каждая программа (и компилятор) выполняется в новом пустом временном каталоге, с минимальным окружением
+# (_sandbox_env), в своей группе процессов и с ограничениями _set_limits. если передан пользователь песочницы
+# (settings.JUDGE_SANDBOX_USER, execute_code.py --user), то от его имени: рабочий процесс запускается от root,
+# а файлы проекта (settings.py, БД) этому пользователю не должны быть доступны.
+# языки без статической проверки кода (Language.sandbox) без пользователя песочницы не запускаются (SandboxError)
+
+import hashlib
+import json
+import math
+import os
+import pwd
+import queue
+import resource
+import shutil
+import signal
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import BoundedSemaphore, Event, Lock, Thread, Timer
+from time import perf_counter
+
+try:
+    from .languages import get_language
+except ImportError:
+    from languages import get_language # импортирован сервером forkserver.py, запущенным как скрипт
+
+# интерпретатор для запуска кода на python
+PYTHON = 'python3.9'
+
+# программы на компилируемых языках по хешу исходного кода (общий для процессов на сервере)
+COMPILE_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'lms-compile-cache')
+COMPILE_CACHE_SIZE = 1000 # сколько программ хранится, давно не запускавшиеся удаляются
+
+# программу, которая не тратит процессорное время (sleep, ожидание), снимаем по часам через limit_time * WALL_TIME_FACTOR
+WALL_TIME_FACTOR = 2
+
+# сколько байт каждого потока вывода программы хранится в памяти. ожидаемый вывод теста не длиннее 1000 символов
+# (TaskTest.output), поэтому программа, которая вывела в stdout больше, снимается с результатом output limit,
+# а от stderr хранятся последние байты (в конце трассировки тип и текст исключения)
+OUTPUT_LIMIT = 64 * 1024
+
+# PATH программ, остальные переменные окружения рабочего процесса не передаются
+SANDBOX_PATH = '/usr/local/bin:/usr/bin:/bin'
+
+# RLIMIT_NPROC считает все процессы пользователя, в том числе программы других тестов, которые выполняются
+# одновременно, поэтому ограничение защищает от fork bomb, а не запрещает fork. для root не действует
+PROCESS_LIMIT = 64
+FILE_SIZE_LIMIT = 16 * 1024 * 1024 # байт в одном записанном файле (в том числе скомпилированная программа)
+OPEN_FILES_LIMIT = 64
+
+
+class SandboxError(Exception):
+    '''язык выполняется только от пользователя песочницы (Language.sandbox), а он не задан'''
+
+
+def available_cpus() -> list:
+    '''CPU на которых может выполняться текущий процесс'''
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def _set_limits(limit_time, limit_memory_Mbyte, cpu) -> None:
+    '''выполняется в дочернем процессе перед запуском программы'''
+    if cpu is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {cpu})
+
+    # после мягкого ограничения процесс получит SIGXCPU, после жёсткого SIGKILL
+    cpu_seconds = math.ceil(limit_time)
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+
+    memory = limit_memory_Mbyte * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+    for kind, value in ((resource.RLIMIT_NPROC, PROCESS_LIMIT), (resource.RLIMIT_FSIZE, FILE_SIZE_LIMIT), (resource.RLIMIT_NOFILE, OPEN_FILES_LIMIT)):
+        # без прав root жёсткое ограничение нельзя повысить
+        _, hard = resource.getrlimit(kind)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(kind, (value, value))
+
+@lru_cache(maxsize=None)
+def _sandbox_ids(user):
+    '''(uid, gid) пользователя песочницы, None - программы выполняются от пользователя рабочего процесса'''
+    if user is None:
+        return None
+    entry = pwd.getpwnam(user)
+    return entry.pw_uid, entry.pw_gid
+
+def _check_sandbox(language, user) -> None:
+    if language.sandbox and user is None:
+        raise SandboxError(f'{language!r} runs only as a sandbox user')
+
+def _sandbox_env(cwd) -> dict:
+    '''окружение программы: переменные рабочего процесса (ключи, пароли) не передаются'''
+    return { 'PATH': SANDBOX_PATH, 'HOME': cwd, 'TMPDIR': cwd, 'LANG': 'C.UTF-8', 'PYTHONDONTWRITEBYTECODE': '1' }
+
+def _make_sandbox(user, source=None, source_name=None) -> tuple:
+    '''
+    создаёт пустой временный каталог запуска, принадлежащий пользователю песочницы
+    source копируется в каталог под именем source_name: к каталогам рабочего процесса у пользователя песочницы нет доступа
+    возвращает (каталог, путь к копии source или None). каталог удаляет вызывающий
+    '''
+    cwd = tempfile.mkdtemp(prefix='lms-run-')
+    path = None
+    if source is not None:
+        path = os.path.join(cwd, source_name or os.path.basename(source))
+        shutil.copyfile(source, path)
+
+    ids = _sandbox_ids(user)
+    if ids is not None:
+        os.chown(cwd, *ids)
+    return cwd, path
+
+def _sandbox_kwargs(user, cwd) -> dict:
+    '''аргументы subprocess для запуска в каталоге cwd от пользователя песочницы'''
+    kwargs = { 'cwd': cwd, 'env': _sandbox_env(cwd), 'start_new_session': True }
+    ids = _sandbox_ids(user)
+    if ids is not None:
+        kwargs.update(user=ids[0], group=ids[1], extra_groups=[])
+    return kwargs
+
+def _drop_privileges(user) -> None:
+    '''переход к пользователю песочницы в дочернем процессе fork server (см. _sandbox_kwargs)'''
+    ids = _sandbox_ids(user)
+    if ids is not None:
+        os.setgroups([])
+        os.setgid(ids[1])
+        os.setuid(ids[0])
+
+def _read_head(stream, buffer, limit, on_overflow) -> None:
+    '''сохраняет в buffer первые limit байт потока. при превышении вызывает on_overflow, остальной вывод отбрасывается'''
+    total = 0
+    for chunk in iter(lambda: stream.read(4096), b''):
+        if len(buffer) < limit:
+            buffer += chunk[:limit - len(buffer)]
+        total += len(chunk)
+        if limit < total <= limit + len(chunk):
+            on_overflow()
+    stream.close()
+
+def _read_tail(stream, buffer, limit) -> None:
+    '''сохраняет в buffer последние limit байт потока'''
+    for chunk in iter(lambda: stream.read(4096), b''):
+        buffer += chunk
+        # буфер обрезается не на каждой порции, чтобы не копировать его каждый раз
+        if 2 * limit < len(buffer):
+            del buffer[:-limit]
+    del buffer[:-limit]
+    stream.close()
+
+def _write_stream(stream, data) -> None:
+    try:
+        stream.write(data)
+    except (BrokenPipeError, OSError):
+        pass # программа завершилась не дочитав ввод
+
+    try:
+        stream.close()
+    except (BrokenPipeError, OSError):
+        pass
+
+def _collect(pid, stdin, stdout, stderr, input, limit_time, limit_memory_Mbyte, start) -> dict:
+    '''
+    передаёт программе ввод, читает её вывод, ждёт завершения и определяет результат (см. run_code)
+    pid - запущенный дочерний процесс (лидер своей группы процессов), stdin/stdout/stderr - файлы его каналов со стороны родителя
+    '''
+    def kill(reason):
+        reason.set()
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    # программа может не тратить процессорное время (sleep, ожидание ввода), поэтому ограничиваем и время по часам
+    killed, output_exceeded = Event(), Event()
+    timer = Timer(limit_time * WALL_TIME_FACTOR, kill, args=(killed,))
+    timer.start()
+
+    stdout_buffer, stderr_buffer = bytearray(), bytearray()
+    threads = [
+        Thread(target=_write_stream, args=(stdin, input.encode('utf-8'))),
+        Thread(target=_read_head, args=(stdout, stdout_buffer, OUTPUT_LIMIT, lambda: kill(output_exceeded))),
+        Thread(target=_read_tail, args=(stderr, stderr_buffer, OUTPUT_LIMIT)),
+    ]
+    for thread in threads:
+        thread.start()
+
+    # wait4 возвращает использованные процессом ресурсы
+    _, status, rusage = os.wait4(pid, 0)
+    duration = perf_counter() - start
+    timer.cancel()
+    timer.join()
+    returncode = os.waitstatus_to_exitcode(status)
+
+    # процессы, запущенные программой, снимаются вместе с ней: иначе они держат каналы вывода открытыми
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+    for thread in threads:
+        thread.join()
+
+    result = {
+        'stdout': stdout_buffer.decode('utf-8', errors='replace'),
+        'stdout_truncated': output_exceeded.is_set(),
+        'stderr': stderr_buffer.decode('utf-8', errors='replace'),
+        'returncode': returncode,
+        'execution_result': None,
+        'duration': duration,
+        'cpu_time': rusage.ru_utime + rusage.ru_stime,
+        'memory_Kbyte': rusage.ru_maxrss, # в Linux ru_maxrss в КБ
+    }
+
+    if output_exceeded.is_set():
+        result['execution_result'] = '9'
+    elif killed.is_set() or limit_time <= result['cpu_time'] or returncode in (-signal.SIGXCPU, -signal.SIGKILL):
+        result['execution_result'] = '2'
+    elif 'MemoryError' in result['stderr'] or limit_memory_Mbyte * 1024 <= result['memory_Kbyte']:
+        result['execution_result'] = '3'
+    elif returncode != 0:
+        result['execution_result'] = '5'
+
+    return result
+
+def _command(template, **values) -> list:
+    '''команда языка (см. languages.py) с подставленными путями'''
+    return [ x.format(python=PYTHON, **values) for x in template ]
+
+@lru_cache(maxsize=None)
+def language_version(language) -> str:
+    '''первая строка вывода команды версии языка, '' если компилятор или интерпретатор не установлен'''
+    try:
+        p = subprocess.run(_command(get_language(language).version), capture_output=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return ''
+    if p.returncode != 0:
+        return ''
+    return (p.stdout or p.stderr).decode('utf-8', errors='replace').partition('\n')[0].strip()
+
+# компиляция одного и того же кода в потоках процесса выполняется один раз
+_compile_locks = [ Lock() for _ in range(64) ]
+
+def _evict_compiled() -> None:
+    entries = [ x for x in os.scandir(COMPILE_CACHE_DIR) if not x.name.endswith('.tmp') ]
+    if len(entries) <= COMPILE_CACHE_SIZE:
+        return
+    for entry in sorted(entries, key=lambda x: x.stat().st_mtime)[:len(entries) - COMPILE_CACHE_SIZE]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass # удалил другой процесс
+
+def compile_code(filepath, language='1', user=None) -> dict:
+    '''
+    получает программу для запуска из файла с исходным кодом на языке language (код из languages.LANGUAGES)
+    компилятор выполняется от пользователя песочницы user (см. начало модуля)
+    возвращает словарь:
+    - path: запускаемый файл (для интерпретируемых языков - исходный) или None при ошибке компиляции
+    - returncode, stderr: результат компилятора
+    - duration: время компиляции (сек), 0 если программа взята из кэша (COMPILE_CACHE_DIR)
+    '''
+    language = get_language(language)
+    _check_sandbox(language, user)
+    if language.compile is None:
+        return { 'path': filepath, 'returncode': 0, 'stderr': '', 'duration': 0 }
+
+    with open(filepath, 'rb') as fin:
+        digest = hashlib.sha256(json.dumps(language.compile).encode('utf-8') + b'\0' + fin.read()).hexdigest()
+    binary = os.path.join(COMPILE_CACHE_DIR, f'{language.code}-{digest}')
+
+    with _compile_locks[int(digest[:8], 16) % len(_compile_locks)]:
+        if os.path.exists(binary):
+            os.utime(binary) # время изменения - время последнего использования для вытеснения
+            return { 'path': binary, 'returncode': 0, 'stderr': '', 'duration': 0 }
+
+        # программы можно запустить по имени, но список каталога пользователю песочницы недоступен
+        os.makedirs(COMPILE_CACHE_DIR, mode=0o711, exist_ok=True)
+        # компилятор запускается в каталоге с копией кода, чтобы в сообщениях был только code.c
+        cwd, _ = _make_sandbox(user, filepath, language.source_name)
+        try:
+            start = perf_counter()
+            try:
+                p = subprocess.run(
+                    _command(language.compile, source=language.source_name, path='program'),
+                    stdin=subprocess.DEVNULL,
+                    capture_output=True,
+                    timeout=language.compile_limit_time * WALL_TIME_FACTOR,
+                    preexec_fn=lambda: _set_limits(language.compile_limit_time, language.compile_limit_memory_Mbyte, None),
+                    **_sandbox_kwargs(user, cwd),
+                )
+                returncode, stderr = p.returncode, p.stderr[-OUTPUT_LIMIT:].decode('utf-8', errors='replace')
+            except subprocess.TimeoutExpired:
+                returncode, stderr = -signal.SIGKILL, 'compilation time limit'
+            duration = perf_counter() - start
+
+            if returncode != 0:
+                return { 'path': None, 'returncode': returncode, 'stderr': stderr, 'duration': duration }
+
+            # программу в кэш копирует рабочий процесс: пользователь песочницы не может изменить программы в кэше
+            tmp_path = f'{binary}.{os.getpid()}.tmp'
+            shutil.copyfile(os.path.join(cwd, 'program'), tmp_path)
+            os.chmod(tmp_path, 0o755)
+            os.replace(tmp_path, binary)
+        finally:
+            shutil.rmtree(cwd, ignore_errors=True)
+
+    _evict_compiled()
+    return { 'path': binary, 'returncode': 0, 'stderr': stderr, 'duration': duration }
+
+def _compile_error(compiled) -> dict:
+    '''результат теста, если код не скомпилировался (см. run_code)'''
+    return {
+        'stdout': '',
+        'stdout_truncated': False,
+        'stderr': compiled['stderr'],
+        'returncode': compiled['returncode'],
+        'execution_result': '4',
+        'duration': 0,
+        'cpu_time': 0,
+        'memory_Kbyte': 0,
+        'compile_duration': compiled['duration'],
+    }
+
+def run_code(filepath, input, limit_time=1, limit_memory_Mbyte=256, cpu=None, language='1', user=None) -> dict:
+    '''
+    запускает программу на входных данных с ограничениями по процессорному времени (сек) и памяти (МБ)
+    cpu - номер CPU за которым закрепляется процесс программы
+    filepath - запускаемый файл языка language (см. compile_code)
+    user - пользователь песочницы, от которого выполняется программа (см. начало модуля)
+
+    возвращает словарь:
+    - stdout (первые OUTPUT_LIMIT байт), stderr (последние OUTPUT_LIMIT байт), returncode
+    - stdout_truncated: программа вывела больше OUTPUT_LIMIT байт и была снята
+    - execution_result: '2' time limit, '3' memory limit, '5' execution error, '9' output limit. None если программа завершилась без ошибок
+    - duration: время работы по часам (сек), cpu_time: процессорное время (сек), memory_Kbyte: пиковый RSS
+    '''
+    language = get_language(language)
+    _check_sandbox(language, user)
+    # исходный код интерпретируемых языков копируется в каталог запуска, скомпилированная программа запускается из кэша
+    cwd, source = _make_sandbox(user, filepath if language.compile is None else None, language.source_name)
+    try:
+        start = perf_counter()
+        p = subprocess.Popen(
+            _command(language.run, path=source or filepath),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            preexec_fn=lambda: _set_limits(limit_time, limit_memory_Mbyte, cpu),
+            **_sandbox_kwargs(user, cwd),
+        )
+
+        result = _collect(p.pid, p.stdin, p.stdout, p.stderr, input, limit_time, limit_memory_Mbyte, start)
+        p.returncode = result['returncode'] # процесс уже завершён через wait4
+    finally:
+        shutil.rmtree(cwd, ignore_errors=True)
+    return result
+
+def run_tests(filepath, inputs, limit_time=1, limit_memory_Mbyte=256, accepted=None, language='1', user=None) -> list:
+    '''
+    компилирует исходный код filepath (см. compile_code) и запускает программу на входных данных всех тестов по очереди
+    возвращает результаты (см. run_code) с временем компиляции compile_duration в порядке тестов,
+    если код не скомпилировался, то у всех тестов результат '4' compile error
+    accepted(i, result) - проверка результата i-го теста. если передана, то после первого непройденного теста
+    остальные тесты не запускаются и вместо их результатов возвращается None
+    user - пользователь песочницы (см. начало модуля)
+    '''
+    compiled = compile_code(filepath, language, user)
+    if compiled['path'] is None:
+        return [ _compile_error(compiled) for _ in inputs ]
+
+    results = [None] * len(inputs)
+    for i, input in enumerate(inputs):
+        results[i] = { **run_code(compiled['path'], input, limit_time, limit_memory_Mbyte, language=language, user=user), 'compile_duration': compiled['duration'] }
+        if accepted is not None and not accepted(i, results[i]):
+            break
+    return results
+
+class JudgePool:
+    '''
+    пул для параллельного выполнения ответов и их тестов
+
+    - workers: сколько программ выполняется одновременно (по умолчанию по одной на CPU)
+    - cpus: CPU за которыми закрепляются программы. каждая запущенная программа занимает один CPU из списка
+    - max_submissions: сколько ответов выполняется одновременно. когда пул занят, submit ждёт освобождения места
+    - preload: если передан список модулей, то программы запускаются через fork server (см. forkserver.py),
+      по одному серверу на каждое место в пуле. иначе для каждого теста запускается новый интерпретатор
+    - user: пользователь песочницы, от которого выполняются программы и компилятор (см. начало модуля)
+
+    каждый тест и так выполняется в отдельном процессе, поэтому пул распределяет запуски с помощью потоков
+    '''
+    def __init__(self, workers=None, cpus=None, max_submissions=None, preload=None, user=None):
+        self.user = user
+        self.cpus = list(cpus) if cpus else available_cpus()
+        self.workers = workers or len(self.cpus)
+        self.max_submissions = max_submissions or self.workers
+
+        if preload is not None:
+            from .forkserver import ForkServer
+
+        # по одному месту на каждый одновременный запуск программы, CPU назначаются по кругу
+        self._slots = queue.Queue()
+        self._forkservers = []
+        for i in range(self.workers):
+            forkserver = None
+            if preload is not None:
+                forkserver = ForkServer(preload)
+                self._forkservers.append(forkserver)
+            self._slots.put((self.cpus[i % len(self.cpus)], forkserver))
+
+        self._tests_executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='judge-test')
+        self._submissions_executor = ThreadPoolExecutor(max_workers=self.max_submissions, thread_name_prefix='judge-submission')
+        self._submission_slots = BoundedSemaphore(self.max_submissions)
+
+    def _run_pinned(self, filepath, input, limit_time, limit_memory_Mbyte, language) -> dict:
+        cpu, forkserver = self._slots.get()
+        try:
+            if forkserver is not None and get_language(language).forkserver:
+                return forkserver.run_code(filepath, input, limit_time, limit_memory_Mbyte, cpu=cpu, user=self.user)
+            return run_code(filepath, input, limit_time, limit_memory_Mbyte, cpu=cpu, language=language, user=self.user)
+        finally:
+            self._slots.put((cpu, forkserver))
+
+    def run_tests(self, filepath, inputs, limit_time=1, limit_memory_Mbyte=256, accepted=None, on_result=None, language='1') -> list:
+        '''
+        компилирует исходный код (см. judge.run_tests) один раз и запускает программу на тестах параллельно
+        возвращает результаты (см. run_code) с временем компиляции compile_duration в порядке тестов
+        accepted(i, result) - см. judge.run_tests. после первого по порядку непройденного теста ещё не начатые запуски
+        отменяются, а результаты всех последующих тестов (даже уже выполненных) заменяются на None
+        on_result(i, result) - вызывается для результатов в порядке тестов, как только они готовы (кроме заменённых на None)
+        '''
+        compiled = compile_code(filepath, language, self.user)
+        if compiled['path'] is None:
+            results = [ _compile_error(compiled) for _ in inputs ]
+            for i, result in enumerate(results):
+                if on_result is not None:
+                    on_result(i, result)
+            return results
+
+        futures = [ self._tests_executor.submit(self._run_pinned, compiled['path'], input, limit_time, limit_memory_Mbyte, language) for input in inputs ]
+
+        results = [None] * len(inputs)
+        for i, future in enumerate(futures):
+            results[i] = { **future.result(), 'compile_duration': compiled['duration'] }
+            if on_result is not None:
+                on_result(i, results[i])
+            if accepted is not None and not accepted(i, results[i]):
+                for rest in futures[i + 1:]:
+                    rest.cancel()
+                # уже запущенные программы дорабатывают, их результаты не нужны.
+                # ждём их, чтобы место ответа в пуле освобождалось вместе с CPU
+                for rest in futures[i + 1:]:
+                    if not rest.cancelled():
+                        rest.exception()
+                break
+        return results
+
+    def submit(self, filepath, inputs, limit_time=1, limit_memory_Mbyte=256, timeout=None, accepted=None, language='1'):
+        '''
+        ставит ответ в очередь на выполнение, возвращает Future со списком результатов (см. run_tests)
+        если одновременно выполняется max_submissions ответов, то ждёт освобождения места (не дольше timeout)
+        при истечении timeout возвращает None
+        '''
+        if not self._submission_slots.acquire(timeout=timeout):
+            return None
+
+        try:
+            future = self._submissions_executor.submit(self.run_tests, filepath, inputs, limit_time, limit_memory_Mbyte, accepted, language=language)
+        except:
+            self._submission_slots.release()
+            raise
+
+        future.add_done_callback(lambda f: self._submission_slots.release())
+        return future
+
+    def is_saturated(self) -> bool:
+        '''все места для ответов заняты'''
+        if self._submission_slots.acquire(blocking=False):
+            self._submission_slots.release()
+            return False
+        return True
+
+    def shutdown(self, wait=True) -> None:
+        self._submissions_executor.shutdown(wait=wait)
+        self._tests_executor.shutdown(wait=wait)
+        for forkserver in self._forkservers:
+            forkserver.close()
@@ -0,0 +1,64 @@
+# языки программирования ответов на задания (TaskAnswer.language, коды - models.PROGRAMMING_LANGUAGE)
+# язык описывает, как из исходного кода получить программу и как её запустить:
+# - source_name: имя файла с исходным кодом
+# - compile: команда компиляции (None - интерпретируемый язык), ограничения компиляции
+# - run: команда запуска, version: команда для получения версии компилятора или интерпретатора
+# в командах подставляются {python} - judge.PYTHON, {source} - файл исходного кода,
+# {path} - запускаемый файл (исходный код или результат компиляции)
+#
+# программы на компилируемых языках выполняются с теми же ограничениями (judge._set_limits), что и на python,
+# но без статической проверки кода (code_validator.py), поэтому только от пользователя песочницы (sandbox,
+# settings.JUDGE_SANDBOX_USER). языки, доступные в заданиях, включаются в settings.JUDGE_LANGUAGES и Task.languages
+#
+# модуль не зависит от django: его используют рабочие процессы celery и execute_code.py
+
+
+class Language:
+    def __init__(self, code, name, source_name, run, version, compile=None, compile_limit_time=10, compile_limit_memory_Mbyte=1024, forkserver=False, validate_code=False, sandbox=False):
+        self.code = code
+        self.name = name
+        self.source_name = source_name
+        self.run = run
+        self.version = version
+        self.compile = compile
+        self.compile_limit_time = compile_limit_time
+        self.compile_limit_memory_Mbyte = compile_limit_memory_Mbyte
+        # программы можно запускать через fork server (forkserver.py)
+        self.forkserver = forkserver
+        # код проверяется models.CODE_VALIDATOR перед запуском
+        self.validate_code = validate_code
+        # программы выполняются только от пользователя песочницы (judge.SandboxError без него)
+        self.sandbox = sandbox
+
+    def __repr__(self):
+        return f'Language({self.code!r}, {self.name!r})'
+
+
+LANGUAGES = {
+    '1': Language(
+        code='1',
+        name='python 3.9.5',
+        source_name='code.py',
+        run=['{python}', '{path}'],
+        version=['{python}', '--version'],
+        forkserver=True,
+        validate_code=True,
+    ),
+    '2': Language(
+        code='2',
+        name='C11 (gcc)',
+        source_name='code.c',
+        compile=['gcc', '-std=c11', '-O2', '-pipe', '-o', '{path}', '{source}', '-lm'],
+        run=['{path}'],
+        version=['gcc', '--version'],
+        sandbox=True,
+    ),
+}
+
+# у ответов, загруженных до появления выбора языка, language не заполнен
+DEFAULT_LANGUAGE = '1'
+
+
+def get_language(code) -> Language:
+    '''язык по коду TaskAnswer.language. KeyError для неизвестного кода'''
+    return LANGUAGES[code or DEFAULT_LANGUAGE]
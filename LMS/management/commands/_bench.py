@@ -0,0 +1,74 @@
+# общие функции команд замера производительности: перцентили, сохранение и сравнение результатов
+# файл начинается с '_', поэтому django не считает его командой
+
+import json
+import math
+import os
+import platform
+import subprocess
+from datetime import datetime
+
+from django.conf import settings
+
+from LMS.judge import language_version
+from LMS.languages import LANGUAGES
+
+
+def percentile(values, p) -> float:
+    '''перцентиль p (0..100) с линейной интерполяцией, 0 для пустого списка'''
+    if not values:
+        return 0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    f, c = math.floor(k), math.ceil(k)
+    return values[f] + (values[c] - values[f]) * (k - f)
+
+def summarize(values) -> dict:
+    '''среднее, p50, p95, p99 и максимум'''
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else 0,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values, default=0),
+    }
+
+def environment() -> dict:
+    '''условия замера: без них результаты разных запусков нельзя сравнивать'''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'database': settings.DATABASES['default']['ENGINE'],
+        'languages': { code: language_version(code) for code in LANGUAGES },
+    }
+
+def save(file_path, data) -> None:
+    with open(file_path, 'wt') as fout:
+        json.dump(data, fout, indent=2, ensure_ascii=False)
+
+def load(file_path) -> dict:
+    with open(file_path, 'rt') as fin:
+        return json.load(fin)
+
+def compare(baseline, current, threshold) -> list:
+    '''
+    сравнение числовых показателей двух запусков { раздел: { показатель: значение } }
+    возвращает [ (раздел, показатель, было, стало, изменение в %, хуже ли на threshold % и больше) ]
+    все показатели - время, поэтому рост значения - ухудшение
+    '''
+    rows = []
+    for section, metrics in current.items():
+        for name, value in metrics.items():
+            old = baseline.get(section, {}).get(name)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or name == 'count':
+                continue
+            change = (value - old) / old * 100 if old else 0
+            rows.append((section, name, old, value, change, threshold <= change))
+    return rows
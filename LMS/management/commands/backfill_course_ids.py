@@ -0,0 +1,20 @@
+# заполнение денормализованного курса (поле course) у заданий, тестов, ответов, комментариев и файлов (см. course_ids.py)
+# нужно один раз после добавления поля в существующую БД и после изменений данных в обход сигналов (например, через shell)
+# python manage.py backfill_course_ids [--all]
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from LMS.course_ids import backfill
+
+
+class Command(BaseCommand):
+    help = 'заполняет курс у потомков элементов курса по их родителям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='пересчитать все строки, а не только пустые')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = backfill(all_rows=options['all'])
+        self.stdout.write(f'rows={count}')
@@ -0,0 +1,67 @@
+# сравнение проверки кода ответа: прежние регулярные выражения и ast (code_validator.py)
+# python manage.py code_validator_bench --lines 100 1000 10000
+
+import re
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from LMS.code_validator import CodeValidator
+from LMS.models import NOT_ALLOW_ATTRIBUTES, NOT_ALLOW_BUILT_IN_FUNCTIONS, SAFE_IMPORTS
+
+# фрагменты из которых составляется код
+CODE_LINES = [
+    'import math, random',
+    'from itertools import permutations',
+    'n = int(input())',
+    'values = [ random.randint(0, n) for _ in range(n) ]',
+    'def solve(values):',
+    '    return sorted(values)[len(values) // 2] + math.floor(n / 3)',
+    'print(solve(values), re_compile := "compile(")',
+    '# eval(1) в комментарии',
+]
+
+
+def regex_validate(code) -> list:
+    '''прежняя проверка из TaskAnswer.clean'''
+    errors = []
+    import_lines = re.findall(r'\Wfrom|import.*$', code)
+    for line in import_lines:
+        if not all( x in SAFE_IMPORTS+['from', 'import', 'as'] for x in re.split(r'\W+', line)):
+            errors.append('import now allowed')
+
+    for s in NOT_ALLOW_BUILT_IN_FUNCTIONS:
+        if re.search(r'^_pref_\(|[^a-z0-9]_pref_\('.replace('_pref_', s), code):
+            errors.append('this built-in function not allowed')
+    return errors
+
+
+class Command(BaseCommand):
+    help = 'время проверки кода ответа (мс): регулярные выражения, ast без кэша и ast с кэшем'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[100, 1000, 10000], help='размеры кода в строках')
+        parser.add_argument('--repeat', type=int, default=20, help='кол-во проверок одного кода')
+
+    def measure(self, validate, code, repeat) -> float:
+        '''среднее время проверки, мс'''
+        start = perf_counter()
+        for _ in range(repeat):
+            validate(code)
+        return (perf_counter() - start) * 1000 / repeat
+
+    def handle(self, *args, **options):
+        for lines in options['lines']:
+            code = '\n'.join(CODE_LINES[i % len(CODE_LINES)] for i in range(lines))
+
+            # кэш размера 0 - каждая проверка заново разбирает код
+            uncached = CodeValidator(SAFE_IMPORTS, NOT_ALLOW_BUILT_IN_FUNCTIONS, NOT_ALLOW_ATTRIBUTES, cache_size=0)
+            cached = CodeValidator(SAFE_IMPORTS, NOT_ALLOW_BUILT_IN_FUNCTIONS, NOT_ALLOW_ATTRIBUTES)
+            cached.validate(code) # первая проверка не входит в замер
+
+            self.stdout.write(
+                f'lines={lines} chars={len(code)}: '
+                f'regex {self.measure(regex_validate, code, options["repeat"]):.3f} ms, '
+                f'ast {self.measure(uncached.validate, code, options["repeat"]):.3f} ms, '
+                f'ast cached {self.measure(cached.validate, code, options["repeat"]):.4f} ms'
+            )
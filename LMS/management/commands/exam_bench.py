@@ -0,0 +1,220 @@
+# нагрузочный замер тестов (Test) в момент начала экзамена: N студентов одновременно начинают попытку,
+# отвечают на вопросы и завершают попытку через API
+# python manage.py exam_bench --students 300 --concurrency 32 --questions 20 --output before.json
+# python manage.py exam_bench --students 300 --concurrency 32 --questions 20 --output after.json --compare before.json
+#
+# сессия студента: POST test-result-create/ -> для каждого вопроса GET и PATCH test-question-answer/<pk>/ -> PATCH test-result-complete/<pk>/
+# запросы выполняются APIClient в потоках этой команды (как в pipeline_bench), каждый поток - своё соединение с БД.
+# первые --concurrency сессий начинаются одновременно (барьер), остальные - по мере освобождения потоков
+# для каждого запроса записывается время, код ответа, кол-во запросов к БД и ошибки блокировки БД (SQLite "database is locked")
+# курс, тест и студенты создаются в БД и удаляются после замера
+
+import json
+import random
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from threading import Barrier, BrokenBarrierError, Thread
+from time import perf_counter, sleep
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from LMS.models import Course, CourseElement, Test, TestQuestion
+from . import _bench
+
+# вопросы теста по кругу: (тип, варианты, правильный ответ)
+QUESTIONS = [
+    ('one', 'баг\nфича\nбаг и фича\nни то ни другое', '1'),
+    ('many1', 'int\nstr\nlist\ndict', '2 3'),
+    ('free', '', '42'),
+]
+
+ENDPOINTS = ['test-result-create', 'test-question-answer GET', 'test-question-answer PATCH', 'test-result-complete']
+
+
+class Command(BaseCommand):
+    help = 'нагрузочный замер тестов: одновременное начало экзамена, ответы на вопросы, завершение попыток (p50/p95/p99 по запросам, запросы к БД, блокировки)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=100, help='кол-во студентов (сессий)')
+        parser.add_argument('--concurrency', type=int, default=16, help='сколько сессий выполняется одновременно')
+        parser.add_argument('--questions', type=int, default=10, help='кол-во вопросов в тесте')
+        parser.add_argument('--test-type', choices=['one', 'many'], default='many', help='тип теста (Test.test_type)')
+        parser.add_argument('--think-time', type=float, default=0, help='наибольшая пауза студента перед каждым ответом, сек (случайная от 0)')
+        parser.add_argument('--output', default=None, help='файл для результатов (json)')
+        parser.add_argument('--compare', default=None, help='файл с результатами прошлого запуска (json)')
+        parser.add_argument('--threshold', type=float, default=10, help='ухудшение в %%, при котором команда завершается ошибкой (с --compare)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def create_fixtures(self, options) -> tuple:
+        '''курс с тестом, который уже начался, и записанные на курс студенты'''
+        prefix = f'exam_bench_{uuid4().hex[:8]}'
+
+        with transaction.atomic():
+            course = Course.objects.create(title=prefix)
+            test = Test.objects.create(
+                course_element=CourseElement.objects.create(course=course, title=prefix),
+                title=prefix,
+                mark_outer=Decimal(10),
+                number_of_attempts=1,
+                test_type=options['test_type'],
+                start=timezone.now() - timedelta(seconds=1),
+                end=timezone.now() + timedelta(hours=3),
+                duration=timedelta(hours=2),
+            )
+            questions = [ QUESTIONS[i % len(QUESTIONS)] for i in range(options['questions']) ]
+            TestQuestion.objects.bulk_create(
+                TestQuestion(test=test, course_id=course.id, question_text=f'{prefix} {i}', max_mark=Decimal(1), answer_type=answer_type, answer_values=answer_values, answer_true=answer_true)
+                for i, (answer_type, answer_values, answer_true) in enumerate(questions)
+            )
+
+            User.objects.bulk_create(User(username=f'{prefix}_{i}') for i in range(options['students']))
+            students = list(User.objects.filter(username__startswith=f'{prefix}_').order_by('id'))
+            course.students.add(*students)
+
+        return course, test, students
+
+    def answer(self, rnd, question) -> str:
+        '''случайный допустимый ответ на вопрос из test-question-answer GET'''
+        if question['answer_type'] == 'free':
+            return str(rnd.randint(40, 44))
+        indexes = range(len(question['answer_values']))
+        if question['answer_type'] == 'one':
+            return str(rnd.choice(indexes))
+        return ' '.join(str(x) for x in sorted(rnd.sample(indexes, rnd.randint(1, len(indexes)))))
+
+    def request(self, client, records, endpoint, method, url, data=None):
+        '''запрос через API с замером. None, если запрос завершился исключением'''
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        record = { 'endpoint': endpoint }
+        response = None
+        with connection.execute_wrapper(count_queries):
+            start = perf_counter()
+            try:
+                response = getattr(client, method)(url, data, format='json')
+                record['status'] = response.status_code
+            except Exception as e:
+                record['status'] = type(e).__name__
+                record['locked'] = 'locked' in str(e)
+            record['latency'] = perf_counter() - start
+        record['queries'] = queries
+        records.append(record)
+        return response
+
+    def session(self, student, test, rnd, options, records) -> bool:
+        '''экзамен одного студента. False, если попытку начать не удалось'''
+        client = APIClient()
+        client.force_authenticate(student)
+
+        response = self.request(client, records, 'test-result-create', 'post', '/api-lms/test-result-create/', { 'test': test.id })
+        if response is None or response.status_code != 201:
+            return False
+        test_result = response.data
+
+        # test_type 'one': отвечать можно только в порядке возрастания id
+        for answer_id in sorted(test_result['test_result_questions_answers']):
+            if options['think_time']:
+                sleep(rnd.uniform(0, options['think_time']))
+            url = f'/api-lms/test-question-answer/{answer_id}/'
+            response = self.request(client, records, 'test-question-answer GET', 'get', url)
+            if response is not None and response.status_code == 200:
+                self.request(client, records, 'test-question-answer PATCH', 'patch', url, { 'answer': self.answer(rnd, response.data) })
+
+        self.request(client, records, 'test-result-complete', 'patch', f'/api-lms/test-result-complete/{test_result["id"]}/')
+        return True
+
+    def run(self, students, test, options) -> tuple:
+        '''сессии студентов в --concurrency потоках. возвращает (записи запросов, длительности сессий, время замера)'''
+        concurrency = max(1, min(options['concurrency'], len(students)))
+        barrier = Barrier(concurrency)
+        records, sessions = [], []
+
+        def worker(i):
+            try:
+                barrier.wait()
+                for j, student in enumerate(students[i::concurrency]):
+                    rnd = random.Random(options['seed'] * 1000003 + i + j * concurrency)
+                    start = perf_counter()
+                    if self.session(student, test, rnd, options, records):
+                        sessions.append(perf_counter() - start)
+            except BrokenBarrierError:
+                pass
+            finally:
+                connection.close()
+
+        threads = [ Thread(target=worker, args=(i,), name=f'exam-bench-{i}') for i in range(concurrency) ]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return records, sessions, perf_counter() - start
+
+    def report(self, name, summary) -> None:
+        self.stdout.write(f'{name}: mean {summary["mean"]:.3f} s, p50 {summary["p50"]:.3f} s, p95 {summary["p95"]:.3f} s, p99 {summary["p99"]:.3f} s, max {summary["max"]:.3f} s')
+
+    def handle(self, *args, **options):
+        if options['students'] < 1 or options['questions'] < 1:
+            raise CommandError('--students и --questions должны быть больше 0')
+
+        # APIClient обращается к серверу 'testserver'. без DEBUG: запросы к БД не копятся в connection.queries,
+        # страница ошибки 500 не выполняет своих запросов
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], DEBUG=False):
+            course, test, students = self.create_fixtures(options)
+            try:
+                self.stdout.write(f'students={len(students)} concurrency={options["concurrency"]} questions={options["questions"]} test_type={options["test_type"]} think_time={options["think_time"]}')
+                records, sessions, elapsed = self.run(students, test, options)
+            finally:
+                course.delete()
+                User.objects.filter(pk__in=[ x.pk for x in students ]).delete()
+
+        by_endpoint, succeeded = defaultdict(list), defaultdict(list)
+        for record in records:
+            by_endpoint[record['endpoint']].append(record)
+            if record['status'] in (200, 201):
+                succeeded[record['endpoint']].append(record['queries'])
+
+        result = {
+            'environment': _bench.environment(),
+            'config': { x: options[x] for x in ('students', 'concurrency', 'questions', 'test_type', 'think_time', 'seed') },
+            'latency': { endpoint: _bench.summarize([ x['latency'] for x in by_endpoint[endpoint] ]) for endpoint in ENDPOINTS if by_endpoint[endpoint] },
+            # только успешные запросы: у прерванных запросов кол-во зависит от места ошибки
+            'queries': { endpoint: { 'mean': sum(queries) / len(queries), 'max': max(queries) } for endpoint, queries in succeeded.items() },
+            'statuses': { endpoint: dict(Counter(str(x['status']) for x in by_endpoint[endpoint])) for endpoint in ENDPOINTS if by_endpoint[endpoint] },
+            'sessions': { **_bench.summarize(sessions), 'failed': len(students) - len(sessions) },
+            'throughput': { 'elapsed': elapsed, 'requests_per_sec': len(records) / elapsed if elapsed else 0 },
+            'lock_errors': sum(1 for x in records if x.get('locked')),
+            'errors': sum(1 for x in records if not isinstance(x['status'], int)),
+        }
+
+        for endpoint, summary in result['latency'].items():
+            self.report(endpoint, summary)
+            queries = result['queries'].get(endpoint, { 'mean': 0, 'max': 0 })
+            self.stdout.write(f'  queries: mean {queries["mean"]:.1f}, max {queries["max"]}; statuses: {json.dumps(result["statuses"][endpoint])}')
+        self.report('session', result['sessions'])
+        self.stdout.write(f'elapsed: {elapsed:.3f} s, requests/sec: {result["throughput"]["requests_per_sec"]:.2f}')
+        self.stdout.write(f'sessions without attempt: {result["sessions"]["failed"]}, exceptions: {result["errors"]}, database locked: {result["lock_errors"]}')
+
+        if options['output']:
+            _bench.save(options['output'], result)
+
+        if options['compare']:
+            baseline = _bench.load(options['compare'])
+            rows = _bench.compare(baseline['latency'], result['latency'], options['threshold'])
+            for section, name, old, new, change, worse in rows:
+                self.stdout.write(f'{section} {name}: {old:.3f} -> {new:.3f} s ({change:+.1f}%){" REGRESSION" if worse else ""}')
+            if any(worse for *_, worse in rows):
+                raise CommandError(f'задержка выросла больше чем на {options["threshold"]}%')
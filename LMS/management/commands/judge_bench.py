@@ -0,0 +1,78 @@
+# замер пропускной способности пула автоматической проверки
+# python manage.py judge_bench --submissions 50 --tests 20 --workers 4
+
+import random
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from LMS.checkers import output_checker
+from LMS.judge import JudgePool
+from LMS.models import SAFE_IMPORTS, TaskAnswer
+
+# программы из которых составляется синтетический набор ответов
+SYNTHETIC_CODE = [
+    'print(int(input()) * 2)',
+    'n = int(input())\nprint(sum(range(n)))',
+    'n = int(input())\nprint(sorted(str(x) for x in range(n % 1000))[-1:])',
+    'import math\nprint(math.factorial(int(input()) % 300))',
+    'n = int(input())\nprint(n if n % 2 == 0 else n + 1)',
+]
+
+
+class Command(BaseCommand):
+    help = 'замер пропускной способности автоматической проверки (ответов в секунду) на синтетических ответах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=20, help='кол-во ответов')
+        parser.add_argument('--tests', type=int, default=10, help='кол-во тестов у задания')
+        parser.add_argument('--workers', type=int, default=None, help='сколько программ выполняется одновременно')
+        parser.add_argument('--cpus', type=int, nargs='+', default=None, help='CPU за которыми закрепляются программы')
+        parser.add_argument('--max-submissions', type=int, default=None, help='сколько ответов выполняется одновременно')
+        parser.add_argument('--forkserver', action='store_true', help='запуск через fork server (см. LMS/forkserver.py)')
+        parser.add_argument('--fail-fast', action='store_true', help='прекращать проверку ответа на первом непройденном тесте')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+
+        # ответы не сохраняются в БД
+        task_answers = [ TaskAnswer(language='1', code=rnd.choice(SYNTHETIC_CODE)) for _ in range(options['submissions']) ]
+        inputs = [ f'{rnd.randint(1, 100000)}\n' for _ in range(options['tests']) ]
+        # ожидаемый вывод совпадает только с выводом первой программы, остальные ответы неверные
+        accepted = output_checker([ { 'output': f'{int(x) * 2}\n', 'checker': '0', 'tolerance': 0 } for x in inputs ]) if options['fail_fast'] else None
+
+        pool = JudgePool(
+            workers=options['workers'],
+            cpus=options['cpus'],
+            max_submissions=options['max_submissions'],
+            preload=SAFE_IMPORTS if options['forkserver'] else None,
+            user=settings.JUDGE_SANDBOX_USER,
+        )
+        self.stdout.write(f'workers={pool.workers} cpus={pool.cpus} max_submissions={pool.max_submissions}')
+        self.stdout.write(f'submissions={len(task_answers)} tests={len(inputs)} fail_fast={options["fail_fast"]} forkserver={options["forkserver"]}')
+
+        with TemporaryDirectory() as dir:
+            code_paths = []
+            for i, task_answer in enumerate(task_answers):
+                code_paths.append(path.join(dir, f'{i}.py'))
+                with open(code_paths[-1], 'wt') as fout:
+                    fout.write(task_answer.code)
+
+            start = perf_counter()
+            futures = [ pool.submit(code_path, inputs, accepted=accepted) for code_path in code_paths ]
+            results = [ future.result() for future in futures ]
+            elapsed = perf_counter() - start
+
+        pool.shutdown()
+
+        failed = sum(1 for test_results in results for result in test_results if result is not None and result['execution_result'] is not None)
+        skipped = sum(1 for test_results in results for result in test_results if result is None)
+        self.stdout.write(f'elapsed: {elapsed:.3f} s')
+        self.stdout.write(f'submissions/sec: {len(task_answers) / elapsed:.2f}')
+        self.stdout.write(f'tests/sec: {(len(task_answers) * len(inputs) - skipped) / elapsed:.2f}')
+        self.stdout.write(f'skipped tests: {skipped}')
+        self.stdout.write(f'time limit / memory limit / execution error: {failed}')
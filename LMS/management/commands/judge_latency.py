@@ -0,0 +1,61 @@
+# сравнение времени запуска одного теста: новый интерпретатор на каждый тест и fork server
+# python manage.py judge_latency --tests 100
+
+import random
+import statistics
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from LMS.forkserver import ForkServer
+from LMS.judge import run_code
+from LMS.models import SAFE_IMPORTS
+from .judge_bench import SYNTHETIC_CODE
+
+
+class Command(BaseCommand):
+    help = 'задержка запуска одного теста (мс): новый интерпретатор на каждый тест и fork server с заранее импортированными модулями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tests', type=int, default=50, help='кол-во запусков для каждого способа')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def measure(self, run, code_paths, inputs) -> list:
+        '''время каждого запуска от вызова до получения результата, мс'''
+        latencies = []
+        for code_path, input in zip(code_paths, inputs):
+            start = perf_counter()
+            run(code_path, input)
+            latencies.append((perf_counter() - start) * 1000)
+        return latencies
+
+    def report(self, name, latencies) -> None:
+        p95 = statistics.quantiles(latencies, n=20)[-1]
+        self.stdout.write(f'{name}: mean {statistics.mean(latencies):.2f} ms, p50 {statistics.median(latencies):.2f} ms, p95 {p95:.2f} ms')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+
+        with TemporaryDirectory() as dir:
+            code_paths = []
+            for i, code in enumerate(SYNTHETIC_CODE):
+                code_paths.append(path.join(dir, f'{i}.py'))
+                with open(code_paths[-1], 'wt') as fout:
+                    fout.write(code)
+
+            code_paths = [ rnd.choice(code_paths) for _ in range(options['tests']) ]
+            inputs = [ f'{rnd.randint(1, 100000)}\n' for _ in range(options['tests']) ]
+
+            cold = self.measure(run_code, code_paths, inputs)
+
+            forkserver = ForkServer(SAFE_IMPORTS)
+            forkserver.run_code(code_paths[0], inputs[0]) # запуск сервера не входит в замер
+            warm = self.measure(forkserver.run_code, code_paths, inputs)
+            forkserver.close()
+
+        self.stdout.write(f'tests={options["tests"]}')
+        self.report('cold spawn', cold)
+        self.report('fork server', warm)
+        self.stdout.write(f'speedup (mean): {statistics.mean(cold) / statistics.mean(warm):.1f}x')
@@ -0,0 +1,302 @@
+# сквозной замер автоматической проверки на синтетических заданиях и ответах:
+# загрузка ответа через API -> очередь (JudgeJob) или каталог spool -> выполнение тестов -> результаты в БД
+# python manage.py pipeline_bench --submissions 100 --tasks 4 --tests 5 --workers 4 --output before.json
+# python manage.py pipeline_bench --submissions 100 --tasks 4 --tests 5 --workers 4 --output after.json --compare before.json
+# python manage.py pipeline_bench --mode spool --rate 20
+#
+# режим 'queue': рабочими процессами celery служат потоки этой команды (execute_task_answer.delay подменяется)
+# режим 'spool': запускается execute_code.py с временными каталогами, результаты заносит check_files
+# задания, студенты и ответы создаются в БД и удаляются после замера
+
+import json
+import math
+import random
+import subprocess
+import sys
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from os import listdir, mkdir, path
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter, sleep
+from unittest import mock
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from LMS import celery_tasks
+from LMS.models import SAFE_IMPORTS, Course, CourseElement, Task, TaskAnswer, TaskTest, TaskTestExecution
+from . import _bench
+
+# виды синтетических ответов: программа читает число n, верный вывод - 2n
+SYNTHETIC_KINDS = {
+    'fast': 'n = int(input())\nprint(n * 2)',
+    'slow': 'n = int(input())\ns = 0\nfor i in range(2000000):\n    s += i % 7\nprint(n * 2)',
+    'wrong': 'n = int(input())\nprint(n * 3)',
+    'infinite': 'n = 0\nwhile True:\n    n += 1',
+    'memory': 'a = [0] * (256 * 1024 * 1024)\nprint(len(a))',
+    'crash': 'n = int(input())\nprint(n // 0)',
+}
+DEFAULT_MIX = 'fast=50,slow=20,wrong=10,infinite=5,memory=5,crash=10'
+
+LIMIT_TIME = timedelta(seconds=1)
+LIMIT_MEMORY_MBYTE = 256
+# как часто проверяется появление результатов, сек
+POLL_INTERVAL = 0.02
+
+
+class Command(BaseCommand):
+    help = 'сквозной замер автоматической проверки: задержка от загрузки ответа до результата (p50/p95/p99), пропускная способность, время этапов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['queue', 'spool'], default=None, help='режим проверки (по умолчанию settings.JUDGE_MODE)')
+        parser.add_argument('--submissions', type=int, default=50, help='кол-во ответов')
+        parser.add_argument('--tasks', type=int, default=4, help='кол-во заданий, каждый студент отвечает на все задания')
+        parser.add_argument('--tests', type=int, default=5, help='кол-во тестов у задания')
+        parser.add_argument('--workers', type=int, default=4, help='сколько ответов проверяется одновременно (JUDGE_MAX_IN_FLIGHT или execute_code.py --max-submissions)')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'доли видов ответов ({", ".join(SYNTHETIC_KINDS)})')
+        parser.add_argument('--rate', type=float, default=0, help='ответов в секунду, 0 - все сразу')
+        parser.add_argument('--duplicates', action='store_true', help='одинаковый код у ответов одного вида (результаты берутся из кэша)')
+        parser.add_argument('--forkserver', action='store_true', help='запуск через fork server (см. LMS/forkserver.py)')
+        parser.add_argument('--ingest-interval', type=float, default=1, help='период check_files в режиме spool, сек (по расписанию celery beat)')
+        parser.add_argument('--timeout', type=float, default=600, help='сколько секунд ждать результатов')
+        parser.add_argument('--output', default=None, help='файл для результатов (json)')
+        parser.add_argument('--compare', default=None, help='файл с результатами прошлого запуска (json)')
+        parser.add_argument('--threshold', type=float, default=10, help='ухудшение в %%, при котором команда завершается ошибкой (с --compare)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def parse_mix(self, mix) -> dict:
+        kinds = {}
+        for item in mix.split(','):
+            kind, _, share = item.partition('=')
+            if kind not in SYNTHETIC_KINDS or not share.isdigit():
+                raise CommandError(f'--mix: {item}')
+            kinds[kind] = int(share)
+        if not sum(kinds.values()):
+            raise CommandError('--mix: все доли нулевые')
+        return kinds
+
+    def create_fixtures(self, options, kinds) -> tuple:
+        '''курс с заданиями и тестами, студенты и их ответы (ещё не загруженные) [ { 'task', 'student', 'kind', 'code' } ]'''
+        prefix = f'pipeline_bench_{uuid4().hex[:8]}'
+        deadline = timezone.now() + timedelta(days=1)
+
+        with transaction.atomic():
+            course = Course.objects.create(title=prefix)
+            course_element = CourseElement.objects.create(course=course, title=prefix)
+            tasks = []
+            for i in range(options['tasks']):
+                tasks.append(Task.objects.create(
+                    course_element=course_element,
+                    title=f'{prefix} {i}',
+                    execute_answer=True,
+                    deadline_visible=deadline,
+                    deadline_true=deadline,
+                    mark_outer=Decimal(10),
+                    mark_max=Decimal(10),
+                    limit_time=LIMIT_TIME,
+                    limit_memory_Mbyte=LIMIT_MEMORY_MBYTE,
+                ))
+                TaskTest.objects.bulk_create([ TaskTest(task=tasks[-1], input=f'{j}\n', output=f'{j * 2}\n', hidden=False) for j in range(options['tests']) ])
+
+            students = [ User.objects.create(username=f'{prefix}_{i}') for i in range(math.ceil(options['submissions'] / len(tasks))) ]
+            course.students.add(*students)
+
+        submissions = []
+        for i, kind in enumerate(kinds):
+            code = SYNTHETIC_KINDS[kind]
+            if not options['duplicates']:
+                code += f'\n# {i}' # иначе результаты возьмутся из кэша (см. result_cache.py)
+            submissions.append({ 'task': tasks[i % len(tasks)], 'student': students[i // len(tasks)], 'kind': kind, 'code': code })
+
+        return course, students, submissions
+
+    def upload(self, submissions, rate, records) -> None:
+        '''загружает ответы через API с заданной частотой, records[i] - время загрузки и id ответа'''
+        client = APIClient()
+        start = perf_counter()
+        try:
+            for i, submission in enumerate(submissions):
+                if rate:
+                    sleep(max(0, start + i / rate - perf_counter()))
+                client.force_authenticate(submission['student'])
+                submitted = perf_counter()
+                response = client.post(f'/api-lms/task-upload-code/{submission["task"].id}/', { 'code': submission['code'], 'language': '1' }, format='json')
+                records[i].update(submitted=submitted, uploaded=perf_counter(), status=response.status_code)
+                if response.status_code == 200:
+                    records[i]['id'] = response.data['id']
+        finally:
+            connection.close()
+
+    def run_queue(self, options, submissions, records) -> None:
+        started, finished = {}, {}
+        executor = ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='pipeline-bench-worker')
+
+        def work(task_answer_id, rejudge=False):
+            started[task_answer_id] = perf_counter()
+            try:
+                celery_tasks.execute_task_answer(task_answer_id, rejudge)
+            except Exception as e:
+                self.stderr.write(f'TaskAnswer {task_answer_id}: {e}')
+            finally:
+                finished[task_answer_id] = perf_counter()
+                connection.close()
+
+        with override_settings(JUDGE_MODE='queue', JUDGE_MAX_IN_FLIGHT=options['workers']), \
+             mock.patch.object(celery_tasks.execute_task_answer, 'delay', side_effect=lambda *args, **kwargs: executor.submit(work, *args, **kwargs)):
+            uploader = Thread(target=self.upload, args=(submissions, options['rate'], records))
+            uploader.start()
+
+            deadline, cached = perf_counter() + options['timeout'], None
+            while perf_counter() < deadline and (uploader.is_alive() or cached is None or any('id' in x and x['id'] not in finished and x['id'] not in cached for x in records)):
+                if cached is None and not uploader.is_alive():
+                    # ответы из кэша проверены при загрузке и рабочим процессам не передавались
+                    waiting = [ x['id'] for x in records if 'id' in x and x['id'] not in started ]
+                    cached = set(TaskAnswer.objects.filter(pk__in=waiting, is_running=False).values_list('id', flat=True)) - started.keys()
+                    continue
+                sleep(POLL_INTERVAL)
+            uploader.join()
+            executor.shutdown(cancel_futures=True)
+
+        for record in records:
+            task_answer_id = record.get('id')
+            if task_answer_id in (cached or ()):
+                record['stages'] = { 'upload': record['uploaded'] - record['submitted'] }
+                record['verdict'] = record['uploaded']
+            elif task_answer_id in finished:
+                # рабочий процесс может начать проверку до ответа API на загрузку, поэтому ожидание считается от загрузки
+                record['stages'] = { 'upload': record['uploaded'] - record['submitted'], 'queue': started[task_answer_id] - record['submitted'], 'execute': finished[task_answer_id] - started[task_answer_id] }
+                record['verdict'] = finished[task_answer_id]
+
+    def run_spool(self, options, submissions, records) -> None:
+        with TemporaryDirectory() as dir:
+            spool_dir, result_dir, quarantine_dir = path.join(dir, 'execute'), path.join(dir, 'executed'), path.join(dir, 'quarantine')
+            for x in (spool_dir, result_dir, quarantine_dir):
+                mkdir(x)
+
+            args = [ sys.executable, str(settings.BASE_DIR / 'execute_code.py'), '--spool-dir', spool_dir, '--result-dir', result_dir, '--max-submissions', str(options['workers']) ]
+            if options['forkserver']:
+                args += [ '--preload', *SAFE_IMPORTS ]
+            process = subprocess.Popen(args, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL)
+
+            try:
+                with override_settings(JUDGE_MODE='spool', JUDGE_SPOOL_DIR=spool_dir, JUDGE_SPOOL_RESULT_DIR=result_dir, JUDGE_SPOOL_QUARANTINE_DIR=quarantine_dir):
+                    uploader = Thread(target=self.upload, args=(submissions, options['rate'], records))
+                    uploader.start()
+
+                    executed, verdicts = {}, {}
+                    deadline, ingested = perf_counter() + options['timeout'], 0
+                    while perf_counter() < deadline and (uploader.is_alive() or any('id' in x and x['id'] not in verdicts for x in records)):
+                        for x in listdir(result_dir):
+                            if x.endswith('+') and x[:-1].isdigit():
+                                executed.setdefault(int(x[:-1]), perf_counter())
+                        if ingested + options['ingest_interval'] <= perf_counter():
+                            ingested = perf_counter()
+                            celery_tasks.check_files()
+                            pending = [ x['id'] for x in records if 'id' in x and x['id'] not in verdicts ]
+                            for task_answer_id in TaskAnswer.objects.filter(pk__in=pending, is_running=False).values_list('id', flat=True):
+                                verdicts[task_answer_id] = perf_counter()
+                        sleep(POLL_INTERVAL)
+                    uploader.join()
+            finally:
+                process.terminate()
+                process.wait()
+
+        for record in records:
+            task_answer_id = record.get('id')
+            if task_answer_id in verdicts:
+                if task_answer_id in executed:
+                    record['stages'] = { 'upload': record['uploaded'] - record['submitted'], 'execute': executed[task_answer_id] - record['uploaded'], 'ingest': verdicts[task_answer_id] - executed[task_answer_id] }
+                record['verdict'] = verdicts[task_answer_id]
+
+    def get_verdicts(self, records) -> dict:
+        '''{ id ответа: первый непройденный тест или accepted }'''
+        names = dict(TaskTestExecution.EXECUTION_RESULT)
+        executions = defaultdict(list)
+        for task_answer_id, execution_result in TaskTestExecution.objects.filter(task_answer_id__in=[ x['id'] for x in records if 'id' in x ]).order_by('task_test_id').values_list('task_answer_id', 'execution_result'):
+            executions[task_answer_id].append(execution_result)
+        return { task_answer_id: names[next((x for x in results if x != '0'), '0')] for task_answer_id, results in executions.items() }
+
+    def report(self, name, summary) -> None:
+        self.stdout.write(f'{name}: mean {summary["mean"]:.3f} s, p50 {summary["p50"]:.3f} s, p95 {summary["p95"]:.3f} s, p99 {summary["p99"]:.3f} s, max {summary["max"]:.3f} s')
+
+    def handle(self, *args, **options):
+        mode = options['mode'] or settings.JUDGE_MODE
+        rnd = random.Random(options['seed'])
+        mix = self.parse_mix(options['mix'])
+        kinds = rnd.choices(list(mix), weights=list(mix.values()), k=options['submissions'])
+        records = [ { 'kind': kind } for kind in kinds ]
+
+        # APIClient обращается к серверу 'testserver', события хода проверки не нужны за пределами процесса
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], JUDGE_PROGRESS_BACKEND='local'):
+            course, students, submissions = self.create_fixtures(options, kinds)
+            try:
+                self.stdout.write(f'mode={mode} submissions={len(submissions)} tasks={options["tasks"]} tests={options["tests"]} workers={options["workers"]} rate={options["rate"] or "burst"}')
+                if mode == 'spool':
+                    self.run_spool(options, submissions, records)
+                else:
+                    self.run_queue(options, submissions, records)
+                verdicts = self.get_verdicts(records)
+            finally:
+                course.delete()
+                User.objects.filter(pk__in=[ x.pk for x in students ]).delete()
+
+        done = [ x for x in records if 'verdict' in x ]
+        rejected = sum(1 for x in records if x.get('status') not in (None, 200))
+        elapsed = max((x['verdict'] for x in done), default=0) - min((x['submitted'] for x in records if 'submitted' in x), default=0)
+
+        stages = defaultdict(list)
+        latency_by_kind = defaultdict(list)
+        verdicts_by_kind = defaultdict(Counter)
+        for record in done:
+            for stage, duration in record.get('stages', {}).items():
+                stages[stage].append(duration)
+            latency_by_kind[record['kind']].append(record['verdict'] - record['submitted'])
+            verdicts_by_kind[record['kind']][verdicts.get(record['id'], 'no results')] += 1
+
+        result = {
+            'environment': _bench.environment(),
+            'config': { 'mode': mode, **{ x: options[x] for x in ('submissions', 'tasks', 'tests', 'workers', 'mix', 'rate', 'duplicates', 'forkserver', 'ingest_interval', 'seed') } },
+            'latency': _bench.summarize([ x['verdict'] - x['submitted'] for x in done ]),
+            'stages': { stage: _bench.summarize(durations) for stage, durations in stages.items() },
+            'latency_by_kind': { kind: _bench.summarize(durations) for kind, durations in latency_by_kind.items() },
+            'throughput': {
+                'elapsed': elapsed,
+                'submissions_per_sec': len(done) / elapsed if elapsed else 0,
+                'tests_per_sec': len(done) * options['tests'] / elapsed if elapsed else 0,
+            },
+            'verdicts': { kind: dict(counter) for kind, counter in verdicts_by_kind.items() },
+            'rejected': rejected,
+            'lost': len(records) - len(done) - rejected,
+        }
+
+        self.report('submission to verdict', result['latency'])
+        for stage, summary in result['stages'].items():
+            self.report(f'  {stage}', summary)
+        for kind, summary in sorted(result['latency_by_kind'].items()):
+            self.report(f'  {kind}', summary)
+        self.stdout.write(f'elapsed: {elapsed:.3f} s')
+        self.stdout.write(f'submissions/sec: {result["throughput"]["submissions_per_sec"]:.2f}')
+        self.stdout.write(f'tests/sec: {result["throughput"]["tests_per_sec"]:.2f}')
+        for kind, counter in sorted(result['verdicts'].items()):
+            self.stdout.write(f'{kind}: {json.dumps(counter)}')
+        self.stdout.write(f'rejected (not 200): {rejected}, without verdict after --timeout: {result["lost"]}')
+
+        if options['output']:
+            _bench.save(options['output'], result)
+
+        if options['compare']:
+            baseline = _bench.load(options['compare'])
+            rows = _bench.compare({ 'latency': baseline['latency'], **baseline['stages'] }, { 'latency': result['latency'], **result['stages'] }, options['threshold'])
+            for section, name, old, new, change, worse in rows:
+                self.stdout.write(f'{section} {name}: {old:.3f} -> {new:.3f} s ({change:+.1f}%){" REGRESSION" if worse else ""}')
+            if any(worse for *_, worse in rows):
+                raise CommandError(f'задержка выросла больше чем на {options["threshold"]}%')
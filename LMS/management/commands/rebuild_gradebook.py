@@ -0,0 +1,18 @@
+# пересчёт журнала оценок (gradebook.py) по всем ответам и попыткам тестов
+# нужен после развёртывания журнала и после изменений данных в обход сигналов (например, через shell)
+# python manage.py rebuild_gradebook [--user ID ...]
+
+from django.core.management.base import BaseCommand
+
+from LMS.gradebook import rebuild
+
+
+class Command(BaseCommand):
+    help = 'пересчитывает журнал оценок по ответам на задания и попыткам тестов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, nargs='+', help='id пользователей (по умолчанию все)')
+
+    def handle(self, *args, **options):
+        count = rebuild(options['user'])
+        self.stdout.write(f'entries={count}')
@@ -0,0 +1,67 @@
+# членство пользователя в курсах (Course.owners, Course.students, Course.excluded) для проверок прав
+# - множества id курсов пользователя загружаются одним запросом и запоминаются на объекте пользователя.
+#   request.user создаётся заново для каждого запроса, поэтому запомненные множества живут не дольше запроса,
+#   а повторные проверки прав в запросе (view, permissions, методы моделей) выполняются без запросов к БД
+# - изменение связей (m2m_changed, см. signals.py) сбрасывает запомненные множества процесса:
+#   запрос, который записал пользователя на курс, дальше видит новое членство
+#
+# проверки принимают id курса: вызывающий код может не загружать сам курс (obj.course_id, см. course_ids.py)
+
+from django.db.models import CharField, Value
+
+# увеличивается при каждом изменении связей курсов с пользователями
+_generation = 0
+
+
+class Membership:
+    def __init__(self, owner=(), student=(), excluded=()):
+        # id курсов, в которых пользователь - преподаватель, записанный студент, исключённый
+        self.owner = frozenset(owner)
+        self.student = frozenset(student)
+        self.excluded = frozenset(excluded)
+
+    def __repr__(self):
+        return f'Membership(owner={set(self.owner)}, student={set(self.student)}, excluded={set(self.excluded)})'
+
+EMPTY = Membership()
+
+
+def invalidate() -> None:
+    '''связи курсов с пользователями изменились'''
+    global _generation
+    _generation += 1
+
+def _load(user) -> Membership:
+    from .models import Course
+
+    def course_ids(field, kind):
+        through = getattr(Course, field).through
+        return through.objects.filter(user_id=user.pk).annotate(kind=Value(kind, output_field=CharField())).values_list('course_id', 'kind')
+
+    sets = { 'owner': [], 'student': [], 'excluded': [] }
+    for course_id, kind in course_ids('owners', 'owner').union(course_ids('students', 'student'), course_ids('excluded', 'excluded'), all=True):
+        sets[kind].append(course_id)
+    return Membership(**sets)
+
+def get_membership(user) -> Membership:
+    '''членство пользователя в курсах. один запрос на объект пользователя, пока связи не изменились'''
+    if user is None or not user.is_authenticated:
+        return EMPTY
+
+    cached = getattr(user, '_course_membership', None)
+    if cached is not None and cached[0] == _generation:
+        return cached[1]
+
+    generation = _generation
+    membership = _load(user)
+    user._course_membership = (generation, membership)
+    return membership
+
+def is_owner(user, course_id) -> bool:
+    return course_id in get_membership(user).owner
+
+def is_student(user, course_id) -> bool:
+    return course_id in get_membership(user).student
+
+def is_excluded(user, course_id) -> bool:
+    return course_id in get_membership(user).excluded
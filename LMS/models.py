@@ -1,24 +1,31 @@
-from decimal import Decimal
+from decimal import Decimal, ROUND_DOWN
 from datetime import timedelta
 import logging
-import random
 import re
 
+from django.conf import settings
 from django.contrib.auth.models import User, Group
 from django.core.exceptions import ValidationError
 from django.core.validators import MinLengthValidator, MinValueValidator, MaxValueValidator, RegexValidator
 from django.utils import timezone
 from django.db import models
-from django.db.models import Sum
+from django.db.models import BooleanField, Case, DateTimeField, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Least
 
+from . import membership
+from .code_validator import CodeValidator
+from .languages import DEFAULT_LANGUAGE, LANGUAGES
 from .validators import validate_datetime_future
 
 logger = logging.getLogger(__name__)
 
 
-PROGRAMMING_LANGUAGE = [
-    ('1', 'python 3.9.5'),
-]
+# языки описаны в languages.py
+PROGRAMMING_LANGUAGE = [ (language.code, language.name) for language in LANGUAGES.values() ]
+
+def enabled_languages() -> list:
+    '''коды языков, включённых на сервере (settings.JUDGE_LANGUAGES). языки Language.sandbox - только с settings.JUDGE_SANDBOX_USER'''
+    return [ code for code in settings.JUDGE_LANGUAGES if code in LANGUAGES and (settings.JUDGE_SANDBOX_USER or not LANGUAGES[code].sandbox) ]
 
 # python 3.9.5
 SAFE_IMPORTS = [
@@ -50,8 +57,28 @@ NOT_ALLOW_BUILT_IN_FUNCTIONS = [
     'open',
     'vars',
     '__import__',
+    '__builtins__',
+]
+
+# служебные атрибуты, через которые можно добраться до встроенных функций и модулей
+NOT_ALLOW_ATTRIBUTES = [
+    '__base__',
+    '__bases__',
+    '__builtins__',
+    '__closure__',
+    '__code__',
+    '__dict__',
+    '__getattribute__',
+    '__globals__',
+    '__loader__',
+    '__mro__',
+    '__self__',
+    '__spec__',
+    '__subclasses__',
 ]
 
+CODE_VALIDATOR = CodeValidator(SAFE_IMPORTS, NOT_ALLOW_BUILT_IN_FUNCTIONS, NOT_ALLOW_ATTRIBUTES)
+
 # deprecate: can_edit, is_subscriber
 # после отписки от курса весь контент пользователя остаётся
 class Course(models.Model):
@@ -69,6 +96,8 @@ class Course(models.Model):
     # группы и секретный код выбирает преподаватель. создаёт группы и добавляет в них админ
     groups = models.ManyToManyField(Group, related_name='course_groups', verbose_name='группы которые могут записаться на курс', blank=True)
     key = models.CharField('код для записи на курс', help_text='length 5..20', max_length=20, validators=[RegexValidator(r'^.{5,20}$')], null=True, blank=True)
+    # доля мест в очереди автоматической проверки относительно других курсов (см. scheduler.py)
+    judge_weight = models.PositiveSmallIntegerField('вес курса в очереди проверки', help_text='1..100', default=1, validators=[MinValueValidator(1), MaxValueValidator(100)])
 
     class Meta:
         verbose_name = 'курс'
@@ -86,12 +115,12 @@ class Course(models.Model):
         return self.title
 
     def can_edit(self, user) -> bool:
-        '''проверка прав на редактирование курса'''
-        return self.owners.filter(pk=user.pk).exists()
+        '''проверка прав на редактирование курса (см. membership.py)'''
+        return membership.is_owner(user, self.pk)
 
     def is_subscriber(self, user) -> bool:
-        '''проверка того что пользователь записан на курс'''
-        return user.is_authenticated and self.students.filter(pk=user.pk).exists()
+        '''проверка того что пользователь записан на курс (см. membership.py)'''
+        return membership.is_student(user, self.pk)
 
 class CourseElement(models.Model):
     '''модель для элемента учебного курса'''
@@ -134,6 +163,7 @@ class Task(models.Model):
     - если тестов нет, то автоматическая проверка не запускается
     '''
     course_element = models.ForeignKey(CourseElement, on_delete=models.CASCADE, verbose_name='элемент курса', related_name='tasks')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='курс', related_name='+', null=True, editable=False, help_text='заполняется автоматически по элементу курса (см. course_ids.py)')
     title = models.CharField('заголовок', help_text='max length 100', max_length=100, validators=[RegexValidator(r'^.{1,100}$')])
     description = models.TextField('описание задачи', help_text='max length 1000', max_length=1000, blank=True)
     execute_answer = models.BooleanField('включена автоматическая проверка', default=False)
@@ -164,6 +194,17 @@ class Task(models.Model):
     #STACK_Kbyte = models.CharField('размер стека в КБ', max_length=5, choices=STACK_SIZE, default='8192')
     limit_time = models.DurationField('ограничение времени выполнения', help_text='format HH:MM:SS.uuuuuu \ 1sec <= value <= 10sec', validators=[MinValueValidator(timedelta(seconds=1)), MaxValueValidator(timedelta(seconds=10))], default=timedelta(seconds=1))
     limit_memory_Mbyte = models.PositiveSmallIntegerField('ограничение памяти в МБ', help_text='integer from 1 to 1024', validators=[MinValueValidator(1), MaxValueValidator(1024)], default=256)
+    fail_fast = models.BooleanField('прекращать проверку на первом непройденном тесте', help_text='остальные тесты отмечаются как пропущенные', default=False)
+    languages = models.CharField('языки программирования', max_length=20, blank=True, default='', help_text='кроме python, коды через пробел: 2 - C. язык должен быть включён на сервере (settings.JUDGE_LANGUAGES)')
+
+    GRADING_POLICY = [
+        ('0', 'manual'),
+        ('1', 'all or nothing'),
+        ('2', 'proportional'),
+        ('3', 'weighted'),
+    ]
+    grading_policy = models.CharField('автоматическое оценивание', max_length=1, choices=GRADING_POLICY, default='0', help_text='all or nothing - mark_max если пройдены все тесты, proportional - доля пройденных тестов, weighted - доля веса пройденных тестов')
+    tests_version = models.PositiveIntegerField('версия набора тестов', help_text='увеличивается при изменении тестов задания', default=0, editable=False)
 
     class Meta:
         verbose_name = 'задание'
@@ -201,6 +242,10 @@ class Task(models.Model):
         """model validation"""
         super(Task, self).clean() # проверки полей
 
+        unknown = [ code for code in self.languages.split() if code not in LANGUAGES ]
+        if unknown:
+            raise ValidationError({'languages': 'неизвестные языки: ' + ' '.join(unknown)})
+
         if self.execute_answer: # None?
             pass
         else:
@@ -209,9 +254,14 @@ class Task(models.Model):
         if self.deadline_visible and self.deadline_true and self.deadline_true < self.deadline_visible:
             raise ValidationError({'deadline_true':'deadline_true < deadline_visible'})
 
+    def get_languages(self) -> list:
+        '''коды языков, на которых можно ответить: python и Task.languages, включённые на сервере (enabled_languages)'''
+        codes = { DEFAULT_LANGUAGE, *self.languages.split() }
+        return [ code for code in enabled_languages() if code in codes ]
+
     def can_edit_task(self, user) -> bool:
         '''проверка прав на редактирование задачи курса +'''
-        return self.course_element.course.can_edit(user)
+        return membership.is_owner(user, self.course_id)
 
     def can_set_task_answer(self, user) -> bool:
         '''пользователь может загрузить на сервер ответ на задание +'''
@@ -219,12 +269,29 @@ class Task(models.Model):
             return False
 
         taskAnswer = TaskAnswer.objects.filter(task=self, student=user).first()
-        # в автоматической проверке если выполняется или есть оценка то нельзя
+        # в автоматической проверке если выполняется или есть оценка преподавателя то нельзя
         if taskAnswer and taskAnswer.task.execute_answer:
-            return not taskAnswer.is_running and taskAnswer.get_TaskAnswerMark() is None
+            return not taskAnswer.is_running and not taskAnswer.is_marked_by_teacher()
         else:
             return True if taskAnswer is None or taskAnswer.get_TaskAnswerMark() is None else False
 
+    def get_auto_mark(self, task_test_executions):
+        '''оценка в грязных баллах по результатам запуска на тестах согласно grading_policy. None при ручном оценивании или без тестов'''
+        if self.grading_policy == '0' or len(task_test_executions) == 0:
+            return None
+
+        passed = [ x.execution_result == '0' for x in task_test_executions ]
+        if self.grading_policy == '1':
+            share = Decimal(all(passed))
+        elif self.grading_policy == '2':
+            share = Decimal(sum(passed)) / len(passed)
+        else:
+            weight = sum(x.task_test.weight for x in task_test_executions)
+            weight_passed = sum(x.task_test.weight for x in task_test_executions if x.execution_result == '0')
+            share = Decimal(weight_passed) / weight if weight else Decimal(0)
+
+        return (self.mark_max * share).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+
     def get_answer(self, user):
         '''возвращает ответ на задание или None если ответа нет. В TaskAnswer (task, user) = unique +'''
         return TaskAnswer.objects.filter(task=self, student=user).first()
@@ -247,6 +314,18 @@ class TaskTest(models.Model):
     input = models.TextField('входные данные программы', help_text='max length 1000', max_length=1000) # может быть пустым
     output= models.TextField('ожидаемый вывод программы', help_text='max length 1000', max_length=1000) # не может быть пустым
     hidden = models.BooleanField('скрытый тест (пользователям отображается не будет)')#, default=True)
+    weight = models.PositiveSmallIntegerField('вес теста', help_text='integer from 0 to 100, используется при Task.grading_policy = weighted', default=1, validators=[MaxValueValidator(100)])
+
+    # способы сравнения вывода программы с ожидаемым (см. checkers.py)
+    CHECKER = [
+        ('0', 'exact'),
+        ('1', 'normalized'),
+        ('2', 'tokens'),
+        ('3', 'float'),
+        ('4', 'unordered lines'),
+    ]
+    checker = models.CharField('сравнение вывода', max_length=1, choices=CHECKER, default='1', help_text='normalized - без учёта окончаний строк и пробелов в конце строк, tokens - по словам, float - числа с погрешностью, unordered lines - строки в любом порядке')
+    tolerance = models.FloatField('погрешность для float', help_text='абсолютная для |x| <= 1, иначе относительная', default=1e-6, validators=[MinValueValidator(0)])
 
     class Meta:
         verbose_name = 'тест для задания с автоматической проверкой'
@@ -255,6 +334,10 @@ class TaskTest(models.Model):
     def __str__(self):
         return self.task.__str__() + ' | ' + self.id.__str__()
 
+    def get_checker(self) -> dict:
+        '''ожидаемый вывод и способ сравнения для checkers.output_checker'''
+        return { 'output': self.output, 'checker': self.checker, 'tolerance': self.tolerance }
+
     def clean(self):
         """model validation"""
         super(TaskTest, self).clean() # проверки полей
@@ -274,6 +357,7 @@ class TaskTestExecution(models.Model):
     task_answer = models.ForeignKey('TaskAnswer', on_delete=models.CASCADE, verbose_name='ответ на задание', related_name='task_answer_executions') # editable=False
 
     stdout = models.TextField('стандартный поток вывода', help_text='max length 1000', max_length=1000)
+    stdout_truncated = models.BooleanField('вывод сохранён не полностью', help_text='программа вывела больше 1000 символов', default=False)
     stderr = models.TextField('поток вывода ошибок', help_text='max length 100', max_length=100)
     returncode = models.IntegerField()
 
@@ -286,11 +370,15 @@ class TaskTestExecution(models.Model):
         ('5', 'execution_error'),
         ('6', 'running'),
         ('7', 'other'),
+        ('8', 'skipped'),
+        ('9', 'output limit'),
     ]
 
     execution_result = models.CharField('execution_result', max_length=1, choices=EXECUTION_RESULT, default='6')
     duration = models.DurationField('время работы программы', validators=[MinValueValidator(timedelta())], help_text='format HH:MM:SS.uuuuuu')
-    memory_Kbyte = models.PositiveBigIntegerField('выделено памяти в байтах')
+    cpu_duration = models.DurationField('процессорное время программы', validators=[MinValueValidator(timedelta())], help_text='format HH:MM:SS.uuuuuu', default=timedelta())
+    compile_duration = models.DurationField('время компиляции ответа', validators=[MinValueValidator(timedelta())], help_text='одинаково у всех тестов ответа, 0 для python и скомпилированного ранее кода', default=timedelta())
+    memory_Kbyte = models.PositiveBigIntegerField('выделено памяти в КБ (пиковый RSS)')
 
     class Meta:
         verbose_name = 'выполнение теста для задания с автоматической проверкой'
@@ -306,10 +394,31 @@ class TaskTestExecution(models.Model):
     def __str__(self):
         return self.task_test.__str__() + self.id.__str__()
 
+class TaskAnswerCache(models.Model):
+    '''
+    результаты запуска кода на тестах задания для повторных ответов с тем же кодом (см. result_cache.py)
+    при изменении тестов задания записи удаляются, а Task.tests_version увеличивается
+    '''
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, verbose_name='задание', related_name='task_answer_caches')
+    code_hash = models.CharField('хеш нормализованного кода и ограничений задания', max_length=64)
+    tests_version = models.PositiveIntegerField('версия набора тестов')
+    executions = models.JSONField('результаты в порядке тестов', help_text='поля TaskTestExecution')
+    datetime_create = models.DateTimeField('дата и время создания', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'кэш результатов проверки'
+        verbose_name_plural = 'кэш результатов проверки'
+
+        unique_together = ('task', 'code_hash', 'tests_version')
+
+    def __str__(self):
+        return self.task.__str__() + ' | ' + self.code_hash
+
 class TaskAnswer(models.Model):
     '''ответ на задание'''
     task = models.ForeignKey(Task, on_delete=models.CASCADE, verbose_name='задание', related_name='task_answers')
     student = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='студент')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='курс', related_name='+', null=True, editable=False, help_text='заполняется автоматически по заданию (см. course_ids.py)')
     datetime_load = models.DateTimeField('дата и время ответа', help_text='время выставляется автоматически во время создания/изменения объекта', auto_now=True)
     #deleted = models.BooleanField('удалено', help_text='запись удалится по расписанию', default=False, editable=False)
 
@@ -335,7 +444,7 @@ class TaskAnswer(models.Model):
         super(TaskAnswer, self).clean() # проверки полей модели
         validation_errors = dict()
 
-        if not self.task.course_element.course.is_subscriber(self.student):
+        if not membership.is_student(self.student, self.task.course_id):
             validation_errors['student'] = ValidationError('задание только для записанных на курс')
 
         #if self.datetime_load and self.task.deadline_true < self.datetime_load:
@@ -350,20 +459,13 @@ class TaskAnswer(models.Model):
         # задание с автоматической проверкой
         if self.task.execute_answer:
             code_errors = []
-            if self.code == '':
+            if (self.language or DEFAULT_LANGUAGE) not in self.task.get_languages():
+                validation_errors['language'] = ValidationError('язык недоступен в этом задании')
+            elif self.code == '':
                 code_errors.append(ValidationError('Обязательное поле.'))
-            else:
-                # проверка импортов модулей
-                import_lines = re.findall(r'\Wfrom|import.*$', self.code)
-
-                for line in import_lines:
-                    if not all( x in SAFE_IMPORTS+['from', 'import', 'as'] for x in re.split(r'\W+', line)):
-                        code_errors.append(ValidationError('import now allowed'))
-
-                # проверка Built-in Functions
-                for s in NOT_ALLOW_BUILT_IN_FUNCTIONS:
-                    if re.search(r'^_pref_\(|[^a-z0-9]_pref_\('.replace('_pref_', s), self.code):
-                        code_errors.append(ValidationError('this built-in function not allowed'))
+            elif LANGUAGES.get(self.language or DEFAULT_LANGUAGE, LANGUAGES[DEFAULT_LANGUAGE]).validate_code:
+                # проверка импортов модулей, Built-in Functions и служебных атрибутов (см. code_validator.py)
+                code_errors = [ ValidationError(message) for message in CODE_VALIDATOR.validate(self.code) ]
 
             if 0 < len(code_errors):
                 validation_errors['code'] = code_errors
@@ -398,6 +500,61 @@ class TaskAnswer(models.Model):
         ''''''
         return TaskAnswerMark.objects.filter(task_answer_id=self.id).first()
 
+    def is_marked_by_teacher(self) -> bool:
+        '''автоматическая оценка (teacher=None) не мешает загрузить новый ответ'''
+        return TaskAnswerMark.objects.filter(task_answer_id=self.id, teacher__isnull=False).exists()
+
+class JudgeJob(models.Model):
+    '''
+    ответ на задание в очереди автоматической проверки (settings.JUDGE_MODE = 'queue')
+    задания передаются рабочим процессам в порядке scheduler.fair_order, не больше settings.JUDGE_MAX_IN_FLIGHT одновременно
+    запись удаляется после занесения результатов в БД
+    '''
+    task_answer = models.OneToOneField(TaskAnswer, on_delete=models.CASCADE, verbose_name='ответ на задание', related_name='judge_job')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='курс')
+    student = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='студент')
+    deadline = models.DateTimeField('дедлайн задания', help_text='Task.deadline_true на момент загрузки ответа')
+
+    STATE = [
+        ('0', 'waiting'),
+        ('1', 'running'),
+    ]
+
+    state = models.CharField('состояние', max_length=1, choices=STATE, default='0')
+    datetime_create = models.DateTimeField('дата и время постановки в очередь', auto_now_add=True)
+    datetime_start = models.DateTimeField('дата и время передачи рабочему процессу', null=True, blank=True)
+
+    # аренда: рабочий процесс продлевает её во время проверки, просроченную снимает health.reap_judge_jobs
+    worker = models.CharField('рабочий процесс', help_text='host:pid', max_length=255, blank=True)
+    lease_expires = models.DateTimeField('аренда до', null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField('кол-во попыток проверки', default=0)
+    # повторная проверка после изменения тестов: передаётся после остальных, is_running ответа не меняется
+    rejudge = models.BooleanField('повторная проверка', default=False)
+
+    class Meta:
+        verbose_name = 'ответ в очереди проверки'
+        verbose_name_plural = 'ответы в очереди проверки'
+
+        indexes = [
+            models.Index(fields=['state']),
+        ]
+
+    def __str__(self):
+        return self.task_answer.__str__() + ' | ' + self.state
+
+class JudgeWorker(models.Model):
+    '''рабочий процесс celery, выполняющий автоматическую проверку. запись обновляется каждые settings.JUDGE_HEARTBEAT_INTERVAL секунд'''
+    name = models.CharField('имя', help_text='host:pid', max_length=255, unique=True)
+    datetime_start = models.DateTimeField('дата и время запуска', auto_now_add=True)
+    last_heartbeat = models.DateTimeField('последний сигнал')
+
+    class Meta:
+        verbose_name = 'рабочий процесс проверки'
+        verbose_name_plural = 'рабочие процессы проверки'
+
+    def __str__(self):
+        return self.name
+
 class TaskAnswerMark(models.Model):
     '''оценка за ответ на задание'''
     task_answer = models.OneToOneField(TaskAnswer, on_delete=models.CASCADE, verbose_name='ответ на задание', related_name='task_answer_mark')
@@ -426,7 +583,7 @@ class TaskAnswerMark(models.Model):
         super(TaskAnswerMark, self).clean() # проверки полей модели
         validation_errors = dict()
 
-        if not self.teacher or not self.task_answer.task.course_element.course.can_edit(self.teacher):
+        if not self.teacher or not membership.is_owner(self.teacher, self.task_answer.course_id):
             validation_errors['teacher'] = ValidationError('указанный пользователь не имеет права на выставление оценки')
 
         mark_max = self.task_answer.task.mark_max
@@ -461,6 +618,7 @@ class Test(models.Model):
     - todo: в методе save данного класса создаётся тест и вопросы к тесту
     """
     course_element = models.ForeignKey(CourseElement, on_delete=models.CASCADE, verbose_name='элемент курса', related_name='tests')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='курс', related_name='+', null=True, editable=False, help_text='заполняется автоматически по элементу курса (см. course_ids.py)')
     title = models.CharField('заголовок', help_text='max length 100', max_length=100, validators=[RegexValidator(r'^.{1,100}$')])
 
     # пояснения, замечания и прочее что нужно знать перед прохождением теста
@@ -525,7 +683,7 @@ class Test(models.Model):
 
     def can_edit(self, user) -> bool:
         '''проверка прав на редактирование'''
-        return self.course_element.course.can_edit(user) and timezone.now() < self.start
+        return membership.is_owner(user, self.course_id) and timezone.now() < self.start
 
     def get_test_max_mark(self) -> Decimal:
         '''возвращает максимум грязных баллов за тест. равно сумме грязных баллов по вопросам теста'''
@@ -533,66 +691,63 @@ class Test(models.Model):
 
     def get_user_mark(self, user) -> Decimal:
         '''возвращает наибольшую оценку пользователя за тест. если нет завершённых попыткок и время не закончилось, то None. если нет попыток и время закончилось, то 0'''
+        now = timezone.now()
+        # после окончания теста все попытки завершены
+        marks = [ x.evaluate_mark() for x in TestResult.objects.with_marks(now).filter(test=self, user=user, finished=True) ]
+        if 0 < len(marks):
+            return max(marks)
 
-        # дедлайн теста наступил
-        if self.end < timezone.now():
-            marks = [ x.evaluate_mark() for x in TestResult.objects.filter(test=self, user=user) ]
-            return Decimal(0) if len(marks) == 0 else max(marks)
-
-        # дедлайн теста не наступил. есть завершённые прохождения теста
-        testResults = self.get_finished_test_results(user)
-        if 0 < len(testResults):
-            return max(testResult.evaluate_mark() for testResult in testResults)
-
-        # дедлайн теста не наступил. нет завершённых прохождений теста
-        return None
+        # дедлайн теста наступил - 0, иначе нет завершённых прохождений теста
+        return Decimal(0) if self.end < now else None
 
     def get_finished_test_results(self, user) -> list:
-        '''возвращает завершённые попытки (завершено или вышло время)'''
-        now = timezone.now()
-        res = [ x for x in TestResult.objects.filter(test=self, user=user) if x.end != None or x.start + x.test.duration < now ]
-        return res
+        '''возвращает завершённые попытки (завершено, вышло время попытки или закончился тест)'''
+        return list(TestResult.objects.with_marks().filter(test=self, user=user, finished=True).order_by('id'))
 
     def get_active_test_result(self, user):
         '''возвращает начатое прохождение этого теста или None'''
         if self.end < timezone.now():
             return None
-
-        now = timezone.now()
-        res = [ x for x in TestResult.objects.filter(test=self, user=user) if x.end == None and now < x.start + self.duration ]
-        return res[0] if 0 < len(res) else None
+        return TestResult.objects.with_marks().filter(test=self, user=user, finished=False).order_by('id').first()
     
     def can_start_new_test(self, user) -> bool:
         '''может ли пользователь начать новое прохождение теста. начатые попытки должны закрыться, остаться нетронутые попытки, тест начался и ещё не завершился'''
         now = timezone.now()
-        return self.start < now and now < self.end and 0 < (self.number_of_attempts - len(self.get_finished_test_results(user))) and self.get_active_test_result(user) == None
+        if not (self.start < now and now < self.end):
+            return False
+
+        test_results = list(TestResult.objects.with_marks(now).filter(test=self, user=user))
+        return sum(x.finished for x in test_results) < self.number_of_attempts and all(x.finished for x in test_results)
 
     def start_new_test(self, user):
         '''возвращает новый TestResult или None, если пользователь не может начать попытку'''
-        if self.can_start_new_test(user):
-            test_result = TestResult.objects.create(
-                test_id=self.id,
-                user=user,
-                start=timezone.now(),
-            )
-            # определяем порядок вопросов в прохождении
-            questions = test_result.test.test_questions.all().order_by('id')
-
-            if self.shuffle:
-                questions_order = list(range(self.test_questions.count()))
-                random.shuffle(questions_order)
-
-                questions_initial = list(questions)
-                questions = [questions_initial[i] for i in questions_order]
-
-            # создаём записи под ответы для данного прохождения теста
-            test_question_answers = (TestQuestionAnswer(test_result=test_result, test_question=q) for q in questions)
-            TestQuestionAnswer.objects.bulk_create(test_question_answers)
-
-            return test_result
-        else:
+        from .attempts import AttemptError, start_attempt
+        try:
+            return start_attempt(self, user)
+        except AttemptError:
             return None
 
+class TestResultQuerySet(models.QuerySet):
+    def with_marks(self, now=None):
+        '''
+        попытки с данными для оценки одним запросом, в том числе для многих пользователей и тестов сразу:
+        - effective_end: время завершения попытки (end или что раньше - окончание теста, истечение времени на попытку)
+        - finished: попытка завершена к моменту now (по умолчанию текущее время)
+        - mark_sum: сумма баллов за ответы на вопросы (None если баллов нет), test_max_mark: максимум грязных баллов теста
+        evaluate_mark таких попыток не выполняет запросов
+        '''
+        now = now or timezone.now()
+        mark_sum = TestQuestionAnswer.objects.filter(test_result=OuterRef('pk')).order_by().values('test_result').annotate(x=Sum('mark')).values('x')
+        test_max_mark = TestQuestion.objects.filter(test=OuterRef('test')).order_by().values('test').annotate(x=Sum('max_mark')).values('x')
+
+        return self.select_related('test').annotate(
+            effective_end=Coalesce('end', Least('test__end', ExpressionWrapper(F('start') + F('test__duration'), output_field=DateTimeField()))),
+            mark_sum=Subquery(mark_sum, output_field=DecimalField(max_digits=9, decimal_places=2)),
+            test_max_mark=Subquery(test_max_mark, output_field=DecimalField(max_digits=9, decimal_places=2)),
+        ).annotate(
+            finished=Case(When(effective_end__lte=now, then=Value(True)), default=Value(False), output_field=BooleanField()),
+        )
+
 # deprecate: evaluate_mark, complete, is_finished
 class TestResult(models.Model):
     """
@@ -602,12 +757,17 @@ class TestResult(models.Model):
     """
     test = models.ForeignKey(Test, on_delete=models.CASCADE, verbose_name='тест')
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='тестируемый')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='курс', related_name='+', null=True, editable=False, help_text='заполняется автоматически по тесту (см. course_ids.py)')
 
     # оценку можно выставить вручную. у неё будет приоритет
     mark = models.DecimalField('ручная оценка в чистых баллах', help_text='decimal xxx.xx', max_digits=5, decimal_places=2, validators=[MinValueValidator(0)], null=True, default=None)
     
     start = models.DateTimeField('начало прохождения теста', help_text='время выставляется автоматически во время создания объекта', auto_now_add=True)
     end = models.DateTimeField('окончание прохождения теста', help_text='заполняется если тестируемый нажал завершить во время прохождения теста', null=True, editable=False)
+    # уникальность номера не даёт начать две попытки одновременно (см. attempts.py)
+    attempt = models.PositiveSmallIntegerField('номер попытки', help_text='заполняется автоматически при начале прохождения', null=True, editable=False)
+
+    objects = TestResultQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'результат тестирования'
@@ -615,6 +775,7 @@ class TestResult(models.Model):
 
         constraints = [
             models.CheckConstraint(check=models.Q(mark__gte=Decimal(0)), name='TestResult: mark__gte=0'),
+            models.UniqueConstraint(fields=['test', 'user', 'attempt'], name='TestResult: unique test, user, attempt'),
         ]
 
     def __str__(self):
@@ -659,10 +820,14 @@ class TestResult(models.Model):
 
 
     def evaluate_mark(self) -> Decimal:
-        '''вычисляет оценку в чистых баллах за данное проходение теста. если тест не завершён возвращает None'''
+        '''
+        вычисляет оценку в чистых баллах за данное проходение теста. если тест не завершён возвращает None
+        попытка из TestResult.objects.with_marks() оценивается без запросов, иначе - одним запросом
+        '''
+        values = self if hasattr(self, 'finished') else TestResult.objects.with_marks().get(pk=self.pk)
+
         # тест не завершён
-        now = timezone.now()
-        if self.end == None and now < self.test.end and now < self.start + self.test.duration:
+        if not values.finished:
             return None
 
         # тест оценил преподаватель
@@ -670,8 +835,7 @@ class TestResult(models.Model):
             return self.mark
 
         # автоматическое оценивание
-        mark_sum = TestQuestionAnswer.objects.filter(test_result=self).aggregate(Sum('mark'))['mark__sum']
-        return Decimal(0) if mark_sum is None else self.test.mark_outer * mark_sum / self.test.get_test_max_mark()
+        return Decimal(0) if values.mark_sum is None else values.test.mark_outer * values.mark_sum / values.test_max_mark
 
     def complete(self) -> None:
         '''завершить прохождение теста'''
@@ -693,6 +857,7 @@ class TestQuestion(models.Model):
     - свободный ответ не более 50 символов
     """
     test = models.ForeignKey(Test, on_delete=models.CASCADE, verbose_name='тест', related_name='test_questions')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='курс', related_name='+', null=True, editable=False, help_text='заполняется автоматически по тесту (см. course_ids.py)')
     #order = models.PositiveSmallIntegerField('номер вопроса в тесте', help_text='заполняется автоматически') # editable=False) # from 0 to 32767
     question_text = models.TextField('текст вопроса', help_text='max length 500', max_length=500, validators=[MinLengthValidator(1)])
 
@@ -793,6 +958,7 @@ class TestQuestionAnswer(models.Model):
     '''ответ на вопрос теста'''
     test_result = models.ForeignKey(TestResult, on_delete=models.CASCADE, verbose_name='прохождение теста', related_name='test_result_questions_answers')
     test_question = models.ForeignKey(TestQuestion, on_delete=models.CASCADE, verbose_name='вопрос теста')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='курс', related_name='+', null=True, editable=False, help_text='заполняется автоматически по прохождению теста (см. course_ids.py)')
     datetime = models.DateTimeField('время ответа на вопрос', help_text='время выставляется автоматически во время создания/изменения объекта', null=True)
 
     # free: свободный ответ
@@ -826,57 +992,91 @@ class TestQuestionAnswer(models.Model):
             validation_errors['__all__'] = ValidationError('test finished')
 
         # проверить формат self.answer
-        if self.answer != '' and self.test_question.answer_type != 'free':
-            #1.правильный формат
-            #2.индексы в допустимых пределах
-            #3.нет повторов
-            one_valid, many1_valid, many2_valid  = False, False, False
+        if not self.is_valid_answer():
+            validation_errors['answer'] = ValidationError('incorrect')
+        
+        if 0 < len(validation_errors):
+            raise ValidationError(validation_errors)
 
-            valid_format = re.fullmatch(r'^(\d+ )*\d+$', self.answer)
-            if valid_format:
-                indexes = [ int(x) for x in self.answer.split(' ') ] # regex гарантирует что один пробел между индексами
+    def is_valid_answer(self) -> bool:
+        '''формат self.answer подходит к типу вопроса (test_question должен быть загружен)'''
+        if self.answer == '' or self.test_question.answer_type == 'free':
+            return True
 
-                answers_count = self.test_question.answer_values.count('\n') + 1
-                is_border = all(0 <= x and x < answers_count for x in indexes)
-                is_unique = len(indexes) == len(set(indexes))
+        #1.правильный формат
+        #2.индексы в допустимых пределах
+        #3.нет повторов
+        valid_format = re.fullmatch(r'^(\d+ )*\d+$', self.answer)
+        if not valid_format:
+            return False
+        indexes = [ int(x) for x in self.answer.split(' ') ] # regex гарантирует что один пробел между индексами
 
-                one_valid   = self.test_question.answer_type == 'one'   and len(indexes) == 1 and is_border
-                many1_valid = self.test_question.answer_type == 'many1' and len(indexes) <= answers_count and is_border and is_unique
-                many2_valid = self.test_question.answer_type == 'many2' and len(indexes) <= answers_count and is_border and is_unique
-                #print(valid_format,self.answer_true, '_', answers_count, is_unique, is_border, one_valid, many1_valid, many2_valid)
+        answers_count = self.test_question.answer_values.count('\n') + 1
+        is_border = all(0 <= x and x < answers_count for x in indexes)
+        is_unique = len(indexes) == len(set(indexes))
 
-            if not one_valid and not many1_valid and not many2_valid:
-                validation_errors['answer'] = ValidationError('incorrect')
-        
-        if 0 < len(validation_errors):
-            raise ValidationError(validation_errors)
+        answer_type = self.test_question.answer_type
+        if answer_type == 'one':
+            return len(indexes) == 1 and is_border
+        return answer_type in ('many1', 'many2') and len(indexes) <= answers_count and is_border and is_unique
 
-    # не вызывается во время bulk_create
-    def save(self, *args, **kwargs):
-        if self.answer != '':
-            # вычисляем self.mark. считаем что данные корректные
-            q = self.test_question
-            q_type = q.answer_type
+    def compute_mark(self) -> None:
+        '''вычисляет self.mark по self.answer без запросов, если test_question загружен. считаем что данные корректные'''
+        if self.answer == '':
+            return
+
+        q = self.test_question
+        q_type = q.answer_type
 
-            if q_type == 'free' or q_type == 'one':
-                self.mark = q.max_mark if q.answer_true.strip() == self.answer.strip() else Decimal(0)
+        if q_type == 'free' or q_type == 'one':
+            self.mark = q.max_mark if q.answer_true.strip() == self.answer.strip() else Decimal(0)
+        else:
+            answer_indexes = set(int(x) for x in self.answer.strip().split(' '))
+            true_indexes = set(int(x) for x in q.answer_true.strip().split(' '))
+
+            choise_true = len(answer_indexes & true_indexes) # кол-во правильных вариантов
+            choise_false = len(answer_indexes - true_indexes) # кол-во неправильных вариантов
+
+            if q_type == 'many1':
+                # деление на ноль
+                self.mark = Decimal(max(choise_true-choise_false, 0) / len(true_indexes)) * q.max_mark
+            elif q_type == 'many2':
+                # деление на ноль
+                self.mark = Decimal(choise_true / len(true_indexes)) * q.max_mark if choise_false == 0 else Decimal(0)
             else:
-                answer_indexes = set(int(x) for x in self.answer.strip().split(' '))
-                true_indexes = set(int(x) for x in q.answer_true.strip().split(' '))
+                raise Exception('QUESTION_TYPE')
+
+    # не вызывается во время bulk_create и bulk_update (см. answers.py)
+    def save(self, *args, **kwargs):
+        self.compute_mark()
+        super(TestQuestionAnswer, self).save(*args, **kwargs)
 
-                choise_true = len(answer_indexes & true_indexes) # кол-во правильных вариантов
-                choise_false = len(answer_indexes - true_indexes) # кол-во неправильных вариантов
+class GradebookEntry(models.Model):
+    '''
+    оценка пользователя за задание или тест в чистых баллах - сохранённый результат Task.get_mark / Test.get_user_mark
+    для страницы оценок. запись пересчитывается после изменения ответа, оценки, попытки теста или ответа на вопрос (см. gradebook.py)
+    запись есть, только если есть ответ на задание или попытка теста: без неё оценка зависит только от времени (дедлайн, окончание теста)
+    '''
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='пользователь', related_name='gradebook_entries')
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, verbose_name='задание', null=True, blank=True)
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, verbose_name='тест', null=True, blank=True)
 
-                if q_type == 'many1':
-                    # деление на ноль
-                    self.mark = Decimal(max(choise_true-choise_false, 0) / len(true_indexes)) * q.max_mark
-                elif q_type == 'many2':
-                    # деление на ноль
-                    self.mark = Decimal(choise_true / len(true_indexes)) * q.max_mark if choise_false == 0 else Decimal(0)
-                else:
-                    raise Exception('QUESTION_TYPE')
+    mark = models.DecimalField('оценка в чистых баллах', help_text='null если ответ не оценён или нет завершённых попыток', max_digits=9, decimal_places=4, null=True, blank=True)
+    # попытка теста завершается по времени без изменения БД, поэтому запись с незавершённой попыткой пересчитывается при чтении
+    refresh_at = models.DateTimeField('пересчитать после', help_text='время завершения незавершённой попытки теста', null=True, blank=True)
 
-        super(TestQuestionAnswer, self).save(*args, **kwargs)
+    class Meta:
+        verbose_name = 'оценка в журнале'
+        verbose_name_plural = 'журнал оценок'
+
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'task'], name='GradebookEntry: unique user task'),
+            models.UniqueConstraint(fields=['user', 'test'], name='GradebookEntry: unique user test'),
+            models.CheckConstraint(check=models.Q(task__isnull=False, test__isnull=True) | models.Q(task__isnull=True, test__isnull=False), name='GradebookEntry: task or test'),
+        ]
+
+    def __str__(self):
+        return self.user.__str__() + ' | ' + (self.task or self.test).__str__()
 
 
 class Notification(models.Model):
@@ -905,6 +1105,7 @@ class Comment(models.Model):
     '''
     task = models.ForeignKey('Task', on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='курс', related_name='+', null=True, editable=False, help_text='заполняется автоматически по заданию (см. course_ids.py)')
     text = models.CharField('текст комментария', help_text='max length 255. чтобы упомянуть кого-то: $login', max_length=255, validators=[MinLengthValidator(1)])
     datetime = models.DateTimeField('время написания', help_text='время выставляется автоматически во время создания объекта', auto_now_add=True)
     
@@ -962,6 +1163,7 @@ class FileStorage(models.Model):
 
     course_element = models.ForeignKey(CourseElement, on_delete=models.SET_NULL, verbose_name='', null=True, blank=True)
     task_answer = models.ForeignKey(TaskAnswer, on_delete=models.SET_NULL, verbose_name='', null=True, blank=True)
+    course = models.ForeignKey(Course, on_delete=models.SET_NULL, verbose_name='курс', related_name='+', null=True, editable=False, help_text='заполняется автоматически по элементу курса или ответу на задание (см. course_ids.py)')
 
     class Meta:
         verbose_name = 'загруженный файл'
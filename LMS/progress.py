@@ -0,0 +1,156 @@
+# ход проверки ответов на задания: результаты тестов передаются клиентам по мере выполнения
+# рабочий процесс публикует события проверки ответа, API отдаёт их клиенту в формате server-sent events
+# вместо повторных запросов страницы задания
+#
+# запрос - ограниченный long-poll: ответ возвращается, как только есть хотя бы одно новое событие, или через
+# settings.JUDGE_PROGRESS_TIMEOUT секунд (несколько секунд). EventSource переподключается сам и передаёт номер
+# последнего полученного события (Last-Event-ID), следующий запрос отдаёт события после него.
+# запрос ждёт в рабочем процессе/потоке WSGI: при N одновременно открытых страницах до N рабочих заняты ожиданием
+# не дольше JUDGE_PROGRESS_TIMEOUT. рабочих процессов WSGI (gunicorn --workers/--threads) должно быть больше,
+# чем ожидается одновременных ожиданий, либо JUDGE_PROGRESS_TIMEOUT нужно уменьшить
+#
+# settings.JUDGE_PROGRESS_BACKEND:
+# - 'local': события передаются внутри процесса (runserver, CELERY_TASK_ALWAYS_EAGER, тесты)
+# - 'redis': события передаются через redis pub/sub (settings.JUDGE_PROGRESS_REDIS_URL), история хранится в списке
+#
+# события (номер события - позиция в истории проверки, с 1):
+# - { 'event': 'start', 'tests': кол-во тестов }
+# - { 'event': 'test', 'test': номер теста, 'execution_result': результат }
+# - { 'event': 'done', 'executions': [ результаты в порядке тестов ], 'mark': оценка или None }
+# новая проверка того же ответа (после возврата в очередь) начинает историю заново
+
+import json
+import logging
+from collections import OrderedDict
+from threading import Condition
+from time import monotonic
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# сколько каналов хранит локальная история
+LOCAL_HISTORY_CHANNELS = 1000
+# сколько секунд хранится история в redis
+REDIS_HISTORY_TIMEOUT = 3600
+
+
+def _channel(task_answer_id) -> str:
+    return f'task-answer-progress:{task_answer_id}'
+
+
+def _new_events(history, after) -> list:
+    '''события после первых after. история короче after - началась новая проверка, события выдаются с начала'''
+    return history[after:] if after <= len(history) else history
+
+
+class LocalBackend:
+    '''события и их история в памяти процесса'''
+    def __init__(self):
+        self._condition = Condition()
+        self._history = OrderedDict()
+
+    def publish(self, channel, event) -> None:
+        with self._condition:
+            if event['event'] == 'start':
+                self._history.pop(channel, None) # новая проверка того же ответа
+            self._history.setdefault(channel, []).append(event)
+            self._history.move_to_end(channel)
+            while LOCAL_HISTORY_CHANNELS < len(self._history):
+                self._history.popitem(last=False)
+            self._condition.notify_all()
+
+    def wait(self, channel, after, timeout) -> tuple:
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._history.get(channel, [])) != after, timeout)
+            history = self._history.get(channel, [])
+            return list(_new_events(history, after)), len(history)
+
+
+class RedisBackend:
+    '''история событий в списке, новые события будят ожидающих через redis pub/sub'''
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def publish(self, channel, event) -> None:
+        if event['event'] == 'start':
+            self._redis.delete(channel)
+        self._redis.rpush(channel, json.dumps(event))
+        self._redis.expire(channel, REDIS_HISTORY_TIMEOUT)
+        self._redis.publish(channel, '')
+
+    def wait(self, channel, after, timeout) -> tuple:
+        # подписка до чтения истории, чтобы не пропустить событие между ними
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel)
+        try:
+            deadline = monotonic() + timeout
+            while True:
+                history = self._redis.lrange(channel, 0, -1)
+                remaining = deadline - monotonic()
+                if len(history) != after or remaining <= 0:
+                    return [ json.loads(x) for x in _new_events(history, after) ], len(history)
+                pubsub.get_message(timeout=remaining)
+        finally:
+            pubsub.close()
+
+
+_backends = {}
+
+def get_backend():
+    key = (settings.JUDGE_PROGRESS_BACKEND, settings.JUDGE_PROGRESS_REDIS_URL)
+    if key not in _backends:
+        if settings.JUDGE_PROGRESS_BACKEND == 'redis':
+            _backends[key] = RedisBackend(settings.JUDGE_PROGRESS_REDIS_URL)
+        else:
+            _backends[key] = LocalBackend()
+    return _backends[key]
+
+def publish(task_answer_id, event) -> None:
+    '''ошибка передачи события не должна прерывать проверку: клиент получит результаты из БД при переподключении'''
+    try:
+        get_backend().publish(_channel(task_answer_id), event)
+    except Exception as e:
+        logger.warning(f'progress: publish to TaskAnswer {task_answer_id} failed: {e}')
+
+def wait_events(task_answer_id, after=0, timeout=0) -> tuple:
+    '''
+    события проверки ответа после первых after и кол-во событий в истории.
+    ждёт не дольше timeout секунд, пока не появится хотя бы одно новое событие
+    '''
+    return get_backend().wait(_channel(task_answer_id), after, timeout)
+
+def done_event(task_test_executions, mark) -> dict:
+    '''событие 'done'. task_test_executions в порядке тестов, mark - оценка (Decimal) или None'''
+    return {
+        'event': 'done',
+        'executions': [ x.execution_result for x in task_test_executions ],
+        'mark': str(mark) if mark is not None else None,
+    }
+
+def stored_done_event(task_answer) -> dict:
+    '''событие 'done' по результатам в БД'''
+    task_answer_mark = task_answer.get_TaskAnswerMark()
+    return done_event(
+        task_answer.task_answer_executions.all().order_by('task_test_id'),
+        task_answer_mark.mark if task_answer_mark else None,
+    )
+
+def _format(event, id=None) -> str:
+    return (f'id: {id}\n' if id is not None else '') + f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+def poll_task_answer(task_answer, after=0, timeout=None) -> str:
+    '''
+    server-sent events хода проверки ответа после первых after событий (Last-Event-ID).
+    возвращается, как только есть новые события, или через timeout (settings.JUDGE_PROGRESS_TIMEOUT),
+    после чего клиент (EventSource) переподключается
+    '''
+    # проверка завершилась до запроса: результаты из БД. если она завершится после чтения, событие 'done' будет в истории
+    task_answer.refresh_from_db(fields=['is_running'])
+    if not task_answer.is_running:
+        return 'retry: 1000\n\n' + _format(stored_done_event(task_answer))
+
+    events, count = wait_events(task_answer.id, after, settings.JUDGE_PROGRESS_TIMEOUT if timeout is None else timeout)
+    first = count - len(events) + 1
+    return 'retry: 1000\n\n' + ''.join(_format(event, first + i) for i, event in enumerate(events))
@@ -0,0 +1,117 @@
+# кэш результатов проверки ответов с одинаковым кодом
+# во время контрольных многие студенты отправляют одинаковый код (например, не изменённый start_code).
+# повторный ответ получает копию результатов без запуска на тестах.
+# ключ: задание, хеш нормализованного кода и ограничений задания, версия набора тестов (Task.tests_version)
+# - результаты, которые зависят от нагрузки на сервер проверки (превышение времени, сбой проверки), не запоминаются:
+#   иначе TLE при перегрузке получили бы все следующие ответы с тем же кодом
+# - записи действуют settings.JUDGE_RESULT_CACHE_MAX_AGE, устаревшие удаляет delete_expired (задача everyday)
+
+import hashlib
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .languages import get_language
+from .models import TaskAnswerCache, TaskTestExecution
+
+# счётчики в django cache
+HITS_KEY = 'result_cache:hits'
+MISSES_KEY = 'result_cache:misses'
+
+# time limit, other
+UNCACHED_RESULTS = {'2', '7'}
+
+_TRAILING_SPACES = re.compile(r'[ \t]+$', re.MULTILINE)
+
+
+def normalize_code(code) -> str:
+    '''код без различий в окончаниях строк, пробелах в конце строк и пустых строках в конце'''
+    code = code.replace('\r\n', '\n').replace('\r', '\n')
+    return _TRAILING_SPACES.sub('', code).rstrip('\n')
+
+def get_code_hash(task, code, language=None) -> str:
+    '''ограничения задания и язык влияют на результаты, поэтому входят в хеш'''
+    data = f'{task.limit_time.total_seconds()}|{task.limit_memory_Mbyte}|{task.fail_fast}|{get_language(language).code}\n{normalize_code(code)}'
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+def _count(key) -> None:
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass # ключ удалили между add и incr
+
+def get_stats() -> dict:
+    return { 'cache_hits': cache.get(HITS_KEY, 0), 'cache_misses': cache.get(MISSES_KEY, 0) }
+
+def get_cached_executions(task_answer):
+    '''
+    возвращает несохранённые TaskTestExecution ответа, скопированные из кэша, или None если в кэше нет результатов
+    для текущей версии тестов задания
+    '''
+    task = task_answer.task
+    # версия сравнивается в БД: task мог быть загружен до изменения тестов
+    entry = TaskAnswerCache.objects.filter(
+        task=task,
+        code_hash=get_code_hash(task, task_answer.code, task_answer.language),
+        tests_version=F('task__tests_version'),
+        datetime_create__gte=timezone.now() - settings.JUDGE_RESULT_CACHE_MAX_AGE,
+    ).first()
+
+    task_tests = list(task.task_tests.all().order_by('id')) if entry else []
+    if entry is None or len(task_tests) != len(entry.executions):
+        _count(MISSES_KEY)
+        return None
+
+    _count(HITS_KEY)
+    return [ TaskTestExecution(
+        task_test=task_test,
+        task_answer=task_answer,
+        stdout=execution['stdout'],
+        stdout_truncated=execution.get('stdout_truncated', False), # записи кэша до появления поля
+        stderr=execution['stderr'],
+        returncode=execution['returncode'],
+        execution_result=execution['execution_result'],
+        duration=timedelta(seconds=execution['duration']),
+        cpu_duration=timedelta(seconds=execution['cpu_duration']),
+        compile_duration=timedelta(seconds=execution.get('compile_duration', 0)),
+        memory_Kbyte=execution['memory_Kbyte'],
+    ) for task_test, execution in zip(task_tests, entry.executions) ]
+
+def cache_executions(task_answer, tests_version, task_test_executions) -> None:
+    '''запоминает результаты ответа. tests_version - версия тестов задания на момент загрузки тестов для запуска'''
+    if any(x.execution_result in UNCACHED_RESULTS for x in task_test_executions):
+        return
+
+    executions = [ {
+        'stdout': x.stdout,
+        'stdout_truncated': x.stdout_truncated,
+        'stderr': x.stderr,
+        'returncode': x.returncode,
+        'execution_result': x.execution_result,
+        'duration': x.duration.total_seconds(),
+        'cpu_duration': x.cpu_duration.total_seconds(),
+        'compile_duration': x.compile_duration.total_seconds(),
+        'memory_Kbyte': x.memory_Kbyte,
+    } for x in task_test_executions ]
+
+    try:
+        with transaction.atomic():
+            TaskAnswerCache.objects.create(
+                task=task_answer.task,
+                code_hash=get_code_hash(task_answer.task, task_answer.code, task_answer.language),
+                tests_version=tests_version,
+                executions=executions,
+            )
+    except IntegrityError:
+        pass # такой же код проверили одновременно в другом процессе
+
+def delete_expired() -> int:
+    '''удаляет записи старше settings.JUDGE_RESULT_CACHE_MAX_AGE. возвращает кол-во удалённых записей'''
+    count, _ = TaskAnswerCache.objects.filter(datetime_create__lt=timezone.now() - settings.JUDGE_RESULT_CACHE_MAX_AGE).delete()
+    return count
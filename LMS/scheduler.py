@@ -0,0 +1,113 @@
+# порядок передачи ответов на проверку (см. models.JudgeJob и celery_tasks.schedule_judge_jobs)
+# во время дедлайна одного курса его ответы не должны занимать все рабочие процессы:
+# - ответы заданий с близким дедлайном (settings.JUDGE_DEADLINE_PRIORITY) передаются раньше остальных,
+#   повторная проверка после изменения тестов (JudgeJob.rejudge) - после всех остальных
+# - среди остальных выбирается курс с наименьшей долей выполняющихся ответов (кол-во / Course.judge_weight),
+#   в курсе - студент с наименьшим кол-вом выполняющихся ответов, у студента - самый старый ответ.
+#   так места распределяются между курсами пропорционально весам, а в курсе - поровну между студентами
+#   (weighted fair queuing, где ресурс - места в очереди рабочих процессов)
+# - у студента выполняется не больше settings.JUDGE_MAX_IN_FLIGHT_PER_USER ответов
+# - курсы и студенты курсов хранятся в кучах, построенных один раз на вызов: выдача задания - O(log n)
+# - место в очереди при отправке ответа вычисляется точно только для первых settings.JUDGE_QUEUE_POSITION_LIMIT
+#   заданий порядка, дальше - оценка (см. queue_position)
+#
+# модуль не зависит от django: задания - объекты с полями id, course_id, student_id
+
+from collections import Counter, defaultdict, deque
+from heapq import heapify, heappop, heappush, heapreplace
+from itertools import islice
+
+
+def fair_order(waiting, running, weights, priority, max_per_user=None):
+    '''
+    генератор ожидающих заданий в порядке передачи на проверку
+    running - выполняющиеся задания, weights - { id курса: вес }, priority(job) - класс задания, меньший передаётся раньше
+    задания студента с max_per_user выполняющимися заданиями не выдаются (None - без ограничения)
+    '''
+    course_load = Counter(job.course_id for job in running)
+    student_load = Counter(job.student_id for job in running)
+
+    def blocked(student_id):
+        return max_per_user is not None and student_load[student_id] >= max_per_user
+
+    classes = defaultdict(list)
+    for job in waiting:
+        classes[priority(job)].append(job)
+
+    for _, jobs in sorted(classes.items()):
+        # курс -> студент -> задания студента по возрастанию id; курс -> id заданий курса по возрастанию
+        queues = defaultdict(lambda: defaultdict(deque))
+        course_ids = defaultdict(deque)
+        for job in sorted(jobs, key=lambda job: job.id):
+            queues[job.course_id][job.student_id].append(job)
+            course_ids[job.course_id].append(job.id)
+        done = set()
+
+        # кучи строятся один раз на класс. ключ курса (доля, id самого старого задания) меняется только при выдаче
+        # задания этого курса. ключ студента (выполняющиеся, id первого задания) растёт и при выдаче его задания
+        # другого курса: устаревший ключ меньше настоящего, он обновляется, когда оказывается наверху кучи
+        students = {
+            course_id: [ (student_load[student_id], queue[0].id, student_id) for student_id, queue in course_queues.items() ]
+            for course_id, course_queues in queues.items()
+        }
+        courses = [ (course_load[course_id] / weights.get(course_id, 1), course_ids[course_id][0], course_id) for course_id in queues ]
+        for heap in students.values():
+            heapify(heap)
+        heapify(courses)
+
+        while courses:
+            _, _, course_id = heappop(courses)
+            heap = students[course_id]
+            student_id = None
+            while heap:
+                load, _, candidate = heap[0]
+                if blocked(candidate):
+                    # выполняющихся заданий у студента до конца генератора только прибавляется
+                    heappop(heap)
+                elif load != student_load[candidate]:
+                    heapreplace(heap, (student_load[candidate], queues[course_id][candidate][0].id, candidate))
+                else:
+                    student_id = heappop(heap)[2]
+                    break
+            if student_id is None:
+                # в курсе не осталось студентов, которым можно выдать задание
+                continue
+
+            queue = queues[course_id][student_id]
+            job = queue.popleft()
+            done.add(job.id)
+            course_load[course_id] += 1
+            student_load[student_id] += 1
+
+            if queue:
+                heappush(heap, (student_load[student_id], queue[0].id, student_id))
+            ids = course_ids[course_id]
+            while ids and ids[0] in done:
+                ids.popleft()
+            if heap:
+                heappush(courses, (course_load[course_id] / weights.get(course_id, 1), ids[0], course_id))
+            yield job
+
+def pick_jobs(waiting, running, capacity, weights, priority, max_per_user=None) -> list:
+    '''до capacity заданий, которые нужно передать на проверку сейчас'''
+    return list(islice(fair_order(waiting, running, weights, priority, max_per_user), max(0, capacity)))
+
+def queue_position(job, waiting, running, capacity, weights, priority, limit=None) -> int:
+    '''
+    сколько заданий будет передано на проверку раньше job сверх свободных мест (0 - передаётся сразу)
+    ограничение на студента не учитывается: оно только откладывает его собственные задания
+    точно вычисляются только первые limit заданий порядка (None - все). если job дальше, место оценивается
+    без перебора: задания более высоких классов и задания своего класса, поставленные в очередь раньше job
+    '''
+    for i, other in enumerate(islice(fair_order(waiting, running, weights, priority), limit)):
+        if other.id == job.id:
+            return max(0, i + 1 - capacity)
+    if limit is None:
+        return 0
+    job_class = priority(job)
+    ahead = sum(1 for other in waiting if (priority(other), other.id) < (job_class, job.id))
+    return max(0, max(ahead, limit) - capacity)
+
+def estimate_wait(position, capacity, job_duration) -> float:
+    '''ожидание в секундах: перед заданием position заданий по job_duration секунд на capacity местах'''
+    return position * job_duration / max(1, capacity)
@@ -1,9 +1,11 @@
 from os import path, remove
 
-from django.db.models.signals import post_delete, post_save
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
 
-from .models import TaskAnswer
+from . import course_ids, gradebook, membership
+from .models import Comment, Course, CourseElement, FileStorage, GradebookEntry, Task, TaskAnswer, TaskAnswerCache, TaskAnswerMark, TaskTest, Test, TestQuestion, TestQuestionAnswer, TestResult
 
 # https://docs.djangoproject.com/en/3.2/ref/signals/
 
@@ -16,4 +18,106 @@ def task_answer_delete(sender, instance: TaskAnswer, **kwargs):
         pass
         #print('signals.py task_answer_delete', instance.files)
         #if os.path.isfile(instance.file.path):
-        #    os.remove(instance.file.path)
\ No newline at end of file
+        #    os.remove(instance.file.path)
+
+@receiver(post_save, sender=TaskTest)
+@receiver(post_delete, sender=TaskTest)
+def task_test_change(sender, instance: TaskTest, **kwargs):
+    """
+    Тесты задания изменились: кэш результатов проверки задания больше не действителен.
+    версия увеличивается, чтобы выполняющиеся сейчас проверки не записали в кэш результаты старых тестов
+    """
+    Task.objects.filter(pk=instance.task_id).update(tests_version=F('tests_version') + 1)
+    TaskAnswerCache.objects.filter(task_id=instance.task_id).delete()
+
+@receiver(post_save, sender=TaskAnswer)
+@receiver(post_delete, sender=TaskAnswer)
+def gradebook_task_answer_change(sender, instance: TaskAnswer, **kwargs):
+    """Ответ на задание загружен или удалён: пересчитать запись журнала оценок"""
+    gradebook.schedule_task(instance.task_id, instance.student_id)
+
+@receiver(post_save, sender=TaskAnswerMark)
+@receiver(post_delete, sender=TaskAnswerMark)
+def gradebook_task_answer_mark_change(sender, instance: TaskAnswerMark, **kwargs):
+    """Оценка за ответ изменилась: пересчитать запись журнала оценок"""
+    if TaskAnswerMark.task_answer.is_cached(instance):
+        gradebook.schedule_task(instance.task_answer.task_id, instance.task_answer.student_id)
+        return
+
+    task_answer = TaskAnswer.objects.filter(pk=instance.task_answer_id).values('task_id', 'student_id').first()
+    # при удалении ответа каскадом запись пересчитывается по сигналу ответа
+    if task_answer is not None:
+        gradebook.schedule_task(task_answer['task_id'], task_answer['student_id'])
+
+@receiver(post_save, sender=TestResult)
+@receiver(post_delete, sender=TestResult)
+def gradebook_test_result_change(sender, instance: TestResult, **kwargs):
+    """Попытка теста начата, завершена, оценена вручную или удалена: пересчитать запись журнала оценок"""
+    gradebook.schedule_test(instance.test_id, instance.user_id)
+
+@receiver(post_save, sender=TestQuestionAnswer)
+@receiver(post_delete, sender=TestQuestionAnswer)
+def gradebook_test_question_answer_change(sender, instance: TestQuestionAnswer, **kwargs):
+    """Ответ на вопрос изменил баллы попытки: пересчитать запись журнала оценок"""
+    if TestQuestionAnswer.test_result.is_cached(instance):
+        gradebook.schedule_test(instance.test_result.test_id, instance.test_result.user_id)
+        return
+
+    test_result = TestResult.objects.filter(pk=instance.test_result_id).values('test_id', 'user_id').first()
+    if test_result is not None:
+        gradebook.schedule_test(test_result['test_id'], test_result['user_id'])
+
+@receiver(post_save, sender=Task)
+def gradebook_task_change(sender, instance: Task, **kwargs):
+    """Изменились баллы задания: пересчитать записи журнала всех ответивших"""
+    for user_id in GradebookEntry.objects.filter(task=instance).values_list('user_id', flat=True):
+        gradebook.schedule_task(instance.id, user_id)
+
+@receiver(post_save, sender=Test)
+def gradebook_test_change(sender, instance: Test, **kwargs):
+    """Изменились баллы или сроки теста: пересчитать записи журнала всех проходивших"""
+    for user_id in GradebookEntry.objects.filter(test=instance).values_list('user_id', flat=True):
+        gradebook.schedule_test(instance.id, user_id)
+
+@receiver(post_save, sender=TestQuestion)
+@receiver(post_delete, sender=TestQuestion)
+def gradebook_test_question_change(sender, instance: TestQuestion, **kwargs):
+    """Изменился максимум баллов теста: пересчитать записи журнала всех проходивших"""
+    for user_id in GradebookEntry.objects.filter(test_id=instance.test_id).values_list('user_id', flat=True):
+        gradebook.schedule_test(instance.test_id, user_id)
+
+@receiver(m2m_changed, sender=Course.owners.through)
+@receiver(m2m_changed, sender=Course.students.through)
+@receiver(m2m_changed, sender=Course.excluded.through)
+def course_membership_change(sender, action, **kwargs):
+    """Преподаватели, студенты или исключённые курса изменились: запомненное членство в курсах устарело"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        membership.invalidate()
+
+@receiver(pre_save, sender=CourseElement)
+@receiver(pre_save, sender=Task)
+@receiver(pre_save, sender=Test)
+@receiver(pre_save, sender=TestQuestion)
+@receiver(pre_save, sender=TestResult)
+@receiver(pre_save, sender=TestQuestionAnswer)
+@receiver(pre_save, sender=TaskAnswer)
+@receiver(pre_save, sender=Comment)
+@receiver(pre_save, sender=FileStorage)
+def course_id_assign(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Курс объекта берётся у родителя (см. course_ids.py)"""
+    if not raw:
+        course_ids.assign(instance, update_fields)
+
+@receiver(post_save, sender=CourseElement)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Test)
+@receiver(post_save, sender=TestQuestion)
+@receiver(post_save, sender=TestResult)
+@receiver(post_save, sender=TestQuestionAnswer)
+@receiver(post_save, sender=TaskAnswer)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=FileStorage)
+def course_id_propagate(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Курс объекта изменился: обновить курс у потомков"""
+    if not raw:
+        course_ids.propagate(instance, update_fields)
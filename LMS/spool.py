@@ -0,0 +1,78 @@
+# файлы состояния рабочих процессов execute_code.py в каталоге settings.JUDGE_SPOOL_DIR (JUDGE_MODE = 'spool')
+# - .workers/<имя процесса> - heartbeat: файл перезаписывается каждую секунду, время изменения - время последнего сигнала
+# - <id ответа>+/.lease - аренда каталога: процесс, который выполняет код, и номер попытки. время изменения продлевается
+#   каждую секунду. каталог с просроченной арендой может взять другой процесс, после settings.JUDGE_MAX_ATTEMPTS
+#   попыток ответ снимается с проверки (см. health.py)
+#
+# модуль не зависит от django: его используют execute_code.py и celery_tasks
+
+import json
+import os
+import socket
+from os import path
+from time import time
+
+HEARTBEAT_DIR = '.workers'
+LEASE_FILE = '.lease'
+
+
+def worker_name() -> str:
+    '''имя текущего процесса: хост и pid'''
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def _write_json(file_path, data) -> None:
+    '''запись через временный файл, чтобы читатель не увидел половину файла'''
+    tmp_path = f'{file_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wt') as fout:
+        json.dump(data, fout)
+    os.replace(tmp_path, file_path)
+
+def _read_json(file_path):
+    '''содержимое и возраст файла в секундах или None, если файла нет'''
+    try:
+        with open(file_path, 'rt') as fin:
+            data = json.load(fin)
+        return data, max(0, time() - path.getmtime(file_path))
+    except (OSError, ValueError):
+        return None
+
+def write_heartbeat(spool_dir, worker, info) -> None:
+    heartbeat_dir = path.join(spool_dir, HEARTBEAT_DIR)
+    os.makedirs(heartbeat_dir, exist_ok=True)
+    _write_json(path.join(heartbeat_dir, worker.replace('/', '_')), { 'worker': worker, **info })
+
+def remove_heartbeat(spool_dir, worker) -> None:
+    try:
+        os.remove(path.join(spool_dir, HEARTBEAT_DIR, worker.replace('/', '_')))
+    except OSError:
+        pass
+
+def read_heartbeats(spool_dir) -> list:
+    '''[ (данные heartbeat, возраст в секундах) ]'''
+    heartbeat_dir = path.join(spool_dir, HEARTBEAT_DIR)
+    if not path.isdir(heartbeat_dir):
+        return []
+    heartbeats = [ _read_json(path.join(heartbeat_dir, file)) for file in os.listdir(heartbeat_dir) if not file.endswith('.tmp') ]
+    return [ x for x in heartbeats if x is not None ]
+
+def read_lease(dir_path):
+    '''(данные аренды { 'worker', 'attempt' }, возраст в секундах) или None, если каталог не брали'''
+    return _read_json(path.join(dir_path, LEASE_FILE))
+
+def claim(dir_path, worker, lease_timeout) -> bool:
+    '''
+    берёт каталог в аренду, если его не держит другой процесс. возвращает False, если аренда другого процесса не истекла
+    между проверкой и записью каталог может взять другой процесс: тогда код выполнится дважды, результат тот же
+    '''
+    lease = read_lease(dir_path)
+    if lease is not None and lease[0]['worker'] != worker and lease[1] < lease_timeout:
+        return False
+    attempt = lease[0]['attempt'] + 1 if lease is not None else 1
+    _write_json(path.join(dir_path, LEASE_FILE), { 'worker': worker, 'attempt': attempt })
+    return True
+
+def renew(dir_path) -> None:
+    try:
+        os.utime(path.join(dir_path, LEASE_FILE))
+    except OSError:
+        pass # каталог уже обработан
@@ -79,12 +79,18 @@ function deleteTaskMark(id) {
 function createTaskTest(task_id) {
     const input = document.getElementById('id_input');
     const output = document.getElementById('id_output');
+    const weight = document.getElementById('id_weight');
+    const checker = document.getElementById('id_checker');
+    const tolerance = document.getElementById('id_tolerance');
 
     const body = {
         "task": task_id,
         "input": input.value,
         "output": output.value,
         "hidden": true,
+        "weight": weight.value,
+        "checker": checker.value,
+        "tolerance": tolerance.value,
     }
 
     const URL = '/api-lms/task-test/';
@@ -157,6 +163,32 @@ function deleteTaskTest(task_test_id) {
     }).catch(err => console.log(err))
 }
 
+// повторная проверка ответов после изменения тестов. ход проверки запрашивается раз в 2 сек
+function rejudgeTask(task_id) {
+    const URL = `/api-lms/task-rejudge/${task_id}/`
+    const csrftoken = getCook('csrftoken');
+
+    fetch(URL, {
+        method: 'POST',
+        headers: {
+            'mode': 'same-origin',
+            'X-CSRFToken': csrftoken,
+        }
+    }).then(response => {
+        if (response.status !== 200) {
+            response.json().then(json => showMessage(json.detail));
+            return;
+        }
+
+        const timer = setInterval(() => {
+            fetch(URL).then(response => response.json()).then(json => {
+                showMessage(`перепроверено ${json.total - json.remaining} из ${json.total}, изменились результаты ${json.changed}`, 1900);
+                if (json.remaining === 0) clearInterval(timer);
+            }).catch(err => clearInterval(timer));
+        }, 2000);
+    }).catch(err => console.log(err))
+}
+
 function addComment(task_id) {
     const text = document.getElementById('comment_text').value;
     const body = {
@@ -224,11 +256,34 @@ function uploadCode(task_id) {
     }).then(response => {
         console.log(response);
         if (response.status === 200) {
-            showMessage('код загружен');
+            response.json().then(json => {
+                if (json.queue_position) {
+                    showMessage(`код загружен, место в очереди: ${json.queue_position}, ожидание ~${Math.ceil(json.estimated_wait)} сек`);
+                } else {
+                    showMessage('код загружен');
+                }
+                watchTaskAnswer(json.id);
+            });
         } else {
             showMessage('ошибка загрузки кода');
         }
     }).catch((error) => {
         console.error('Error:', error);
     });
+}
+
+// результаты тестов приходят по мере проверки (server-sent events), без повторных запросов страницы
+function watchTaskAnswer(task_answer_id) {
+    const source = new EventSource(`/api-lms/task-answer-progress/${task_answer_id}/`);
+
+    source.addEventListener('test', event => {
+        const data = JSON.parse(event.data);
+        showMessage(`тест ${data.test + 1}: ${data.execution_result}`, 1000);
+    });
+
+    source.addEventListener('done', event => {
+        source.close();
+        showMessage('проверка завершена');
+        location.reload();
+    });
 }
\ No newline at end of file
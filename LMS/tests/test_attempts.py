@@ -0,0 +1,156 @@
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from LMS.attempts import AttemptError, start_attempt
+from LMS.models import Course, CourseElement, Test, TestQuestion, TestQuestionAnswer, TestResult
+
+
+def create_test(title='тест', questions=3, **kwargs):
+    course = Course.objects.create(title=f'курс: {title}')
+    test = Test.objects.create(**{
+        'course_element': CourseElement.objects.create(course=course, title='элемент курса'),
+        'title': title,
+        'mark_outer': Decimal(10),
+        'number_of_attempts': 2,
+        'test_type': 'many',
+        'start': timezone.now() - timedelta(hours=1),
+        'end': timezone.now() + timedelta(days=1),
+        'duration': timedelta(hours=1),
+        **kwargs,
+    })
+    TestQuestion.objects.bulk_create(
+        TestQuestion(test=test, course_id=course.id, question_text=f'вопрос {i}', max_mark=Decimal(1), answer_type='free', answer_true='42')
+        for i in range(questions)
+    )
+    return test
+
+
+class StartAttemptTestCase(TestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.user = User.objects.create(username='student')
+        self.test = create_test()
+
+    def test_start(self):
+        '''попытка с пустыми ответами на все вопросы в случайном порядке'''
+        test_result = start_attempt(self.test, self.user)
+        self.assertEqual(test_result.attempt, 1)
+        self.assertEqual(test_result.course_id, self.test.course_id)
+
+        answers = TestQuestionAnswer.objects.filter(test_result=test_result)
+        self.assertEqual(
+            sorted(answers.values_list('test_question_id', flat=True)),
+            sorted(self.test.test_questions.values_list('id', flat=True)),
+        )
+        self.assertTrue(all(x.answer == '' and x.course_id == self.test.course_id for x in answers))
+
+    def test_order(self):
+        '''без перемешивания вопросы в порядке создания'''
+        self.test.shuffle = False
+        test_result = start_attempt(self.test, self.user)
+        self.assertEqual(
+            list(test_result.test_result_questions_answers.order_by('id').values_list('test_question_id', flat=True)),
+            list(self.test.test_questions.order_by('id').values_list('id', flat=True)),
+        )
+
+    def test_queries(self):
+        '''кол-во запросов не зависит от кол-ва вопросов и попыток'''
+        def count_queries(test):
+            with CaptureQueriesContext(connection) as context:
+                test_result = start_attempt(test, self.user)
+            test_result.complete()
+            return len(context.captured_queries)
+
+        queries = count_queries(self.test)
+        self.assertEqual(count_queries(create_test(questions=50, title='большой тест')), queries)
+        self.assertEqual(count_queries(self.test), queries)
+
+    def test_errors(self):
+        ''''''
+        test_result = start_attempt(self.test, self.user)
+        with self.assertRaisesMessage(AttemptError, 'Есть активное прохождение теста.'):
+            start_attempt(self.test, self.user)
+
+        test_result.complete()
+        start_attempt(self.test, self.user).complete()
+        with self.assertRaisesMessage(AttemptError, 'Закончились попытки.'):
+            start_attempt(self.test, self.user)
+        self.assertEqual(TestResult.objects.filter(user=self.user).count(), 2)
+
+        with self.assertRaisesMessage(AttemptError, 'Тестирование не началось.'):
+            start_attempt(self.test, self.user, now=self.test.start - timedelta(seconds=1))
+        with self.assertRaisesMessage(AttemptError, 'Тестирование завершено.'):
+            start_attempt(self.test, self.user, now=self.test.end + timedelta(seconds=1))
+
+    def test_timed_out_attempt(self):
+        '''попытка, у которой вышло время, не мешает начать новую'''
+        test_result = start_attempt(self.test, self.user)
+        TestResult.objects.filter(pk=test_result.pk).update(start=timezone.now() - timedelta(hours=2))
+        self.assertEqual(start_attempt(self.test, self.user).attempt, 2)
+
+    def test_deleted_attempt(self):
+        '''после удаления одной из попыток номер новой попытки не совпадает с оставшимися, кол-во попыток считается по оставшимся'''
+        self.test.number_of_attempts = 3
+        test_results = []
+        for _ in range(3):
+            test_results.append(start_attempt(self.test, self.user))
+            test_results[-1].complete()
+        test_results[1].delete()
+
+        test_result = start_attempt(self.test, self.user)
+        self.assertEqual(test_result.attempt, 4)
+        self.assertEqual(sorted(TestResult.objects.filter(user=self.user).values_list('attempt', flat=True)), [1, 3, 4])
+
+    def test_concurrent_insert(self):
+        '''параллельный запрос вставил попытку с тем же номером после проверки: вторая попытка не создаётся'''
+        create = TestResult.objects.create
+
+        def create_after_concurrent(**kwargs):
+            create(test=self.test, user=self.user, attempt=kwargs['attempt'])
+            return create(**kwargs)
+
+        with mock.patch.object(TestResult.objects, 'create', side_effect=create_after_concurrent):
+            with self.assertRaisesMessage(AttemptError, 'Есть активное прохождение теста.'):
+                start_attempt(self.test, self.user)
+        self.assertEqual(TestResult.objects.filter(user=self.user).count(), 0)
+
+
+class StartAttemptConcurrencyTestCase(TransactionTestCase):
+    THREADS = 8
+
+    def test_concurrent_start(self):
+        '''одновременные запросы одного пользователя создают одну активную попытку'''
+        user = User.objects.create(username='student')
+        test = create_test(number_of_attempts=10)
+
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def start():
+            try:
+                barrier.wait()
+                results.append(start_attempt(test, user))
+            except (AttemptError, DatabaseError) as e:
+                results.append(e)
+            finally:
+                connection.close()
+
+        threads = [ threading.Thread(target=start) for _ in range(self.THREADS) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        started = [ x for x in results if isinstance(x, TestResult) ]
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(len(started), 1)
+        self.assertEqual(TestResult.objects.filter(test=test, user=user).count(), 1)
+        self.assertEqual(TestQuestionAnswer.objects.filter(test_result=started[0]).count(), 3)
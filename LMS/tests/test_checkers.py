@@ -0,0 +1,41 @@
+from django.test import SimpleTestCase
+
+from LMS.checkers import check_output
+
+
+class CheckersTestCase(SimpleTestCase):
+    def test_exact(self):
+        ''''''
+        self.assertTrue(check_output('0', '1 2\n', '1 2\n'))
+        self.assertFalse(check_output('0', '1 2\n', '1 2 \n'))
+        self.assertFalse(check_output('0', '1 2\n', '1 2'))
+
+    def test_normalized(self):
+        '''окончания строк, пробелы в конце строк и пустые строки в конце не учитываются'''
+        self.assertTrue(check_output('1', '1 2\n3\n', '1 2  \r\n3'))
+        self.assertTrue(check_output('1', '1\n', '1\n\n\n'))
+        self.assertTrue(check_output('1', '1\r2', '1\n2\n'))
+        self.assertTrue(check_output('1', '', '\n \n'))
+        self.assertFalse(check_output('1', '1 2\n', '1  2\n'))
+        self.assertFalse(check_output('1', '1\n\n2\n', '1\n2\n'))
+        self.assertFalse(check_output('1', '1\n2\n', '1\n'))
+
+    def test_tokens(self):
+        '''сравниваются слова'''
+        self.assertTrue(check_output('2', '1 2\n3\n', '1\n2   3'))
+        self.assertFalse(check_output('2', '1 2 3', '1 2'))
+        self.assertFalse(check_output('2', '1 2', '1 2 3'))
+
+    def test_float(self):
+        '''числа сравниваются с погрешностью, остальные слова точно'''
+        self.assertTrue(check_output('3', '0.333333 yes', '0.3333334 yes\n', 1e-6))
+        self.assertTrue(check_output('3', '1000000', '1000000.5', 1e-6))
+        self.assertFalse(check_output('3', '0.5', '0.51', 1e-6))
+        self.assertFalse(check_output('3', '0.5 yes', '0.5 no', 1e-6))
+        self.assertFalse(check_output('3', '0.5', '0.5 0.5', 1e-6))
+
+    def test_unordered(self):
+        '''строки в любом порядке, повторы учитываются'''
+        self.assertTrue(check_output('4', 'a\nb\nb\n', 'b\na \r\nb'))
+        self.assertFalse(check_output('4', 'a\nb\nb\n', 'a\nb\n'))
+        self.assertFalse(check_output('4', 'a\nb\n', 'a\nb\nb\n'))
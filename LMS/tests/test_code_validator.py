@@ -0,0 +1,69 @@
+from django.test import SimpleTestCase
+
+from LMS.code_validator import ATTRIBUTE_ERROR, BUILT_IN_FUNCTION_ERROR, IMPORT_ERROR, SYNTAX_ERROR, CodeValidator
+from LMS.models import CODE_VALIDATOR, NOT_ALLOW_ATTRIBUTES, NOT_ALLOW_BUILT_IN_FUNCTIONS, SAFE_IMPORTS
+
+
+class CodeValidatorTestCase(SimpleTestCase):
+    def assertValid(self, code):
+        self.assertEqual(CODE_VALIDATOR.validate(code), (), code)
+
+    def assertErrors(self, code, errors):
+        self.assertEqual(CODE_VALIDATOR.validate(code), errors, code)
+
+    def test_imports(self):
+        ''''''
+        self.assertValid('import math')
+        self.assertValid('import math as m, random')
+        self.assertValid('from math import sqrt, floor')
+        self.assertValid('from math import *')
+        self.assertErrors('import os', (IMPORT_ERROR,))
+        self.assertErrors('import os.path', (IMPORT_ERROR,))
+        self.assertErrors('from os import path', (IMPORT_ERROR,))
+        self.assertErrors('from . import judge', (IMPORT_ERROR,))
+        self.assertErrors('def f():\n    import subprocess\n', (IMPORT_ERROR,))
+
+    def test_built_in_functions(self):
+        ''''''
+        self.assertErrors("open('1')", (BUILT_IN_FUNCTION_ERROR,))
+        self.assertErrors('f = eval\nf("1")', (BUILT_IN_FUNCTION_ERROR,))
+        self.assertErrors("getattr(__builtins__, 'open')('1')", (BUILT_IN_FUNCTION_ERROR,))
+        self.assertErrors('ｅval("1")', (BUILT_IN_FUNCTION_ERROR,))
+        self.assertErrors('import re\np = re.compile("a+")', (BUILT_IN_FUNCTION_ERROR,))
+
+    def test_attributes(self):
+        ''''''
+        self.assertErrors('().__class__.__bases__[0].__subclasses__()', (ATTRIBUTE_ERROR,))
+        self.assertErrors('print.__self__.__globals__', (ATTRIBUTE_ERROR,))
+        self.assertErrors('print.__self__.__dict__["open"]("1")', (ATTRIBUTE_ERROR,))
+        self.assertErrors('().__getattribute__("x")', (ATTRIBUTE_ERROR,))
+
+    def test_builtins_module(self):
+        '''встроенные функции через модуль builtins (print.__self__) запрещены'''
+        self.assertErrors('print.__self__.open("/etc/passwd").read()', (BUILT_IN_FUNCTION_ERROR, ATTRIBUTE_ERROR))
+        self.assertErrors('print.__self__.__import__("os").system("id")', (BUILT_IN_FUNCTION_ERROR, ATTRIBUTE_ERROR))
+        self.assertErrors('b = len.__self__\nb.open("1")', (BUILT_IN_FUNCTION_ERROR, ATTRIBUTE_ERROR))
+        self.assertErrors('x.open("1")', (BUILT_IN_FUNCTION_ERROR,))
+
+    def test_no_false_positives(self):
+        '''строки и комментарии с теми же именами не запрещены'''
+        self.assertValid('import re\np = re.search("a+", "aa")')
+        self.assertValid('print("eval(1)")  # open(1)')
+        self.assertValid('class A:\n    def __init__(self):\n        super().__init__()')
+
+    def test_several_errors(self):
+        ''''''
+        self.assertErrors('import os\nopen(1)\neval(2)', (IMPORT_ERROR, BUILT_IN_FUNCTION_ERROR))
+
+    def test_syntax_error(self):
+        '''код, который не разбирается, не считается проверенным'''
+        self.assertErrors('print(', (f'{SYNTAX_ERROR}: line 1',))
+        self.assertErrors('x = 1\nif x\n    open("1")', (f'{SYNTAX_ERROR}: line 2',))
+        self.assertErrors('print(1)\0', (SYNTAX_ERROR,))
+
+    def test_cache(self):
+        ''''''
+        validator = CodeValidator(SAFE_IMPORTS, NOT_ALLOW_BUILT_IN_FUNCTIONS, NOT_ALLOW_ATTRIBUTES)
+        validator.validate('import os')
+        validator.validate('import os')
+        self.assertEqual(validator.validate.cache_info().hits, 1)
@@ -0,0 +1,131 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from LMS import membership
+from LMS.models import (
+    Comment, Course, CourseElement, FileStorage, Task, TaskAnswer,
+    Test, TestQuestion, TestQuestionAnswer, TestResult,
+)
+from LMS_API.viewsets import CourseOwnerPermission, CourseSubscriberPermission
+
+
+class CourseIdsTestCase(TestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.teacher = User.objects.create(username='teacher')
+        self.student = User.objects.create(username='student')
+
+        self.course = Course.objects.create(title='курс')
+        self.course.owners.add(self.teacher)
+        self.course.students.add(self.student)
+        self.other_course = Course.objects.create(title='другой курс')
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+
+        self.task = Task.objects.create(
+            course_element=self.course_element,
+            title='задача',
+            comments_is_on=True,
+            deadline_visible=timezone.now() + timedelta(days=1),
+            deadline_true=timezone.now() + timedelta(days=1),
+            mark_outer=Decimal(5),
+            mark_max=Decimal(10),
+        )
+        self.task_answer = TaskAnswer.objects.create(task=self.task, student=self.student)
+        self.comment = Comment.objects.create(task=self.task, user=self.student, text='комментарий')
+        self.file = FileStorage.objects.create(owner=self.student, filename='answer.txt', task_answer=self.task_answer)
+        self.course_file = FileStorage.objects.create(owner=self.teacher, filename='lecture.pdf', course_element=self.course_element)
+
+        self.test = Test.objects.create(
+            course_element=self.course_element,
+            title='тест',
+            mark_outer=Decimal(10),
+            number_of_attempts=2,
+            test_type='many',
+            shuffle=False,
+            start=timezone.now() - timedelta(hours=1),
+            end=timezone.now() + timedelta(days=1),
+            duration=timedelta(hours=1),
+        )
+        self.test_question = TestQuestion.objects.create(test=self.test, question_text='баг или фича?', max_mark=Decimal(1), answer_type='one', answer_values='баг\nфича', answer_true='1')
+        self.test_result = self.test.start_new_test(self.student)
+
+    def objects(self):
+        '''все потомки элемента курса из БД'''
+        return [
+            Task.objects.get(pk=self.task.pk),
+            TaskAnswer.objects.get(pk=self.task_answer.pk),
+            Comment.objects.get(pk=self.comment.pk),
+            FileStorage.objects.get(pk=self.file.pk),
+            FileStorage.objects.get(pk=self.course_file.pk),
+            Test.objects.get(pk=self.test.pk),
+            TestQuestion.objects.get(pk=self.test_question.pk),
+            TestResult.objects.get(pk=self.test_result.pk),
+            *TestQuestionAnswer.objects.filter(test_result=self.test_result),
+        ]
+
+    def assertCourse(self, course):
+        objects = self.objects()
+        self.assertEqual(len(objects), 9)
+        for obj in objects:
+            self.assertEqual(obj.course_id, course.id, type(obj).__name__)
+
+    def test_assign(self):
+        '''курс заполняется при создании, в том числе у ответов на вопросы из bulk_create'''
+        self.assertCourse(self.course)
+        self.assertEqual(FileStorage.objects.create(owner=self.student, filename='file.txt').course_id, None)
+
+    def test_assign_cached_parent(self):
+        '''родитель загружен: курс заполняется без запроса к родителю'''
+        with CaptureQueriesContext(connection) as context:
+            test_question = TestQuestion.objects.create(test=self.test, question_text='ещё вопрос', max_mark=Decimal(1), answer_type='free', answer_true='фича')
+        self.assertEqual(test_question.course_id, self.course.id)
+        self.assertFalse([ x['sql'] for x in context.captured_queries if 'FROM "LMS_test" ' in x['sql'] ])
+
+    def test_move_course_element(self):
+        '''элемент курса перенесён в другой курс: курс обновляется у всех потомков'''
+        self.course_element.course = self.other_course
+        self.course_element.save()
+        self.assertCourse(self.other_course)
+
+        # сохранение без переноса ничего не обновляет
+        self.course_element.title = 'новое название'
+        with self.assertNumQueries(2):
+            self.course_element.save()
+
+    def test_move_task(self):
+        '''задание перенесено в элемент другого курса: курс обновляется у ответов, комментариев и файлов ответов'''
+        other_element = CourseElement.objects.create(course=self.other_course, title='элемент другого курса')
+        self.task.course_element = other_element
+        self.task.save()
+
+        self.assertEqual(TaskAnswer.objects.get(pk=self.task_answer.pk).course_id, self.other_course.id)
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).course_id, self.other_course.id)
+        self.assertEqual(FileStorage.objects.get(pk=self.file.pk).course_id, self.other_course.id)
+        self.assertEqual(Test.objects.get(pk=self.test.pk).course_id, self.course.id)
+
+    def test_backfill(self):
+        '''пустые значения (строки до появления поля) заполняются командой'''
+        for model in (Task, TaskAnswer, Comment, FileStorage, Test, TestQuestion, TestResult, TestQuestionAnswer):
+            model.objects.update(course=None)
+
+        call_command('backfill_course_ids', stdout=mock.Mock())
+        self.assertCourse(self.course)
+
+    def test_permissions_queries(self):
+        '''проверка прав не загружает родителей объекта'''
+        test_question_answer = TestQuestionAnswer.objects.filter(test_result=self.test_result).first()
+        user = User.objects.get(pk=self.student.pk)
+        membership.get_membership(user)
+
+        request = mock.Mock(user=user)
+        with self.assertNumQueries(0):
+            self.assertTrue(CourseSubscriberPermission().has_object_permission(request, None, test_question_answer))
+            self.assertFalse(CourseOwnerPermission().has_object_permission(request, None, test_question_answer))
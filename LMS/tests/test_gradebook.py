@@ -0,0 +1,221 @@
+import sys
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from LMS import gradebook
+from LMS.celery_tasks import execute_task_answer
+from LMS.models import (
+    Course, CourseElement, GradebookEntry, Task, TaskAnswer, TaskAnswerMark, TaskTest,
+    Test, TestQuestion, TestQuestionAnswer, TestResult,
+)
+
+
+class GradebookTestCase(TestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.teacher = User.objects.create(username='teacher')
+        self.student = User.objects.create(username='student')
+
+        self.course = Course.objects.create(title='курс')
+        self.course.owners.add(self.teacher)
+        self.course.students.add(self.student)
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+
+        self.task = self.create_task('задача')
+        self.test = self.create_test('тест')
+
+    def create_task(self, title, deadline=timedelta(days=1)):
+        return Task.objects.create(
+            course_element=self.course_element,
+            title=title,
+            deadline_visible=timezone.now() + deadline,
+            deadline_true=timezone.now() + deadline,
+            mark_outer=Decimal(5),
+            mark_max=Decimal(10),
+        )
+
+    def create_test(self, title, end=timedelta(days=1)):
+        test = Test.objects.create(
+            course_element=self.course_element,
+            title=title,
+            mark_outer=Decimal(10),
+            number_of_attempts=3,
+            test_type='many',
+            start=timezone.now() - timedelta(hours=1),
+            end=timezone.now() + end,
+            duration=timedelta(hours=1),
+        )
+        for answer_true in ('0', '1', '0'):
+            TestQuestion.objects.create(test=test, question_text='баг или фича?', max_mark=Decimal(1), answer_type='one', answer_values='баг\nфича', answer_true=answer_true)
+        return test
+
+    def create_attempt(self, test, answers, finished=True):
+        test_result = TestResult.objects.create(test=test, user=self.student)
+        for question, answer in zip(test.test_questions.order_by('id'), answers):
+            TestQuestionAnswer.objects.create(test_result=test_result, test_question=question, answer=answer)
+        if finished:
+            test_result.complete()
+        return test_result
+
+    def get_marks(self):
+        task_marks, test_marks = gradebook.get_marks(self.student, [self.task], [self.test])
+        return task_marks[self.task.id], test_marks[self.test.id]
+
+    def test_task_mark(self):
+        '''оценка за задание совпадает с Task.get_mark при загрузке ответа, оценивании и удалении оценки'''
+        self.assertEqual(self.get_marks()[0], None)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task_answer = TaskAnswer.objects.create(task=self.task, student=self.student)
+        self.assertEqual(self.get_marks()[0], None)
+        self.assertTrue(GradebookEntry.objects.filter(user=self.student, task=self.task).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task_answer_mark = TaskAnswerMark.objects.create(task_answer=task_answer, teacher=self.teacher, mark=Decimal(7))
+        self.assertEqual(self.get_marks()[0], Decimal('3.5'))
+        self.assertEqual(self.get_marks()[0], self.task.get_mark(self.student))
+
+        # изменились баллы задания
+        self.task.mark_outer = Decimal(20)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.task.save()
+        self.assertEqual(self.get_marks()[0], Decimal(14))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task_answer_mark.delete()
+        self.assertEqual(self.get_marks()[0], None)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task_answer.delete()
+        self.assertFalse(GradebookEntry.objects.filter(user=self.student, task=self.task).exists())
+
+    def test_task_deadline(self):
+        '''без ответа оценка зависит только от дедлайна'''
+        self.task = self.create_task('задача с прошедшим дедлайном', deadline=-timedelta(minutes=1))
+        self.assertEqual(self.get_marks()[0], Decimal(0))
+        self.assertEqual(self.task.get_mark(self.student), Decimal(0))
+
+    def test_test_mark(self):
+        '''оценка за тест - лучшая завершённая попытка, как в Test.get_user_mark'''
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_attempt(self.test, ['0', '0', '0'])
+        self.assertEqual(self.get_marks()[1], self.test.get_user_mark(self.student).quantize(gradebook.MARK_PLACES))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_attempt(self.test, ['0', '1', '0'])
+        self.assertEqual(self.get_marks()[1], Decimal(10))
+        self.assertEqual(self.get_marks()[1], self.test.get_user_mark(self.student).quantize(gradebook.MARK_PLACES))
+
+        # вопрос удалён: максимум баллов теста изменился
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test.test_questions.order_by('id').last().delete()
+        self.assertEqual(self.get_marks()[1], self.test.get_user_mark(self.student).quantize(gradebook.MARK_PLACES))
+
+        # ручная оценка попытки
+        test_result = TestResult.objects.filter(test=self.test).first()
+        test_result.mark = Decimal(10)
+        with self.captureOnCommitCallbacks(execute=True):
+            test_result.save()
+        self.assertEqual(self.get_marks()[1], Decimal(10))
+
+    def test_test_attempt_timeout(self):
+        '''попытка завершается по времени без изменения БД: запись пересчитывается при чтении после refresh_at'''
+        with self.captureOnCommitCallbacks(execute=True):
+            test_result = self.create_attempt(self.test, ['0', '1', '1'], finished=False)
+        entry = GradebookEntry.objects.get(user=self.student, test=self.test)
+        self.assertEqual(entry.mark, None)
+        self.assertEqual(entry.refresh_at, test_result.start + self.test.duration)
+        self.assertEqual(self.get_marks()[1], None)
+
+        # время попытки вышло
+        TestResult.objects.filter(pk=test_result.pk).update(start=timezone.now() - timedelta(hours=2))
+        GradebookEntry.objects.filter(pk=entry.pk).update(refresh_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(self.get_marks()[1], self.test.get_user_mark(self.student).quantize(gradebook.MARK_PLACES))
+        entry.refresh_from_db()
+        self.assertEqual(entry.refresh_at, None)
+        self.assertEqual(entry.mark, Decimal('6.6667'))
+
+    def test_test_end(self):
+        '''без попыток оценка зависит только от окончания теста'''
+        self.assertEqual(self.get_marks()[1], None)
+
+        self.test = self.create_test('завершённый тест', end=-timedelta(minutes=1))
+        self.assertEqual(self.get_marks()[1], Decimal(0))
+        self.assertEqual(self.test.get_user_mark(self.student), Decimal(0))
+
+    def test_rebuild(self):
+        '''журнал восстанавливается по ответам и попыткам, лишние записи удаляются'''
+        task_answer = TaskAnswer.objects.create(task=self.task, student=self.student)
+        TaskAnswerMark.objects.create(task_answer=task_answer, teacher=self.teacher, mark=Decimal(10))
+        self.create_attempt(self.test, ['0', '1', '0'])
+        GradebookEntry.objects.create(user=self.teacher, task=self.task, mark=Decimal(1))
+
+        call_command('rebuild_gradebook', stdout=mock.Mock())
+        self.assertEqual(self.get_marks(), (Decimal(5), Decimal(10)))
+        self.assertFalse(GradebookEntry.objects.filter(user=self.teacher).exists())
+
+    def test_user_marks_queries(self):
+        '''кол-во запросов страницы оценок не зависит от кол-ва заданий, тестов и попыток'''
+        self.client.force_login(self.student)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get('/marks')
+            self.assertEqual(response.status_code, 200)
+            return len(context.captured_queries)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TaskAnswerMark.objects.create(task_answer=TaskAnswer.objects.create(task=self.task, student=self.student), teacher=self.teacher, mark=Decimal(10))
+            self.create_attempt(self.test, ['0', '1', '0'])
+        queries = count_queries()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                task = self.create_task(f'задача {i}')
+                TaskAnswerMark.objects.create(task_answer=TaskAnswer.objects.create(task=task, student=self.student), teacher=self.teacher, mark=Decimal(i))
+                test = self.create_test(f'тест {i}')
+                self.create_attempt(test, ['0', '1', '0'])
+                self.create_attempt(test, ['1', '1', '0'])
+        self.assertEqual(count_queries(), queries)
+
+        response = self.client.get('/marks')
+        _, _, course_mark, course_mark_max = response.context['courses'][0]
+        self.assertEqual((course_mark, course_mark_max), (Decimal(70), Decimal(90)))
+
+
+@override_settings(JUDGE_MODE='queue')
+@mock.patch('LMS.judge.PYTHON', sys.executable)
+class GradebookJudgeTestCase(TestCase):
+    def test_auto_mark(self):
+        '''автоматическая оценка (bulk_create без сигналов) попадает в журнал'''
+        student = User.objects.create(username='student')
+        course = Course.objects.create(title='курс')
+        task = Task.objects.create(
+            course_element=CourseElement.objects.create(course=course, title='элемент курса'),
+            title='задача',
+            execute_answer=True,
+            deadline_visible=timezone.now() + timedelta(days=1),
+            deadline_true=timezone.now() + timedelta(days=1),
+            mark_outer=Decimal(5),
+            mark_max=Decimal(10),
+            grading_policy='2',
+        )
+        TaskTest.objects.create(task=task, input='1\n', output='2\n', hidden=False)
+        TaskTest.objects.create(task=task, input='5\n', output='7\n', hidden=True)
+
+        task_answer = TaskAnswer.objects.create(task=task, student=student, language='1', code='print(int(input()) + 1)', is_running=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            execute_task_answer(task_answer.id)
+
+        task_marks, _ = gradebook.get_marks(student, [task], [])
+        self.assertEqual(task_marks[task.id], Decimal('2.5'))
+        self.assertEqual(task_marks[task.id], task.get_mark(student))
@@ -0,0 +1,231 @@
+import os
+from argparse import Namespace
+from concurrent.futures import Future
+from datetime import timedelta
+from decimal import Decimal
+from os import mkdir, path
+from tempfile import TemporaryDirectory
+from time import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+import execute_code
+from LMS import spool
+from LMS.celery_tasks import execute_task_answer
+from LMS.health import get_health, heartbeat, reap_judge_jobs
+from LMS.models import Course, CourseElement, JudgeJob, Task, TaskAnswer, TaskTest, TaskTestExecution
+
+
+class HealthTestCase(TestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.course = Course.objects.create(title='курс')
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+        self.task = Task.objects.create(
+            course_element=self.course_element,
+            title='задача',
+            execute_answer=True,
+            deadline_visible=timezone.now() + timedelta(hours=1),
+            deadline_true=timezone.now() + timedelta(hours=1),
+            mark_outer=Decimal(10),
+            mark_max=Decimal(10),
+        )
+        TaskTest.objects.create(task=self.task, input='1\n', output='2\n', hidden=False)
+        TaskTest.objects.create(task=self.task, input='5\n', output='7\n', hidden=True)
+
+        self.students = [ User.objects.create(username=f'student{i}') for i in range(3) ]
+
+    def create_answer(self, student, age=timedelta(minutes=10)):
+        task_answer = TaskAnswer.objects.create(task=self.task, student=student, language='1', code='print(1)', is_running=True)
+        TaskAnswer.objects.filter(pk=task_answer.pk).update(datetime_load=timezone.now() - age)
+        return task_answer
+
+    def create_job(self, task_answer, **kwargs):
+        return JudgeJob.objects.create(task_answer=task_answer, course=self.course, student=task_answer.student, deadline=self.task.deadline_true, **kwargs)
+
+
+@override_settings(JUDGE_MODE='queue', JUDGE_MAX_ATTEMPTS=2, JUDGE_LEASE_TIMEOUT=timedelta(seconds=60))
+class ReapQueueTestCase(HealthTestCase):
+    def test_requeue(self):
+        '''ответ с просроченной арендой возвращается в очередь'''
+        task_answer = self.create_answer(self.students[0])
+        self.create_job(task_answer, state='1', worker='host:1', attempts=1, lease_expires=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(reap_judge_jobs(), { 'requeued': 1, 'failed': 0, 'orphans': 0 })
+        job = JudgeJob.objects.get(task_answer=task_answer)
+        self.assertEqual((job.state, job.worker, job.lease_expires), ('0', '', None))
+
+    def test_fail(self):
+        '''после JUDGE_MAX_ATTEMPTS попыток ответ снимается с проверки'''
+        task_answer = self.create_answer(self.students[0])
+        self.create_job(task_answer, state='1', worker='host:1', attempts=2, lease_expires=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(reap_judge_jobs(), { 'requeued': 0, 'failed': 1, 'orphans': 0 })
+        task_answer.refresh_from_db()
+        self.assertFalse(task_answer.is_running)
+        self.assertFalse(JudgeJob.objects.exists())
+        self.assertEqual(list(TaskTestExecution.objects.filter(task_answer=task_answer).values_list('execution_result', flat=True)), ['7', '7'])
+
+    def test_lease(self):
+        '''ответ с действующей арендой и новый ответ без записи в очереди не трогаются'''
+        task_answer = self.create_answer(self.students[0])
+        self.create_job(task_answer, state='1', worker='host:1', attempts=1, lease_expires=timezone.now() + timedelta(seconds=30))
+        self.create_answer(self.students[1], age=timedelta())
+
+        self.assertEqual(reap_judge_jobs(), { 'requeued': 0, 'failed': 0, 'orphans': 0 })
+        self.assertEqual(JudgeJob.objects.get(task_answer=task_answer).state, '1')
+
+    def test_orphan(self):
+        '''ответ с is_running=True без записи в очереди снимается с проверки'''
+        task_answer = self.create_answer(self.students[0])
+
+        self.assertEqual(reap_judge_jobs(), { 'requeued': 0, 'failed': 0, 'orphans': 1 })
+        task_answer.refresh_from_db()
+        self.assertFalse(task_answer.is_running)
+
+    @mock.patch('LMS.celery_tasks.schedule_judge_jobs')
+    def test_finish(self, schedule_judge_jobs):
+        '''после проверки запись удаляется, даже если проверка завершилась ошибкой'''
+        task_answer = self.create_answer(self.students[0])
+        self.create_job(task_answer, state='1', attempts=1)
+
+        with mock.patch('LMS.celery_tasks._execute_task_answer', side_effect=OSError('judge')):
+            with self.assertRaises(OSError):
+                execute_task_answer(task_answer.id)
+        self.assertFalse(JudgeJob.objects.exists())
+
+    @mock.patch('LMS.celery_tasks.schedule_judge_jobs')
+    def test_finish_reassigned(self, schedule_judge_jobs):
+        '''аренда просрочена, ответ вернулся в очередь и проверяется другим процессом: его запись не удаляется'''
+        task_answer = self.create_answer(self.students[0])
+        self.create_job(task_answer, state='1', attempts=1)
+
+        def reassign(*args):
+            # reap_judge_jobs вернул ответ в очередь, его взял процесс host:2
+            JudgeJob.objects.filter(task_answer=task_answer).update(worker='host:2', attempts=2, lease_expires=timezone.now() + timedelta(seconds=30))
+
+        with mock.patch('LMS.celery_tasks._execute_task_answer', side_effect=reassign):
+            execute_task_answer(task_answer.id)
+        self.assertEqual(JudgeJob.objects.get(task_answer=task_answer).worker, 'host:2')
+
+    def test_health(self):
+        ''''''
+        heartbeat('host:1')
+        self.create_job(self.create_answer(self.students[0]), state='1', lease_expires=timezone.now() + timedelta(seconds=30))
+        self.create_job(self.create_answer(self.students[1]), state='1', lease_expires=timezone.now() - timedelta(seconds=30))
+        self.create_job(self.create_answer(self.students[2]))
+
+        health = get_health()
+        self.assertEqual((health['workers'], health['leases'], health['expired_leases']), (1, 1, 1))
+        self.assertLess(health['pending_age'], 60)
+
+
+@override_settings(JUDGE_MODE='spool', JUDGE_MAX_ATTEMPTS=2, JUDGE_LEASE_TIMEOUT=timedelta(seconds=60))
+class ReapSpoolTestCase(HealthTestCase):
+    def setUp(self):
+        super().setUp()
+        self.spool_dir = TemporaryDirectory()
+        self.result_dir = TemporaryDirectory()
+        self.settings_override = override_settings(JUDGE_SPOOL_DIR=self.spool_dir.name, JUDGE_SPOOL_RESULT_DIR=self.result_dir.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.spool_dir.cleanup()
+        self.result_dir.cleanup()
+
+    def create_dir(self, task_answer, worker=None, attempt=1, age=0):
+        dir_path = path.join(self.spool_dir.name, f'{task_answer.id}+')
+        mkdir(dir_path)
+        if worker is not None:
+            self.assertTrue(spool.claim(dir_path, worker, 60))
+            for _ in range(attempt - 1):
+                spool.claim(dir_path, worker, 60)
+            os.utime(path.join(dir_path, spool.LEASE_FILE), (time() - age, time() - age))
+        return dir_path
+
+    def test_claim(self):
+        '''каталог с действующей арендой другого процесса не берётся, с просроченной - берётся со следующей попыткой'''
+        dir_path = self.create_dir(self.create_answer(self.students[0]), worker='host:1')
+        self.assertFalse(spool.claim(dir_path, 'host:2', 60))
+
+        os.utime(path.join(dir_path, spool.LEASE_FILE), (time() - 61, time() - 61))
+        self.assertTrue(spool.claim(dir_path, 'host:2', 60))
+        self.assertEqual(spool.read_lease(dir_path)[0], { 'worker': 'host:2', 'attempt': 2 })
+
+    def test_write_results_error(self):
+        '''запуск завершился ошибкой: аренда каталога больше не продлевается, каталог остаётся необработанным'''
+        dir = f'{self.create_answer(self.students[0]).id}+'
+        mkdir(path.join(self.spool_dir.name, dir))
+        in_progress = { dir }
+        future = Future()
+        future.set_exception(OSError('popen'))
+
+        with self.assertRaises(OSError):
+            execute_code.write_results(self.spool_dir.name, self.result_dir.name, dir, ['0'], future, in_progress)
+        self.assertEqual(in_progress, set())
+        self.assertTrue(path.isdir(path.join(self.spool_dir.name, dir)))
+        self.assertEqual(os.listdir(self.result_dir.name), [])
+
+    def handle_dir(self, dir, pool):
+        quarantine_dir = path.join(self.result_dir.name, 'quarantine')
+        args = Namespace(spool_dir=self.spool_dir.name, result_dir=self.result_dir.name, quarantine_dir=quarantine_dir, lease_timeout=60)
+        in_progress = set()
+        execute_code.handle_dir(pool, args, dir, 'host:1', in_progress)
+        return in_progress
+
+    def test_handle_dir_without_limits(self):
+        '''в каталоге, записанном до появления limits.json, код на python выполняется с ограничениями по умолчанию'''
+        dir = f'{self.create_answer(self.students[0]).id}+'
+        dir_path = path.join(self.spool_dir.name, dir)
+        mkdir(dir_path)
+        for name, content in (('0', '1\n'), ('code.py', 'print(1)')):
+            with open(path.join(dir_path, name), 'wt') as fout:
+                fout.write(content)
+
+        pool = mock.Mock()
+        self.assertEqual(self.handle_dir(dir, pool), { dir })
+        pool.submit.assert_called_once_with(path.join(dir_path, 'code.py'), ['1\n'], 1, 256, accepted=None, language='1')
+
+    def test_handle_dir_quarantine(self):
+        '''каталог, который не удалось прочитать, переносится в карантин, а не останавливает execute_code.py'''
+        dir = f'{self.create_answer(self.students[0]).id}+'
+        mkdir(path.join(self.spool_dir.name, dir))
+        with open(path.join(self.spool_dir.name, dir, 'limits.json'), 'wt') as fout:
+            fout.write('{')
+
+        pool = mock.Mock()
+        with mock.patch('sys.stderr') as stderr:
+            self.assertEqual(self.handle_dir(dir, pool), set())
+        self.assertTrue(stderr.write.called)
+        pool.submit.assert_not_called()
+        self.assertFalse(path.exists(path.join(self.spool_dir.name, dir)))
+        self.assertEqual(os.listdir(path.join(self.result_dir.name, 'quarantine')), [f'spool-{dir[:-1]}'])
+
+    def test_reap(self):
+        '''каталог после JUDGE_MAX_ATTEMPTS попыток и ответ без каталога снимаются с проверки'''
+        failed = self.create_answer(self.students[0])
+        failed_dir = self.create_dir(failed, worker='host:1', attempt=2, age=61)
+        retried = self.create_answer(self.students[1])
+        self.create_dir(retried, worker='host:1', attempt=1, age=61)
+        orphan = self.create_answer(self.students[2])
+
+        self.assertEqual(reap_judge_jobs(), { 'requeued': 0, 'failed': 1, 'orphans': 1 })
+        self.assertFalse(path.exists(failed_dir))
+        self.assertEqual(
+            dict(TaskAnswer.objects.values_list('id', 'is_running')),
+            { failed.id: False, retried.id: True, orphan.id: False },
+        )
+
+    def test_health(self):
+        ''''''
+        spool.write_heartbeat(self.spool_dir.name, 'host:1', { 'in_progress': 1 })
+        self.create_dir(self.create_answer(self.students[0]), worker='host:1')
+        self.create_dir(self.create_answer(self.students[1]), worker='host:1', age=61)
+        self.create_dir(self.create_answer(self.students[2]))
+
+        health = get_health()
+        self.assertEqual((health['workers'], health['leases'], health['expired_leases']), (1, 1, 1))
@@ -0,0 +1,508 @@
+import os
+import pwd
+import shutil
+import sys
+from datetime import timedelta
+from decimal import Decimal
+import json
+from os import listdir, mkdir, path
+from tempfile import TemporaryDirectory
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from LMS.celery_tasks import execute_task_answer, ingest_results, judge_status
+from LMS.forkserver import ForkServer
+from LMS.checkers import output_checker
+from LMS.judge import JudgePool, SandboxError, run_code, run_tests
+from LMS.models import Course, CourseElement, Task, TaskAnswer, TaskAnswerMark, TaskTest, TaskTestExecution
+
+# программы на C выполняются только от пользователя песочницы: для перехода к нему тесты запускаются от root
+SANDBOX_USER = 'nobody'
+can_sandbox = shutil.which('gcc') and os.geteuid() == 0
+
+
+# код запускается текущим интерпретатором, чтобы тесты не зависели от python3.9 в системе
+@mock.patch('LMS.judge.PYTHON', sys.executable)
+class ExecuteTaskAnswerTestCase(TestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.course = Course.objects.create(title='курс')
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+        self.task = Task.objects.create(
+            course_element=self.course_element,
+            title='задача',
+            execute_answer=True,
+            deadline_visible=timezone.now() + timedelta(hours=1),
+            deadline_true=timezone.now() + timedelta(hours=1),
+            mark_outer=Decimal(10),
+            mark_max=Decimal(10),
+        )
+        self.student = User.objects.create(username='student')
+        self.course.students.add(self.student)
+
+        self.task_test_1 = TaskTest.objects.create(task=self.task, input='1\n', output='2\n', hidden=False)
+        self.task_test_2 = TaskTest.objects.create(task=self.task, input='5\n', output='7\n', hidden=True)
+
+    def test_execute(self):
+        '''код и тесты берутся из БД, результаты записываются в TaskTestExecution'''
+        task_answer = TaskAnswer.objects.create(
+            task=self.task,
+            student=self.student,
+            language='1',
+            code='print(int(input()) + 1)',
+            is_running=True,
+        )
+
+        execute_task_answer(task_answer.id)
+
+        task_answer.refresh_from_db()
+        self.assertFalse(task_answer.is_running)
+
+        executions = TaskTestExecution.objects.filter(task_answer=task_answer).order_by('task_test_id')
+        self.assertEqual([ x.task_test_id for x in executions ], [self.task_test_1.id, self.task_test_2.id])
+        self.assertEqual([ x.stdout for x in executions ], ['2\n', '6\n'])
+        self.assertEqual([ x.execution_result for x in executions ], ['0', '1'])
+        self.assertTrue(all(x.returncode == 0 and x.memory_Kbyte > 0 for x in executions))
+
+    def execute_code(self, code):
+        task_answer = TaskAnswer.objects.create(task=self.task, student=self.student, language='1', code=code, is_running=True)
+        execute_task_answer(task_answer.id)
+        return list(TaskTestExecution.objects.filter(task_answer=task_answer))
+
+    def test_time_limit(self):
+        '''бесконечный цикл снимается по Task.limit_time'''
+        self.task.limit_time = timedelta(seconds=1)
+        self.task.save()
+
+        executions = self.execute_code('while True:\n    pass')
+        self.assertEqual([ x.execution_result for x in executions ], ['2', '2'])
+        self.assertTrue(all(timedelta(seconds=0.9) <= x.cpu_duration for x in executions))
+
+    def test_execution_error(self):
+        '''ненулевой код возврата'''
+        executions = self.execute_code('raise ValueError')
+        self.assertEqual([ x.execution_result for x in executions ], ['5', '5'])
+        self.assertTrue(all(x.returncode == 1 and 'ValueError' in x.stderr for x in executions))
+
+    def test_fail_fast(self):
+        '''после первого непройденного теста остальные пропускаются'''
+        self.task.fail_fast = True
+        self.task.save()
+        TaskTest.objects.create(task=self.task, input='7\n', output='8\n', hidden=True)
+
+        executions = self.execute_code('print(int(input()) + 1)')
+        self.assertEqual([ x.execution_result for x in sorted(executions, key=lambda x: x.task_test_id) ], ['0', '1', '8'])
+
+    def test_long_output(self):
+        '''сохраняются первые 1000 символов вывода и признак обрезки'''
+        executions = self.execute_code('print("x" * 2000)')
+        self.assertEqual([ (len(x.stdout), x.stdout_truncated, x.execution_result) for x in executions ], [(1000, True, '1'), (1000, True, '1')])
+
+    @skipUnless(can_sandbox, 'gcc is not installed or tests are not run as root')
+    def test_compiled_language(self):
+        '''ответ на C компилируется один раз, время компиляции записывается отдельно от времени работы'''
+        code = '#include <stdio.h>\nint main(void) { int n; scanf("%d", &n); printf("%d\\n", n + 1); return 0; }'
+        pool = JudgePool(workers=2, user=SANDBOX_USER)
+        with TemporaryDirectory() as cache_dir, mock.patch('LMS.judge.COMPILE_CACHE_DIR', cache_dir), mock.patch('LMS.celery_tasks.get_judge_pool', return_value=pool):
+            os.chmod(cache_dir, 0o711)
+            task_answer = TaskAnswer.objects.create(task=self.task, student=self.student, language='2', code=code, is_running=True)
+            execute_task_answer(task_answer.id)
+            self.assertEqual(len(listdir(cache_dir)), 1)
+        pool.shutdown()
+
+        executions = TaskTestExecution.objects.filter(task_answer=task_answer).order_by('task_test_id')
+        self.assertEqual([ x.execution_result for x in executions ], ['0', '1'])
+        self.assertEqual(len({ x.compile_duration for x in executions }), 1)
+        self.assertLess(timedelta(), executions[0].compile_duration)
+
+    def test_deleted_task_answer(self):
+        '''ответ удалили пока он ждал в очереди'''
+        execute_task_answer(-1)
+        self.assertFalse(TaskTestExecution.objects.exists())
+
+
+@mock.patch('LMS.judge.PYTHON', sys.executable)
+class JudgePoolTestCase(SimpleTestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.dir = TemporaryDirectory()
+        self.pool = JudgePool(workers=2, cpus=[0], max_submissions=1)
+
+    def tearDown(self):
+        self.pool.shutdown()
+        self.dir.cleanup()
+
+    def write_code(self, code):
+        code_path = path.join(self.dir.name, f'{abs(hash(code))}.py')
+        with open(code_path, 'wt') as fout:
+            fout.write(code)
+        return code_path
+
+    def test_run_tests_order(self):
+        '''тесты выполняются параллельно, выводы возвращаются в порядке тестов'''
+        code_path = self.write_code('print(int(input()) * 2)')
+        results = self.pool.run_tests(code_path, [ f'{i}\n' for i in range(5) ])
+        self.assertEqual([ x['stdout'] for x in results ], [ f'{i * 2}\n' for i in range(5) ])
+
+    def test_submit_backpressure(self):
+        '''пока пул занят, новый ответ не принимается'''
+        slow = self.write_code('import time\ntime.sleep(0.5)\nprint(1)')
+        fast = self.write_code('print(2)')
+
+        future = self.pool.submit(slow, [''])
+        self.assertTrue(self.pool.is_saturated())
+        self.assertIsNone(self.pool.submit(fast, [''], timeout=0.01))
+
+        self.assertEqual([ x['stdout'] for x in future.result() ], ['1\n'])
+        self.assertEqual([ x['stdout'] for x in self.pool.submit(fast, [''], timeout=1).result() ], ['2\n'])
+
+    def test_memory_limit(self):
+        '''программа превышает ограничение по памяти'''
+        code_path = self.write_code('x = bytearray(512 * 1024 * 1024)')
+        results = self.pool.run_tests(code_path, [''], limit_time=1, limit_memory_Mbyte=64)
+        self.assertEqual(results[0]['execution_result'], '3')
+
+    def test_run_tests_fail_fast(self):
+        '''результаты тестов после первого непройденного заменяются на None'''
+        code_path = self.write_code('print(int(input()) * 2)')
+        inputs = [ f'{i}\n' for i in range(5) ]
+        outputs = ['0\n', '2\n', '5\n', '6\n', '8\n']
+
+        results = self.pool.run_tests(code_path, inputs, accepted=output_checker([ { 'output': x, 'checker': '0', 'tolerance': 0 } for x in outputs ]))
+        self.assertEqual([ x and x['stdout'] for x in results ], ['0\n', '2\n', '4\n', None, None])
+
+
+@skipUnless(can_sandbox, 'gcc is not installed or tests are not run as root')
+class CompileTestCase(SimpleTestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.dir = TemporaryDirectory()
+        self.cache_dir = TemporaryDirectory()
+        os.chmod(self.cache_dir.name, 0o711)
+        patcher = mock.patch('LMS.judge.COMPILE_CACHE_DIR', self.cache_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.dir.cleanup()
+        self.cache_dir.cleanup()
+
+    def write_code(self, code):
+        code_path = path.join(self.dir.name, 'code.c')
+        with open(code_path, 'wt') as fout:
+            fout.write(code)
+        return code_path
+
+    def test_compile_cache(self):
+        '''тесты одного ответа и повторный ответ с тем же кодом используют одну скомпилированную программу'''
+        code_path = self.write_code('#include <stdio.h>\nint main(void) { int n; scanf("%d", &n); printf("%d\\n", n * 2); return 0; }')
+        pool = JudgePool(workers=2, cpus=[0], user=SANDBOX_USER)
+        try:
+            results = pool.run_tests(code_path, [ f'{i}\n' for i in range(4) ], language='2')
+            again = pool.run_tests(code_path, ['5\n'], language='2')
+        finally:
+            pool.shutdown()
+
+        self.assertEqual([ x['stdout'] for x in results ], [ f'{i * 2}\n' for i in range(4) ])
+        self.assertTrue(all(x['compile_duration'] == results[0]['compile_duration'] and 0 < x['compile_duration'] for x in results))
+        self.assertEqual((again[0]['stdout'], again[0]['compile_duration']), ('10\n', 0))
+        self.assertEqual(len(listdir(self.cache_dir.name)), 1)
+
+    def test_compile_error(self):
+        '''код не скомпилировался: у всех тестов результат compile error и сообщение компилятора'''
+        results = run_tests(self.write_code('int main(void) { return x; }'), ['1\n', '2\n'], language='2', user=SANDBOX_USER)
+        self.assertEqual([ x['execution_result'] for x in results ], ['4', '4'])
+        self.assertIn('code.c', results[0]['stderr'])
+        self.assertFalse(listdir(self.cache_dir.name))
+
+    def test_limits(self):
+        '''скомпилированная программа выполняется с теми же ограничениями'''
+        results = run_tests(self.write_code('int main(void) { for (;;); }'), [''], limit_time=1, language='2', user=SANDBOX_USER)
+        self.assertEqual(results[0]['execution_result'], '2')
+
+    def test_sandbox_required(self):
+        '''без пользователя песочницы код на C не компилируется и не запускается'''
+        with self.assertRaises(SandboxError):
+            run_tests(self.write_code('int main(void) { return 0; }'), [''], language='2')
+        self.assertFalse(listdir(self.cache_dir.name))
+
+    def test_sandbox(self):
+        '''программа выполняется от пользователя песочницы в пустом каталоге, без файлов и окружения рабочего процесса'''
+        code = '\n'.join([
+            '#define _POSIX_C_SOURCE 200809L',
+            '#include <stdio.h>',
+            '#include <stdlib.h>',
+            '#include <unistd.h>',
+            'int main(void) {',
+            '    char cwd[4096];',
+            '    getcwd(cwd, sizeof(cwd));',
+            f'    printf("%d %d %s %s\\n", (int)getuid(), fopen("{os.path.abspath(__file__)}", "r") != NULL, getenv("DJANGO_SETTINGS_MODULE") ? "env" : "-", cwd);',
+            '    return 0;',
+            '}',
+        ])
+        results = run_tests(self.write_code(code), [''], language='2', user=SANDBOX_USER)
+        uid, readable, env, cwd = results[0]['stdout'].split()
+        self.assertEqual((int(uid), readable, env), (pwd.getpwnam(SANDBOX_USER).pw_uid, '0', '-'))
+        self.assertNotEqual(cwd, self.dir.name)
+        self.assertFalse(os.path.exists(cwd))
+
+    def test_process_limit(self):
+        '''fork bomb упирается в RLIMIT_NPROC, оставшиеся процессы снимаются вместе с программой'''
+        code = '\n'.join([
+            '#define _POSIX_C_SOURCE 200809L',
+            '#include <stdio.h>',
+            '#include <unistd.h>',
+            'int main(void) {',
+            '    int failed = 0;',
+            '    for (int i = 0; i < 200; i++) {',
+            '        pid_t pid = fork();',
+            '        if (pid == 0) { pause(); return 0; }',
+            '        failed += pid < 0;',
+            '    }',
+            '    printf("%d\\n", 0 < failed);',
+            '    return 0;',
+            '}',
+        ])
+        results = run_tests(self.write_code(code), [''], limit_time=2, language='2', user=SANDBOX_USER)
+        self.assertEqual((results[0]['stdout'], results[0]['execution_result']), ('1\n', None))
+        self.assertLess(results[0]['duration'], 2)
+
+
+@mock.patch('LMS.judge.PYTHON', sys.executable)
+class SandboxTestCase(SimpleTestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.dir = TemporaryDirectory()
+        self.code_path = path.join(self.dir.name, 'code.py')
+        with open(self.code_path, 'wt') as fout:
+            fout.write('import os\nprint(os.getcwd(), sorted(os.listdir()), sorted(os.environ))\nopen("big", "wb").write(bytes(32 * 1024 * 1024))')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def check(self, result):
+        cwd, listing, env = result['stdout'].split(' ', 2)
+        self.assertNotEqual(cwd, os.getcwd())
+        self.assertFalse(os.path.exists(cwd))
+        self.assertEqual(listing, "['code.py']")
+        self.assertNotIn('DJANGO_SETTINGS_MODULE', env)
+        # RLIMIT_FSIZE
+        self.assertEqual(result['execution_result'], '5')
+
+    @mock.patch.dict(os.environ, { 'DJANGO_SETTINGS_MODULE': 'project.settings' })
+    def test_run_code(self):
+        '''программа на python выполняется в пустом временном каталоге с копией кода и без окружения рабочего процесса'''
+        self.check(run_code(self.code_path, ''))
+
+    @mock.patch.dict(os.environ, { 'DJANGO_SETTINGS_MODULE': 'project.settings' })
+    def test_forkserver(self):
+        forkserver = ForkServer()
+        try:
+            self.check(forkserver.run_code(self.code_path, ''))
+        finally:
+            forkserver.close()
+
+
+@mock.patch('LMS.judge.PYTHON', sys.executable)
+@mock.patch('LMS.judge.OUTPUT_LIMIT', 1024)
+class OutputLimitTestCase(SimpleTestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.dir = TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_program(self, code, **kwargs):
+        code_path = path.join(self.dir.name, 'code.py')
+        with open(code_path, 'wt') as fout:
+            fout.write(code)
+        return run_code(code_path, '', **kwargs)
+
+    def test_output_limit(self):
+        '''программа, которая выводит без остановки, снимается сразу после превышения OUTPUT_LIMIT, а не по времени'''
+        result = self.run_program('while True:\n    print("x" * 100)', limit_time=5)
+        self.assertEqual(result['execution_result'], '9')
+        self.assertTrue(result['stdout_truncated'])
+        self.assertEqual(result['stdout'], (('x' * 100 + '\n') * 11)[:1024])
+        self.assertLess(result['duration'], 5)
+
+    def test_within_limit(self):
+        result = self.run_program('print("x" * 1000)')
+        self.assertEqual((result['stdout'], result['stdout_truncated'], result['execution_result']), ('x' * 1000 + '\n', False, None))
+
+    def test_stderr_tail(self):
+        '''от stderr остаются последние OUTPUT_LIMIT байт'''
+        result = self.run_program('import sys\nfor i in range(1000):\n    print(i, file=sys.stderr)\nraise ValueError("end")')
+        self.assertEqual(result['execution_result'], '5')
+        self.assertLessEqual(len(result['stderr']), 1024)
+        self.assertTrue(result['stderr'].endswith('ValueError: end\n'))
+        self.assertFalse(result['stdout_truncated'])
+
+
+@mock.patch('LMS.judge.PYTHON', sys.executable)
+class ForkServerTestCase(SimpleTestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.dir = TemporaryDirectory()
+        self.forkserver = ForkServer(['math'])
+
+    def tearDown(self):
+        self.forkserver.close()
+        self.dir.cleanup()
+
+    def write_code(self, code):
+        code_path = path.join(self.dir.name, f'{abs(hash(code))}.py')
+        with open(code_path, 'wt') as fout:
+            fout.write(code)
+        return code_path
+
+    def test_run_code(self):
+        '''результаты совпадают с запуском нового интерпретатора'''
+        result = self.forkserver.run_code(self.write_code('import math\nprint(math.factorial(int(input())))'), '5\n')
+        self.assertEqual((result['stdout'], result['returncode'], result['execution_result']), ('120\n', 0, None))
+
+        result = self.forkserver.run_code(self.write_code('import sys\nsys.exit(3)'), '')
+        self.assertEqual((result['returncode'], result['execution_result']), (3, '5'))
+
+    def test_limits(self):
+        '''ограничения применяются в дочернем процессе, сервер продолжает работать'''
+        result = self.forkserver.run_code(self.write_code('while True:\n    pass'), '', limit_time=1)
+        self.assertEqual(result['execution_result'], '2')
+
+        result = self.forkserver.run_code(self.write_code('x = bytearray(512 * 1024 * 1024)'), '', limit_memory_Mbyte=64)
+        self.assertEqual(result['execution_result'], '3')
+
+        result = self.forkserver.run_code(self.write_code('print(1)'), '')
+        self.assertEqual(result['stdout'], '1\n')
+
+    def test_restart(self):
+        '''завершившийся сервер запускается заново'''
+        code_path = self.write_code('print(1)')
+        self.forkserver.run_code(code_path, '')
+        self.forkserver._process.kill()
+        self.assertEqual(self.forkserver.run_code(code_path, '')['stdout'], '1\n')
+
+    def test_pool(self):
+        '''пул с preload выполняет тесты через fork server'''
+        pool = JudgePool(workers=2, cpus=[0], preload=['math'])
+        try:
+            results = pool.run_tests(self.write_code('print(int(input()) * 2)'), [ f'{i}\n' for i in range(4) ])
+        finally:
+            pool.shutdown()
+        self.assertEqual([ x['stdout'] for x in results ], [ f'{i * 2}\n' for i in range(4) ])
+
+
+class IngestResultsTestCase(TestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.dir = TemporaryDirectory()
+        self.result_dir = path.join(self.dir.name, 'executed')
+        self.quarantine_dir = path.join(self.dir.name, 'quarantine')
+        mkdir(self.result_dir)
+        mkdir(self.quarantine_dir)
+
+        self.settings_override = override_settings(
+            JUDGE_MODE='spool',
+            JUDGE_SPOOL_RESULT_DIR=self.result_dir,
+            JUDGE_SPOOL_QUARANTINE_DIR=self.quarantine_dir,
+        )
+        self.settings_override.enable()
+
+        self.course = Course.objects.create(title='курс')
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+        self.task = Task.objects.create(
+            course_element=self.course_element,
+            title='задача',
+            execute_answer=True,
+            deadline_visible=timezone.now() + timedelta(hours=1),
+            deadline_true=timezone.now() + timedelta(hours=1),
+            mark_outer=Decimal(10),
+            mark_max=Decimal(10),
+        )
+        self.task_test_1 = TaskTest.objects.create(task=self.task, input='1\n', output='2\n', hidden=False)
+        self.task_test_2 = TaskTest.objects.create(task=self.task, input='5\n', output='6\n', hidden=True)
+
+        self.task_answers = []
+        for i in range(3):
+            student = User.objects.create(username=f'student{i}')
+            self.course.students.add(student)
+            self.task_answers.append(TaskAnswer.objects.create(task=self.task, student=student, language='1', code='', is_running=True))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.dir.cleanup()
+
+    def write_results(self, dir, results):
+        dir_path = path.join(self.result_dir, dir)
+        mkdir(dir_path)
+        for filename, result in results.items():
+            with open(path.join(dir_path, filename), 'wt') as fout:
+                fout.write(result if isinstance(result, str) else json.dumps(result))
+
+    def result(self, stdout):
+        return { 'stdout': stdout, 'stderr': '', 'returncode': 0, 'execution_result': None, 'duration': 0.01, 'cpu_time': 0.01, 'memory_Kbyte': 1024 }
+
+    def test_ingest(self):
+        '''результаты нескольких ответов заносятся одной партией, неполный набор (fail fast) допустим'''
+        self.write_results(f'{self.task_answers[0].id}+', { '0': self.result('2\n'), '1': self.result('6\n') })
+        self.write_results(f'{self.task_answers[1].id}+', { '0': self.result('3\n') })
+
+        with self.assertNumQueries(8):
+            self.assertEqual(ingest_results(), 2)
+
+        executions = TaskTestExecution.objects.order_by('task_answer_id', 'task_test_id')
+        self.assertEqual([ x.execution_result for x in executions ], ['0', '0', '1', '8'])
+        self.assertFalse(TaskAnswer.objects.filter(pk__in=[self.task_answers[0].id, self.task_answers[1].id], is_running=True).exists())
+        self.assertEqual(sorted(listdir(self.result_dir)), sorted([ str(self.task_answers[0].id), str(self.task_answers[1].id) ]))
+
+    def test_idempotent(self):
+        '''повторное занесение тех же результатов (сбой до переименования каталога) не создаёт дубликатов'''
+        results = { '0': self.result('2\n'), '1': self.result('5\n') }
+        self.write_results(f'{self.task_answers[0].id}+', results)
+        ingest_results()
+        self.write_results(f'{self.task_answers[0].id}+', results)
+        ingest_results()
+
+        executions = TaskTestExecution.objects.filter(task_answer=self.task_answers[0]).order_by('task_test_id')
+        self.assertEqual([ x.execution_result for x in executions ], ['0', '1'])
+        self.assertEqual(listdir(self.result_dir), [ str(self.task_answers[0].id) ])
+
+    def test_grading_policy(self):
+        '''автоматические оценки ставятся партией, оценка преподавателя не меняется'''
+        self.task_test_2.weight = 3
+        self.task_test_2.save()
+        teacher = User.objects.create(username='teacher')
+        TaskAnswerMark.objects.create(task_answer=self.task_answers[2], teacher=teacher, mark=Decimal(1))
+
+        for grading_policy, marks in [('0', []), ('1', [Decimal(0), Decimal(0)]), ('2', [Decimal(5), Decimal(5)]), ('3', [Decimal('7.5'), Decimal('2.5')])]:
+            self.task.grading_policy = grading_policy
+            self.task.save()
+
+            # первый ответ проходит только второй тест, второй - только первый
+            self.write_results(f'{self.task_answers[0].id}+', { '0': self.result('1\n'), '1': self.result('6\n') })
+            self.write_results(f'{self.task_answers[1].id}+', { '0': self.result('2\n'), '1': self.result('1\n') })
+            self.write_results(f'{self.task_answers[2].id}+', { '0': self.result('2\n'), '1': self.result('6\n') })
+            ingest_results()
+
+            auto_marks = TaskAnswerMark.objects.filter(teacher__isnull=True).order_by('task_answer_id')
+            self.assertEqual([ x.mark for x in auto_marks ], marks)
+            self.assertEqual(TaskAnswerMark.objects.get(task_answer=self.task_answers[2]).mark, Decimal(1))
+
+    def test_quarantine(self):
+        '''некорректные каталоги переносятся в карантин, остальные заносятся'''
+        self.write_results('abc+', {})
+        self.write_results(f'{self.task_answers[0].id}+', { '0': 'not json' })
+        self.write_results(f'{self.task_answers[1].id}+', { '5': self.result('') })
+        self.write_results(f'{self.task_answers[2].id}+', { '0': self.result('2\n'), '1': self.result('6\n') })
+
+        self.assertEqual(judge_status()['results_waiting'], 4)
+        self.assertEqual(ingest_results(), 4)
+
+        self.assertEqual(sorted(listdir(self.quarantine_dir)), sorted(['abc', str(self.task_answers[0].id), str(self.task_answers[1].id)]))
+        self.assertEqual(TaskTestExecution.objects.filter(task_answer=self.task_answers[2]).count(), 2)
+        self.assertEqual(judge_status()['results_waiting'], 0)
+        self.assertEqual(judge_status()['quarantined'], 3)
@@ -0,0 +1,108 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from LMS import membership
+from LMS.models import Course, CourseElement, Task, Test, TestQuestion, TestQuestionAnswer, TestResult
+
+
+def membership_queries(context):
+    '''запросы к таблицам связей курсов с пользователями'''
+    tables = ('lms_course_owners', 'lms_course_students', 'lms_course_excluded')
+    return [ x['sql'] for x in context.captured_queries if any(table in x['sql'].lower() for table in tables) ]
+
+
+class MembershipTestCase(TestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.teacher = User.objects.create(username='teacher')
+        self.student = User.objects.create(username='student')
+        self.other = User.objects.create(username='other')
+
+        self.course = Course.objects.create(title='курс')
+        self.course.owners.add(self.teacher)
+        self.course.students.add(self.student)
+        self.course.excluded.add(self.other)
+        self.other_course = Course.objects.create(title='другой курс')
+
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+        self.task = Task.objects.create(
+            course_element=self.course_element,
+            title='задача',
+            deadline_visible=timezone.now() + timedelta(days=1),
+            deadline_true=timezone.now() + timedelta(days=1),
+            mark_outer=Decimal(5),
+            mark_max=Decimal(10),
+        )
+
+    def test_membership(self):
+        ''''''
+        self.assertEqual(membership.get_membership(self.teacher).owner, { self.course.id })
+        self.assertEqual(membership.get_membership(self.student).student, { self.course.id })
+        self.assertEqual(membership.get_membership(self.other).excluded, { self.course.id })
+        self.assertIs(membership.get_membership(None), membership.EMPTY)
+
+    def test_queries(self):
+        '''повторные проверки прав одного пользователя - один запрос'''
+        user = User.objects.get(pk=self.teacher.pk)
+        with self.assertNumQueries(1):
+            for course in (self.course, self.other_course):
+                course.can_edit(user)
+                course.is_subscriber(user)
+                membership.is_excluded(user, course.id)
+            self.assertTrue(self.course.can_edit(user))
+            self.assertFalse(self.other_course.can_edit(user))
+            self.assertFalse(self.course.is_subscriber(user))
+
+    def test_invalidate(self):
+        '''изменение связей видно сразу'''
+        user = User.objects.get(pk=self.student.pk)
+        self.assertFalse(self.other_course.is_subscriber(user))
+
+        self.other_course.students.add(self.student)
+        self.assertTrue(self.other_course.is_subscriber(user))
+
+        self.other_course.students.remove(self.student)
+        self.assertFalse(self.other_course.is_subscriber(user))
+
+        self.course.owners.add(self.student)
+        self.assertTrue(self.course.can_edit(user))
+        self.course.owners.clear()
+        self.assertFalse(self.course.can_edit(user))
+
+    def test_task_view_queries(self):
+        '''страница задания: членство загружается один раз за запрос'''
+        for user, status_code in ((self.student, 200), (self.teacher, 403), (self.other, 403)):
+            self.client.force_login(user)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(f'/task/{self.task.id}')
+            self.assertEqual(response.status_code, status_code)
+            self.assertEqual(len(membership_queries(context)), 1)
+
+    def test_api_test_question_answer_queries(self):
+        '''API ответа на вопрос теста: проверки прав без запросов к связям курса сверх одного'''
+        test = Test.objects.create(
+            course_element=self.course_element,
+            title='тест',
+            mark_outer=Decimal(10),
+            test_type='one',
+            start=timezone.now() - timedelta(hours=1),
+            end=timezone.now() + timedelta(days=1),
+            duration=timedelta(hours=1),
+        )
+        test_question = TestQuestion.objects.create(test=test, question_text='баг или фича?', max_mark=Decimal(1), answer_type='one', answer_values='баг\nфича', answer_true='1')
+        test_result = TestResult.objects.create(test=test, user=self.student)
+        test_question_answer = TestQuestionAnswer.objects.create(test_result=test_result, test_question=test_question, answer='')
+
+        token = Token.objects.create(user=self.student)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/api-lms/test-question-answer/{test_question_answer.id}/', HTTP_AUTHORIZATION='Token ' + token.key)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(membership_queries(context)), 1)
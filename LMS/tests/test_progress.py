@@ -0,0 +1,124 @@
+import json
+import sys
+from datetime import timedelta
+from decimal import Decimal
+from threading import Timer
+from time import monotonic
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from LMS import progress
+from LMS.celery_tasks import execute_task_answer
+from LMS.models import Course, CourseElement, Task, TaskAnswer, TaskTest
+
+
+def parse_stream(chunks) -> list:
+    '''события server-sent events в виде словарей'''
+    return [ json.loads(line[len('data: '):]) for chunk in chunks for line in chunk.split('\n') if line.startswith('data: ') ]
+
+
+class LocalBackendTestCase(TestCase):
+    def test_history(self):
+        '''события, опубликованные до запроса, отдаются сразу'''
+        backend = progress.LocalBackend()
+        backend.publish('channel', { 'event': 'start', 'tests': 2 })
+        backend.publish('channel', { 'event': 'test', 'test': 0, 'execution_result': '0' })
+
+        events, count = backend.wait('channel', 0, 5)
+        self.assertEqual(([ x['event'] for x in events ], count), (['start', 'test'], 2))
+        events, count = backend.wait('channel', 1, 5)
+        self.assertEqual(([ x['event'] for x in events ], count), (['test'], 2))
+
+    def test_restart(self):
+        '''новое событие 'start' очищает историю предыдущей проверки: события отдаются с начала'''
+        backend = progress.LocalBackend()
+        backend.publish('channel', { 'event': 'start', 'tests': 1 })
+        backend.publish('channel', { 'event': 'done', 'executions': ['1'], 'mark': None })
+        backend.publish('channel', { 'event': 'start', 'tests': 1 })
+
+        events, count = backend.wait('channel', 2, 5)
+        self.assertEqual(([ x['event'] for x in events ], count), (['start'], 1))
+
+    def test_wait(self):
+        '''запрос ждёт событие из другого потока и возвращается сразу после него'''
+        backend = progress.LocalBackend()
+        backend.publish('channel', { 'event': 'start', 'tests': 1 })
+
+        Timer(0.05, backend.publish, args=('channel', { 'event': 'test', 'test': 0, 'execution_result': '0' })).start()
+        start = monotonic()
+        events, count = backend.wait('channel', 1, 5)
+        self.assertLess(monotonic() - start, 2)
+        self.assertEqual(([ x['event'] for x in events ], count), (['test'], 2))
+
+    def test_timeout(self):
+        '''без новых событий запрос завершается по истечении timeout'''
+        backend = progress.LocalBackend()
+        self.assertEqual(backend.wait('channel', 0, 0.1), ([], 0))
+
+
+@override_settings(JUDGE_MODE='queue', JUDGE_PROGRESS_BACKEND='local')
+@mock.patch('LMS.judge.PYTHON', sys.executable)
+class StreamTaskAnswerTestCase(TestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        progress._backends.clear()
+
+        self.course = Course.objects.create(title='курс')
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+        self.task = Task.objects.create(
+            course_element=self.course_element,
+            title='задача',
+            execute_answer=True,
+            deadline_visible=timezone.now() + timedelta(hours=1),
+            deadline_true=timezone.now() + timedelta(hours=1),
+            mark_outer=Decimal(10),
+            mark_max=Decimal(10),
+            grading_policy='2',
+        )
+        TaskTest.objects.create(task=self.task, input='1\n', output='2\n', hidden=False)
+        TaskTest.objects.create(task=self.task, input='5\n', output='7\n', hidden=True)
+
+        self.student = User.objects.create(username='student')
+        self.task_answer = TaskAnswer.objects.create(task=self.task, student=self.student, language='1', code='print(int(input()) + 1)', is_running=True)
+
+    def test_events(self):
+        '''события публикуются по мере выполнения тестов и завершаются событием 'done' с оценкой'''
+        execute_task_answer(self.task_answer.id)
+
+        events, _ = progress.wait_events(self.task_answer.id, 0, 0.1)
+        self.assertEqual([ x['event'] for x in events ], ['start', 'test', 'test', 'done'])
+        self.assertEqual(events[0]['tests'], 2)
+        self.assertEqual([ (x['test'], x['execution_result']) for x in events[1:3] ], [(0, '0'), (1, '1')])
+        self.assertEqual(events[-1]['executions'], ['0', '1'])
+        self.assertEqual(Decimal(events[-1]['mark']), Decimal(5))
+
+    def test_poll_running(self):
+        '''для выполняющегося ответа отдаются события после Last-Event-ID с их номерами'''
+        progress.publish(self.task_answer.id, { 'event': 'start', 'tests': 2 })
+        progress.publish(self.task_answer.id, { 'event': 'test', 'test': 0, 'execution_result': '0' })
+
+        body = progress.poll_task_answer(self.task_answer, 0, timeout=5)
+        self.assertTrue(body.startswith('retry: 1000\n\n'))
+        self.assertEqual([ x['event'] for x in parse_stream([body]) ], ['start', 'test'])
+        self.assertEqual([ line for line in body.split('\n') if line.startswith('id: ') ], ['id: 1', 'id: 2'])
+
+        progress.publish(self.task_answer.id, { 'event': 'test', 'test': 1, 'execution_result': '1' })
+        body = progress.poll_task_answer(self.task_answer, 2, timeout=5)
+        self.assertEqual(parse_stream([body]), [{ 'event': 'test', 'test': 1, 'execution_result': '1' }])
+        self.assertIn('id: 3\n', body)
+
+    def test_poll_finished(self):
+        '''для проверенного ответа сразу отдаются результаты из БД'''
+        execute_task_answer(self.task_answer.id)
+        progress._backends.clear() # история событий недоступна, например после перезапуска
+
+        events = parse_stream([progress.poll_task_answer(self.task_answer, 0, timeout=5)])
+        self.assertEqual(events, [{ 'event': 'done', 'executions': ['0', '1'], 'mark': '5.00' }])
+
+    @override_settings(JUDGE_PROGRESS_TIMEOUT=0.1)
+    def test_poll_timeout(self):
+        '''без новых событий запрос завершается через JUDGE_PROGRESS_TIMEOUT, клиент переподключается'''
+        self.assertEqual(progress.poll_task_answer(self.task_answer, 0), 'retry: 1000\n\n')
@@ -0,0 +1,113 @@
+import sys
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from LMS.celery_tasks import execute_task_answer, schedule_judge_jobs
+from LMS.dispatch import enqueue_task_answer, get_rejudge_progress, rejudge_task
+from LMS.models import Course, CourseElement, JudgeJob, Task, TaskAnswer, TaskAnswerMark, TaskTest, TaskTestExecution
+
+
+@override_settings(JUDGE_MODE='queue', JUDGE_MAX_IN_FLIGHT=4, JUDGE_REJUDGE_MAX_IN_FLIGHT=1)
+@mock.patch('LMS.judge.PYTHON', sys.executable)
+class RejudgeTestCase(TestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        cache.clear()
+
+        self.course = Course.objects.create(title='курс')
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+        self.task = Task.objects.create(
+            course_element=self.course_element,
+            title='задача',
+            execute_answer=True,
+            deadline_visible=timezone.now() + timedelta(days=1),
+            deadline_true=timezone.now() + timedelta(days=1),
+            mark_outer=Decimal(10),
+            mark_max=Decimal(10),
+            grading_policy='2',
+        )
+        self.task_test_1 = TaskTest.objects.create(task=self.task, input='1\n', output='2\n', hidden=False)
+        self.task_test_2 = TaskTest.objects.create(task=self.task, input='5\n', output='7\n', hidden=True)
+
+        self.students = [ User.objects.create(username=f'student{i}') for i in range(3) ]
+
+    def create_answer(self, student, code='print(int(input()) + 1)'):
+        task_answer = TaskAnswer.objects.create(task=self.task, student=student, language='1', code=code, is_running=True)
+        execute_task_answer(task_answer.id)
+        return task_answer
+
+    def test_rejudge_task(self):
+        '''в очередь ставятся проверенные ответы, ответы в проверке пропускаются'''
+        checked = [ self.create_answer(student) for student in self.students[:2] ]
+        running = TaskAnswer.objects.create(task=self.task, student=self.students[2], language='1', code='print(1)', is_running=True)
+
+        self.assertEqual(rejudge_task(self.task), 2)
+        self.assertEqual(set(JudgeJob.objects.filter(rejudge=True).values_list('task_answer_id', flat=True)), { x.id for x in checked })
+        self.assertFalse(JudgeJob.objects.filter(task_answer=running).exists())
+        self.assertEqual(get_rejudge_progress(self.task), { 'total': 2, 'remaining': 2, 'changed': 0 })
+
+    def test_changed(self):
+        '''записываются только изменившиеся результаты, оценка пересчитывается'''
+        task_answer = self.create_answer(self.students[0])
+        unchanged = TaskTestExecution.objects.get(task_answer=task_answer, task_test=self.task_test_1)
+        self.assertEqual(task_answer.get_TaskAnswerMark().mark, Decimal(5))
+
+        self.task_test_2.output = '6\n'
+        self.task_test_2.save()
+        rejudge_task(self.task)
+        execute_task_answer(task_answer.id, rejudge=True)
+
+        self.assertEqual(TaskTestExecution.objects.get(pk=unchanged.pk).duration, unchanged.duration)
+        self.assertEqual(TaskTestExecution.objects.get(task_answer=task_answer, task_test=self.task_test_2).execution_result, '0')
+        self.assertEqual(task_answer.get_TaskAnswerMark().mark, Decimal(10))
+        self.assertEqual(get_rejudge_progress(self.task), { 'total': 1, 'remaining': 0, 'changed': 1 })
+
+    def test_unchanged(self):
+        '''без изменений результаты и оценка преподавателя не трогаются'''
+        task_answer = self.create_answer(self.students[0])
+        TaskAnswerMark.objects.filter(task_answer=task_answer).update(teacher=self.students[1], mark=Decimal(3))
+        executions = list(TaskTestExecution.objects.filter(task_answer=task_answer).order_by('id').values())
+
+        rejudge_task(self.task)
+        execute_task_answer(task_answer.id, rejudge=True)
+
+        self.assertEqual(list(TaskTestExecution.objects.filter(task_answer=task_answer).order_by('id').values()), executions)
+        self.assertEqual(task_answer.get_TaskAnswerMark().mark, Decimal(3))
+        self.assertEqual(get_rejudge_progress(self.task)['changed'], 0)
+
+    @mock.patch('LMS.celery_tasks.execute_task_answer.delay')
+    def test_cache(self, delay):
+        '''одинаковый код проверяется один раз'''
+        first = self.create_answer(self.students[0])
+        second = self.create_answer(self.students[1], code='print(int(input()) + 1)\n')
+        self.task_test_2.output = '6\n'
+        self.task_test_2.save()
+        rejudge_task(self.task)
+
+        execute_task_answer(first.id, rejudge=True)
+        # после проверки первого ответа следующая повторная проверка передаётся в очередь (без брокера)
+        delay.assert_called_once_with(second.id, rejudge=True)
+        with mock.patch('LMS.celery_tasks.get_judge_pool') as get_judge_pool:
+            execute_task_answer(second.id, rejudge=True)
+        get_judge_pool.assert_not_called()
+        self.assertEqual(TaskTestExecution.objects.get(task_answer=second, task_test=self.task_test_2).execution_result, '0')
+
+    @mock.patch('LMS.celery_tasks.execute_task_answer.delay')
+    def test_schedule(self, delay):
+        '''повторная проверка передаётся после новых ответов и занимает не больше JUDGE_REJUDGE_MAX_IN_FLIGHT мест'''
+        for student in self.students[:2]:
+            self.create_answer(student)
+        rejudge_task(self.task)
+        task_answer = TaskAnswer.objects.create(task=self.task, student=self.students[2], language='1', code='print(1)', is_running=True)
+        enqueue_task_answer(task_answer)
+
+        self.assertEqual(schedule_judge_jobs(), 2)
+        self.assertEqual(delay.call_args_list[0], mock.call(task_answer.id))
+        self.assertEqual(delay.call_args_list[1].kwargs, { 'rejudge': True })
+        self.assertEqual(JudgeJob.objects.filter(rejudge=True, state='0').count(), 1)
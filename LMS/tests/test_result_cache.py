@@ -0,0 +1,125 @@
+import sys
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from LMS.celery_tasks import everyday, execute_task_answer
+from LMS.dispatch import dispatch_task_answer
+from LMS.models import Course, CourseElement, Task, TaskAnswer, TaskAnswerCache, TaskTest, TaskTestExecution
+from LMS.result_cache import cache_executions, get_cached_executions, get_stats, normalize_code
+
+
+@override_settings(JUDGE_MODE='queue')
+@mock.patch('LMS.judge.PYTHON', sys.executable)
+class ResultCacheTestCase(TestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        cache.clear()
+
+        self.course = Course.objects.create(title='курс')
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+        self.task = Task.objects.create(
+            course_element=self.course_element,
+            title='задача',
+            execute_answer=True,
+            deadline_visible=timezone.now() + timedelta(hours=1),
+            deadline_true=timezone.now() + timedelta(hours=1),
+            mark_outer=Decimal(10),
+            mark_max=Decimal(10),
+        )
+        self.task_test_1 = TaskTest.objects.create(task=self.task, input='1\n', output='2\n', hidden=False)
+        self.task_test_2 = TaskTest.objects.create(task=self.task, input='5\n', output='7\n', hidden=True)
+
+        self.students = [ User.objects.create(username=f'student{i}') for i in range(3) ]
+
+    def create_answer(self, student, code):
+        return TaskAnswer.objects.create(task=self.task, student=student, language='1', code=code, is_running=True)
+
+    def test_normalize_code(self):
+        ''''''
+        self.assertEqual(normalize_code('a = 1  \r\nprint(a)\t\n\n'), 'a = 1\nprint(a)')
+
+    def test_hit(self):
+        '''повторный ответ с тем же кодом получает результаты без запуска'''
+        task_answer = self.create_answer(self.students[0], 'print(int(input()) + 1)')
+        execute_task_answer(task_answer.id)
+
+        task_answer = self.create_answer(self.students[1], 'print(int(input()) + 1)   \r\n\n')
+        with mock.patch('LMS.celery_tasks.execute_task_answer.delay') as delay:
+            dispatch_task_answer(task_answer)
+        delay.assert_not_called()
+
+        task_answer.refresh_from_db()
+        self.assertFalse(task_answer.is_running)
+        executions = TaskTestExecution.objects.filter(task_answer=task_answer).order_by('task_test_id')
+        self.assertEqual([ x.execution_result for x in executions ], ['0', '1'])
+        self.assertEqual(get_stats(), { 'cache_hits': 1, 'cache_misses': 0 })
+
+    def test_invalidate(self):
+        '''изменение тестов задания очищает кэш'''
+        task_answer = self.create_answer(self.students[0], 'print(int(input()) + 1)')
+        execute_task_answer(task_answer.id)
+        self.assertEqual(TaskAnswerCache.objects.count(), 1)
+
+        self.task_test_2.output = '6\n'
+        self.task_test_2.save()
+        self.assertFalse(TaskAnswerCache.objects.exists())
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.tests_version, 3)
+
+        task_answer = self.create_answer(self.students[1], 'print(int(input()) + 1)')
+        with mock.patch('LMS.celery_tasks.execute_task_answer.delay'), self.captureOnCommitCallbacks(execute=True):
+            dispatch_task_answer(task_answer)
+        self.assertEqual(get_stats(), { 'cache_hits': 0, 'cache_misses': 1 })
+
+    def test_limits(self):
+        '''другие ограничения задания - другой ключ'''
+        task_answer = self.create_answer(self.students[0], 'print(int(input()) + 1)')
+        execute_task_answer(task_answer.id)
+
+        self.task.limit_memory_Mbyte = 128
+        self.task.save()
+
+        task_answer = self.create_answer(self.students[1], 'print(int(input()) + 1)')
+        with mock.patch('LMS.celery_tasks.execute_task_answer.delay'):
+            dispatch_task_answer(task_answer)
+        self.assertEqual(get_stats(), { 'cache_hits': 0, 'cache_misses': 1 })
+
+    def create_executions(self, task_answer, execution_results):
+        self.task.refresh_from_db() # версия тестов увеличилась при создании тестов
+        return [ TaskTestExecution(
+            task_test=task_test, task_answer=task_answer, stdout='', stderr='', returncode=0,
+            execution_result=execution_result, duration=timedelta(), memory_Kbyte=0,
+        ) for task_test, execution_result in zip([self.task_test_1, self.task_test_2], execution_results) ]
+
+    def test_time_limit(self):
+        '''результаты с превышением времени зависят от нагрузки и не запоминаются'''
+        task_answer = self.create_answer(self.students[0], 'print(1)')
+        for execution_results in (['0', '2'], ['7', '1']):
+            executions = self.create_executions(task_answer, execution_results)
+            cache_executions(task_answer, self.task.tests_version, executions)
+        self.assertFalse(TaskAnswerCache.objects.exists())
+
+        executions = self.create_executions(task_answer, ['0', '1'])
+        cache_executions(task_answer, self.task.tests_version, executions)
+        self.assertEqual(TaskAnswerCache.objects.count(), 1)
+
+    @override_settings(JUDGE_RESULT_CACHE_MAX_AGE=timedelta(days=7))
+    def test_expired(self):
+        '''устаревшие записи не используются и удаляются задачей everyday'''
+        task_answer = self.create_answer(self.students[0], 'print(1)')
+        executions = self.create_executions(task_answer, ['0', '1'])
+        cache_executions(task_answer, self.task.tests_version, executions)
+        self.assertIsNotNone(get_cached_executions(task_answer))
+
+        TaskAnswerCache.objects.update(datetime_create=timezone.now() - timedelta(days=8))
+        self.assertIsNone(get_cached_executions(task_answer))
+
+        with mock.patch('builtins.print'):
+            everyday()
+        self.assertFalse(TaskAnswerCache.objects.exists())
@@ -0,0 +1,163 @@
+import random
+from collections import Counter, defaultdict, deque, namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from LMS.celery_tasks import schedule_judge_jobs
+from LMS.dispatch import enqueue_task_answer
+from LMS.models import Course, CourseElement, JudgeJob, Task, TaskAnswer
+from LMS.scheduler import estimate_wait, fair_order, pick_jobs, queue_position
+
+Job = namedtuple('Job', ['id', 'course_id', 'student_id', 'deadline'])
+
+NOW = datetime(2021, 6, 1, 12, 0)
+LATER = NOW + timedelta(days=7)
+
+def normal(job):
+    return 1
+
+def naive_order(waiting, running, weights, priority, max_per_user=None):
+    '''fair_order без куч: на каждом шаге выбираются минимальные курс и студент'''
+    course_load = Counter(job.course_id for job in running)
+    student_load = Counter(job.student_id for job in running)
+    classes = defaultdict(list)
+    for job in waiting:
+        classes[priority(job)].append(job)
+    for _, jobs in sorted(classes.items()):
+        queues = defaultdict(lambda: defaultdict(deque))
+        for job in sorted(jobs, key=lambda job: job.id):
+            queues[job.course_id][job.student_id].append(job)
+        while True:
+            students = {
+                course_id: [ student_id for student_id, queue in course_queues.items() if queue and (max_per_user is None or student_load[student_id] < max_per_user) ]
+                for course_id, course_queues in queues.items()
+            }
+            courses = [ course_id for course_id in students if students[course_id] ]
+            if not courses:
+                break
+            course_id = min(courses, key=lambda x: (course_load[x] / weights.get(x, 1), min(queue[0].id for queue in queues[x].values() if queue)))
+            student_id = min(students[course_id], key=lambda x: (student_load[x], queues[course_id][x][0].id))
+            course_load[course_id] += 1
+            student_load[student_id] += 1
+            yield queues[course_id][student_id].popleft()
+
+
+class FairOrderTestCase(SimpleTestCase):
+    def test_courses(self):
+        '''курс с дедлайном (много ответов) не занимает все места'''
+        waiting = [ Job(i, 1, i, LATER) for i in range(1, 11) ] + [ Job(11, 2, 100, LATER), Job(12, 2, 101, LATER) ]
+        jobs = pick_jobs(waiting, [], 4, {}, normal)
+        self.assertEqual(Counter(job.course_id for job in jobs), { 1: 2, 2: 2 })
+
+    def test_weights(self):
+        '''места распределяются пропорционально весам курсов'''
+        waiting = [ Job(i, 1, i, LATER) for i in range(1, 11) ] + [ Job(i, 2, i, LATER) for i in range(11, 21) ]
+        jobs = pick_jobs(waiting, [], 8, { 1: 3, 2: 1 }, normal)
+        self.assertEqual(Counter(job.course_id for job in jobs), { 1: 6, 2: 2 })
+
+    def test_students(self):
+        '''в курсе места делятся между студентами, у студента ответы по порядку'''
+        waiting = [ Job(1, 1, 1, LATER), Job(2, 1, 1, LATER), Job(3, 1, 1, LATER), Job(4, 1, 2, LATER) ]
+        self.assertEqual([ job.id for job in fair_order(waiting, [], {}, normal) ], [1, 4, 2, 3])
+
+    def test_running(self):
+        '''выполняющиеся ответы учитываются в доле курса'''
+        running = [ Job(1, 1, 1, LATER), Job(2, 1, 2, LATER) ]
+        waiting = [ Job(3, 1, 3, LATER), Job(4, 2, 4, LATER) ]
+        self.assertEqual([ job.id for job in fair_order(waiting, running, {}, normal) ], [4, 3])
+
+    def test_max_per_user(self):
+        '''у студента выполняется не больше max_per_user ответов'''
+        running = [ Job(1, 1, 1, LATER) ]
+        waiting = [ Job(2, 1, 1, LATER), Job(3, 1, 2, LATER), Job(4, 1, 2, LATER) ]
+        self.assertEqual([ job.id for job in pick_jobs(waiting, running, 10, {}, normal, max_per_user=1) ], [3])
+
+    def test_urgent(self):
+        '''ответы на задания с близким дедлайном передаются первыми'''
+        waiting = [ Job(1, 1, 1, LATER), Job(2, 2, 2, NOW), Job(3, 1, 3, LATER) ]
+        priority = lambda job: 0 if job.deadline - NOW <= timedelta(hours=1) else 1
+        self.assertEqual([ job.id for job in fair_order(waiting, [], {}, priority) ], [2, 1, 3])
+
+    def test_queue_position(self):
+        ''''''
+        waiting = [ Job(i, 1, i, LATER) for i in range(1, 6) ]
+        self.assertEqual(queue_position(waiting[4], waiting, [], 2, {}, normal), 3)
+        self.assertEqual(queue_position(waiting[0], waiting, [], 2, {}, normal), 0)
+        self.assertEqual(estimate_wait(3, 2, 2.0), 3.0)
+
+    def test_queue_position_limit(self):
+        '''за limit первыми заданиями порядка место оценивается по заданиям, поставленным раньше'''
+        waiting = [ Job(i, 1, 1, LATER) for i in range(1, 11) ] + [ Job(11, 2, 2, LATER), Job(12, 2, 2, LATER) ]
+        self.assertEqual(queue_position(waiting[11], waiting, [], 2, {}, normal), 2)
+        self.assertEqual(queue_position(waiting[11], waiting, [], 2, {}, normal, limit=4), 2)
+        self.assertEqual(queue_position(waiting[11], waiting, [], 2, {}, normal, limit=3), 9)
+
+    def test_naive_order(self):
+        '''порядок совпадает с выбором минимальных курса и студента на каждом шаге'''
+        rng = random.Random(0)
+        for _ in range(50):
+            waiting = [ Job(i, rng.randint(1, 4), rng.randint(1, 8), NOW if rng.random() < 0.2 else LATER) for i in rng.sample(range(1, 1000), 60) ]
+            running = [ Job(0, rng.randint(1, 4), rng.randint(1, 8), LATER) for _ in range(rng.randint(0, 5)) ]
+            weights = { course_id: rng.randint(1, 3) for course_id in range(1, 5) }
+            priority = lambda job: 0 if job.deadline == NOW else 1
+            for max_per_user in (None, 2, 4):
+                self.assertEqual(
+                    [ job.id for job in fair_order(waiting, running, weights, priority, max_per_user) ],
+                    [ job.id for job in naive_order(waiting, running, weights, priority, max_per_user) ],
+                )
+
+
+@override_settings(JUDGE_MODE='queue', JUDGE_MAX_IN_FLIGHT=2, JUDGE_MAX_IN_FLIGHT_PER_USER=1, JUDGE_JOB_DURATION=2)
+class ScheduleJudgeJobsTestCase(TestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.course = Course.objects.create(title='курс')
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+        self.tasks = [
+            Task.objects.create(
+                course_element=self.course_element,
+                title=f'задача {i}',
+                execute_answer=True,
+                deadline_visible=timezone.now() + timedelta(days=1),
+                deadline_true=timezone.now() + timedelta(days=1),
+                mark_outer=Decimal(10),
+                mark_max=Decimal(10),
+            ) for i in range(2)
+        ]
+        self.students = [ User.objects.create(username=f'student{i}') for i in range(3) ]
+
+    def enqueue(self, task, student):
+        task_answer = TaskAnswer.objects.create(task=task, student=student, language='1', code='print(1)', is_running=True)
+        return task_answer, enqueue_task_answer(task_answer)
+
+    @mock.patch('LMS.celery_tasks.execute_task_answer.delay')
+    def test_schedule(self, delay):
+        '''передаётся не больше JUDGE_MAX_IN_FLIGHT ответов, не больше одного от студента'''
+        first, _ = self.enqueue(self.tasks[0], self.students[0])
+        second, _ = self.enqueue(self.tasks[1], self.students[0])
+        third, queue = self.enqueue(self.tasks[0], self.students[1])
+        fourth, queue = self.enqueue(self.tasks[0], self.students[2])
+        self.assertEqual(queue, { 'queue_position': 1, 'estimated_wait': 1.0 })
+
+        self.assertEqual(schedule_judge_jobs(), 2)
+        self.assertEqual([ x.args[0] for x in delay.call_args_list ], [first.id, third.id])
+        self.assertEqual(schedule_judge_jobs(), 0)
+
+        # ответ проверен, у студентов нет выполняющихся ответов - передаётся более старый
+        JudgeJob.objects.filter(task_answer=first).delete()
+        self.assertEqual(schedule_judge_jobs(), 1)
+        self.assertEqual(delay.call_args.args[0], second.id)
+        self.assertEqual(JudgeJob.objects.get(task_answer=fourth).state, '0')
+
+    @mock.patch('LMS.celery_tasks.execute_task_answer.delay')
+    def test_deleted(self, delay):
+        '''удалённый ответ удаляется из очереди'''
+        task_answer, _ = self.enqueue(self.tasks[0], self.students[0])
+        task_answer.delete()
+        self.assertEqual(schedule_judge_jobs(), 0)
+        self.assertFalse(JudgeJob.objects.exists())
@@ -0,0 +1,103 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from LMS.models import Course, CourseElement, Test, TestQuestion, TestQuestionAnswer, TestResult
+
+
+class TestResultMarksTestCase(TestCase):
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.course = Course.objects.create(title='курс')
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+        self.test = Test.objects.create(
+            course_element=self.course_element,
+            title='тест',
+            mark_outer=Decimal(10),
+            number_of_attempts=10,
+            test_type='many',
+            start=timezone.now() - timedelta(hours=1),
+            end=timezone.now() + timedelta(days=1),
+            duration=timedelta(hours=1),
+        )
+        for answer_true in ('0', '1', '0'):
+            TestQuestion.objects.create(test=self.test, question_text='баг или фича?', max_mark=Decimal(1), answer_type='one', answer_values='баг\nфича', answer_true=answer_true)
+
+        self.users = [ User.objects.create(username=f'student{i}') for i in range(2) ]
+
+    def create_attempt(self, user, answers, finished=True):
+        test_result = TestResult.objects.create(test=self.test, user=user)
+        for question, answer in zip(self.test.test_questions.order_by('id'), answers):
+            TestQuestionAnswer.objects.create(test_result=test_result, test_question=question, answer=answer)
+        if finished:
+            test_result.complete()
+        return test_result
+
+    def test_with_marks(self):
+        '''завершённость, время завершения и оценка попыток нескольких пользователей одним запросом'''
+        finished = self.create_attempt(self.users[0], ['0', '1', '1'])
+        active = self.create_attempt(self.users[1], ['0', '1', '0'], finished=False)
+        timed_out = self.create_attempt(self.users[1], ['1', '0', '0'], finished=False)
+        TestResult.objects.filter(pk=timed_out.pk).update(start=timezone.now() - timedelta(hours=2))
+        manual = self.create_attempt(self.users[0], ['1', '0', '1'])
+        TestResult.objects.filter(pk=manual.pk).update(mark=Decimal(9))
+
+        with self.assertNumQueries(1):
+            test_results = { x.id: x for x in TestResult.objects.with_marks().filter(test=self.test, user__in=self.users) }
+            marks = { id: x.evaluate_mark() for id, x in test_results.items() }
+
+        self.assertEqual([ test_results[x.id].finished for x in (finished, active, timed_out, manual) ], [True, False, True, True])
+        self.assertEqual(test_results[finished.id].effective_end, TestResult.objects.get(pk=finished.pk).end)
+        self.assertEqual(test_results[active.id].effective_end, active.start + self.test.duration)
+        self.assertEqual(marks, {
+            finished.id: Decimal(10) * 2 / 3,
+            active.id: None,
+            timed_out.id: Decimal(10) / 3,
+            manual.id: Decimal(9),
+        })
+
+        # без аннотаций оценка та же
+        self.assertEqual({ x.id: x.evaluate_mark() for x in TestResult.objects.all() }, marks)
+
+    def test_get_user_mark_queries(self):
+        '''кол-во запросов не зависит от кол-ва попыток'''
+        self.create_attempt(self.users[0], ['0', '0', '0'])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.test.get_user_mark(self.users[0]), Decimal(10) * 2 / 3)
+
+        for answers in (['0', '1', '0'], ['1', '1', '0'], ['0', '1', '1']):
+            self.create_attempt(self.users[0], answers)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.test.get_user_mark(self.users[0]), Decimal(10))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.test.get_finished_test_results(self.users[0])), 4)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.test.can_start_new_test(self.users[0]))
+
+    def test_active_attempt(self):
+        '''начатая попытка не оценивается и не даёт начать новую'''
+        self.assertEqual(self.test.get_user_mark(self.users[0]), None)
+
+        test_result = self.create_attempt(self.users[0], ['0', '1', '0'], finished=False)
+        self.assertEqual(self.test.get_active_test_result(self.users[0]), test_result)
+        self.assertEqual(self.test.get_finished_test_results(self.users[0]), [])
+        self.assertFalse(self.test.can_start_new_test(self.users[0]))
+        self.assertEqual(self.test.get_user_mark(self.users[0]), None)
+
+        test_result.complete()
+        self.assertEqual(self.test.get_active_test_result(self.users[0]), None)
+        self.assertEqual(self.test.get_user_mark(self.users[0]), Decimal(10))
+
+    def test_test_end(self):
+        '''после окончания теста все попытки завершены, без попыток - 0'''
+        test_result = self.create_attempt(self.users[0], ['0', '1', '0'], finished=False)
+        Test.objects.filter(pk=self.test.pk).update(end=timezone.now() - timedelta(minutes=1))
+        self.test.refresh_from_db()
+
+        self.assertEqual(self.test.get_user_mark(self.users[0]), Decimal(10))
+        self.assertEqual(self.test.get_user_mark(self.users[1]), Decimal(0))
+        self.assertEqual(TestResult.objects.with_marks().get(pk=test_result.pk).effective_end, self.test.end)
@@ -29,6 +29,7 @@ from .forms import (
     TestQuestionModelForm,
 )
 from .models import *
+from . import gradebook, membership
 
 logger = logging.getLogger(__name__)
 
@@ -150,11 +151,10 @@ def user_settings(request):
     }
     return render(request, 'LMS/user/settings.html', context)
 
-# todo: refactoring. mb change database
 @require_GET
 @login_required(login_url='login')
 def user_marks(request):
-    '''показывает курсы на кот. подписан и оценки за эти курсы'''
+    '''показывает курсы на кот. подписан и оценки за эти курсы. оценки читаются из журнала оценок (gradebook.py)'''
     #tasks = [ (Task, mark, mark_max),  ]
     #tests = [ (Test, mark, mark_max),  ]
 
@@ -163,17 +163,21 @@ def user_marks(request):
     #courses = [ (course, course_res, mark, mark_max), ]
 
     courses_res = []
-    courses = Course.objects.filter(students=request.user)
+    courses = list(Course.objects.filter(students=request.user).prefetch_related('course_elements__tasks', 'course_elements__tests'))
+
+    elements = [ elem for course in courses for elem in course.course_elements.all() ]
+    task_marks, test_marks = gradebook.get_marks(
+        request.user,
+        [ task for elem in elements for task in elem.tasks.all() ],
+        [ test for elem in elements for test in elem.tests.all() ],
+    )
 
     for course in courses:
         course_res = []
 
         for elem in course.course_elements.all():
-            tasks = elem.tasks.all()
-            tasks = [ (task, task.get_mark(request.user), task.mark_outer) for task in tasks ]
-
-            tests = elem.tests.all()
-            tests = [ (test, test.get_user_mark(request.user), test.mark_outer) for test in tests ]
+            tasks = [ (task, task_marks[task.id], task.mark_outer) for task in elem.tasks.all() ]
+            tests = [ (test, test_marks[test.id], test.mark_outer) for test in elem.tests.all() ]
 
             tasks_mark = sum( 0 if mark is None else mark for _,mark,_ in tasks)
             tasks_mark_max = sum(mark_max for _,_,mark_max in tasks)
@@ -233,8 +237,8 @@ def course_view(request, id):
 
     permission_subscribe = bool(
         request.user.is_authenticated and
-        not course.students.filter(pk=request.user.pk).exists() and
-        not course.excluded.filter(pk=request.user.pk).exists()
+        not membership.is_student(request.user, course.id) and
+        not membership.is_excluded(request.user, course.id)
     )
 
     context = {
@@ -301,7 +305,7 @@ def task_view(request, id):
     task = get_object_or_404(Task, pk=id)
 
     # проверить что записан на курс
-    user_subscribe = task.course_element.course.is_subscriber(request.user)
+    user_subscribe = membership.is_student(request.user, task.course_id)
     if not user_subscribe:
         return HttpResponseForbidden('вы не записаны на этот курс')
 
@@ -311,11 +315,11 @@ def task_view(request, id):
         'comments':task.comments.filter(deleted=False) if task.comments_is_on else None,
         'task_description':task.description.split('\n'),
         'task_answer':task_answer,
-        'user_subscribed':task.course_element.course.is_subscriber(request.user),
-        'user_edit_task':task.course_element.course.can_edit(request.user),
+        'user_subscribed':membership.is_student(request.user, task.course_id),
+        'user_edit_task':membership.is_owner(request.user, task.course_id),
         'can_set_task_answer':task.can_set_task_answer(request.user),
-        'check_answers': len([x for x in TaskAnswer.objects.filter(task=task) if x.get_TaskAnswerMark() == None]) if task.course_element.course.can_edit(request.user) else 0,
-        'CodeForm': CodeForm(initial_code=task.start_code) if task.execute_answer and task.can_set_task_answer(request.user) else None,
+        'check_answers': len([x for x in TaskAnswer.objects.filter(task=task) if x.get_TaskAnswerMark() == None]) if membership.is_owner(request.user, task.course_id) else 0,
+        'CodeForm': CodeForm(initial_code=task.start_code, languages=task.get_languages()) if task.execute_answer and task.can_set_task_answer(request.user) else None,
     }
 
     return render(request, 'LMS/task/view_automatic.html' if task.execute_answer else 'LMS/task/view_non_automatic.html', context)
@@ -327,7 +331,7 @@ def task_evaluate(request, id):
     task = get_object_or_404(Task, pk=id)
 
     # проверка прав
-    if not task.course_element.course.owners.filter(id=request.user.id).exists():
+    if not membership.is_owner(request.user, task.course_id):
         return HttpResponseForbidden('нет прав для оценивания задач')
 
     context = {
@@ -385,7 +389,7 @@ def task_create(request, course_element_id):
     """создать задание"""
     course_element = get_object_or_404(CourseElement, pk=course_element_id)
 
-    if not course_element.course.can_edit(request.user):
+    if not membership.is_owner(request.user, course_element.course_id):
         return HttpResponseForbidden('нет прав для создания задачи')
 
     data = request.POST.copy()
@@ -414,7 +418,7 @@ def task_create_automatic(request, course_element_id):
     """создать задание"""
     course_element = get_object_or_404(CourseElement, pk=course_element_id)
 
-    if not course_element.course.can_edit(request.user):
+    if not membership.is_owner(request.user, course_element.course_id):
         return HttpResponseForbidden('нет прав для создания задачи')
 
     data = request.POST.copy()
@@ -445,7 +449,7 @@ def task_tests(request, id):
     task = get_object_or_404(Task, pk=id, execute_answer=True)
 
     # проверка прав
-    if not task.course_element.course.owners.filter(id=request.user.id).exists():
+    if not membership.is_owner(request.user, task.course_id):
         return HttpResponseForbidden('нет прав')
 
     context = {
@@ -462,7 +466,7 @@ def test_view(request, id):
     test = get_object_or_404(Test, pk=id)
 
     # проверить что записан на курс
-    user_subscribe = test.course_element.course.is_subscriber(request.user)
+    user_subscribe = membership.is_student(request.user, test.course_id)
     if not user_subscribe:
         return HttpResponseForbidden('вы не записаны на этот курс')
 
@@ -554,7 +558,7 @@ def test_create(request, course_element_id):
     course_element = get_object_or_404(CourseElement, pk=course_element_id)
 
     # проверка прав
-    if not course_element.course.can_edit(request.user):
+    if not membership.is_owner(request.user, course_element.course_id):
         return HttpResponseForbidden('нет прав для создания теста')
 
     context = {
@@ -587,7 +591,7 @@ def files(request, id, filename):
     if not bool(
         file.course_element or
         request.user.is_authenticated and file.owner == request.user or
-        request.user.is_authenticated and file.task_answer and file.task_answer.task.course_element.course.owners.filter(id=request.user.id).exists()
+        request.user.is_authenticated and file.task_answer and membership.is_owner(request.user, file.task_answer.course_id)
     ):
         logger.warning('попытка доступа к файлу без прав')
         return HttpResponseForbidden()
@@ -3,6 +3,8 @@
 from django.utils import timezone
 from rest_framework.permissions import BasePermission
 
+from LMS import membership
+
 import LMS_API.viewsets as viewsets
 from LMS.models import (
     Course,
@@ -33,7 +35,7 @@ class CourseOwnerPermission(BasePermission):
                 course_element = CourseElement.objects.get(id=course_element)
             except:
                 return False
-            return course_element.course.owners.filter(id=request.user.id).exists()
+            return membership.is_owner(request.user, course_element.course_id)
 
         # создание TaskTest
         # проверить что преподаватель и включена автоматическая проверка у задания
@@ -44,7 +46,7 @@ class CourseOwnerPermission(BasePermission):
                 task = Task.objects.get(id=task)
             except:
                 return False
-            return task.execute_answer and task.course_element.course.owners.filter(id=request.user.id).exists()
+            return task.execute_answer and membership.is_owner(request.user, task.course_id)
 
         # создание TestQuestion
         if request.method == 'POST' and isinstance(view, viewsets.TestQuestionViewSet):
@@ -53,7 +55,7 @@ class CourseOwnerPermission(BasePermission):
                 test = Test.objects.get(id=test)
             except:
                 return False
-            return test.course_element.course.owners.filter(id=request.user.id).exists()
+            return membership.is_owner(request.user, test.course_id)
 
         # создание CourseElement?
         if request.method == 'POST' and isinstance(view, viewsets.CourseElementViewSet):
@@ -64,7 +66,7 @@ class CourseOwnerPermission(BasePermission):
                 course = Course.objects.get(id=course)
             except:
                 return False
-            return course.owners.filter(id=request.user.id).exists()
+            return membership.is_owner(request.user, course.pk)
 
         return True
 
@@ -73,23 +75,23 @@ class CourseOwnerPermission(BasePermission):
     # obj - объект к которому просят доступ
     def has_object_permission(self, request, view, obj):
         if isinstance(obj, Course):
-            return obj.owners.filter(id=request.user.id).exists()
+            return membership.is_owner(request.user, obj.pk)
         elif isinstance(obj, CourseElement):
-            return obj.course.owners.filter(id=request.user.id).exists()
+            return membership.is_owner(request.user, obj.course_id)
         elif isinstance(obj, Task):
-            return obj.course_element.course.owners.filter(id=request.user.id).exists()
+            return membership.is_owner(request.user, obj.course_id)
         elif isinstance(obj, TaskAnswer):
-            return obj.task.course_element.course.owners.filter(id=request.user.id).exists()
+            return membership.is_owner(request.user, obj.course_id)
         elif isinstance(obj, TaskTest):
-            return obj.task.course_element.course.owners.filter(id=request.user.id).exists()
+            return membership.is_owner(request.user, obj.task.course_id)
         elif isinstance(obj, Test):
-            return obj.course_element.course.owners.filter(id=request.user.id).exists()
+            return membership.is_owner(request.user, obj.course_id)
         elif isinstance(obj, TestResult):
-            return obj.test.course_element.course.owners.filter(id=request.user.id).exists()
+            return membership.is_owner(request.user, obj.course_id)
         elif isinstance(obj, TestQuestion):
-            return obj.test.course_element.course.owners.filter(id=request.user.id).exists()
+            return membership.is_owner(request.user, obj.course_id)
         elif isinstance(obj, TestQuestionAnswer):
-            return obj.test_question.test.course_element.course.owners.filter(id=request.user.id).exists()
+            return membership.is_owner(request.user, obj.course_id)
         else:
             return False
 
@@ -107,19 +109,21 @@ class CourseSubscriberPermission(BasePermission):
             except:
                 return False
 
-            return task.comments_is_on and task.course_element.course.students.filter(id=request.user.id).exists()
+            return task.comments_is_on and membership.is_student(request.user, task.course_id)
 
         return True
 
     def has_object_permission(self, request, view, obj):
         if isinstance(obj, Task):
-            return obj.course_element.course.students.filter(id=request.user.id).exists()
+            return membership.is_student(request.user, obj.course_id)
         elif isinstance(obj, Test):
-            return obj.course_element.course.students.filter(id=request.user.id).exists()
+            return membership.is_student(request.user, obj.course_id)
         elif isinstance(obj, TestQuestion):
-            return obj.test.course_element.course.students.filter(id=request.user.id).exists()
+            return membership.is_student(request.user, obj.course_id)
+        elif isinstance(obj, TestResult):
+            return membership.is_student(request.user, obj.course_id)
         elif isinstance(obj, TestQuestionAnswer):
-            return obj.test_result.test.course_element.course.students.filter(id=request.user.id).exists()
+            return membership.is_student(request.user, obj.course_id)
         else:
             return False
 
@@ -311,6 +315,6 @@ class DeleteFilePermission(BasePermission):
     def has_object_permission(self, request, view, obj):
         return bool(
             obj.owner == request.user and obj.task_answer and not obj.task_answer.get_TaskAnswerMark() or # ответ на задание
-            obj.course_element and obj.course_element.course.owners.filter(id=request.user.id).exists() or # файл курса
+            obj.course_element_id and membership.is_owner(request.user, obj.course_id) or # файл курса
             obj.owner == request.user and not obj.task_answer and not obj.course_element # просто где-то файл валяется
         )
\ No newline at end of file
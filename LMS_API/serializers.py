@@ -131,21 +131,21 @@ class TaskSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Task
-        fields = '__all__'
+        exclude = ['course'] # служебное поле (см. LMS/course_ids.py)
         read_only_fields = ['comments']
 
 class TaskUpdateSerializer(serializers.ModelSerializer):
     '''редактировать задание'''
     class Meta:
         model = Task
-        fields = '__all__'
+        exclude = ['course']
         read_only_fields = ['course_element', 'execute_answer']
 
 class TaskTestSerializer(serializers.ModelSerializer):
     '''для тестов к заданиям с автоматической проверкой'''
     class Meta:
         model = TaskTest
-        fields = ['id', 'task', 'input', 'output', 'hidden']
+        fields = ['id', 'task', 'input', 'output', 'hidden', 'weight', 'checker', 'tolerance']
 
 class TaskAnswerSerializer(serializers.ModelSerializer):
     ''''''
@@ -168,14 +168,14 @@ class TestSerializer(serializers.ModelSerializer):
     ''''''
     class Meta:
         model = Test
-        exclude = ['course_element']
+        exclude = ['course_element', 'course']
 
 class TestCreateSerializer(serializers.ModelSerializer):
     '''для создание теста'''
     class Meta:
         model = Test
         #exclude = ['start', 'end']
-        fields = '__all__'
+        exclude = ['course']
 
 class TestQuestionSerializer(serializers.ModelSerializer):
     ''''''
@@ -189,6 +189,14 @@ class TestQuestionAnswerUpdateSerializer(serializers.ModelSerializer):
         model = TestQuestionAnswer
         fields = ['answer']
 
+class TestQuestionAnswerBulkSerializer(serializers.ModelSerializer):
+    '''ответ на вопрос в списке ответов попытки (test-result-answers)'''
+    id = serializers.IntegerField()
+
+    class Meta:
+        model = TestQuestionAnswer
+        fields = ['id', 'answer']
+
 class TestQuestionAnswerRetrieveSerializer(serializers.ModelSerializer):
     ''''''
     test_question = serializers.SlugRelatedField(slug_field='question_text', read_only=True)
@@ -242,7 +250,7 @@ class TestResultRetrieveSerializer(serializers.ModelSerializer):
     ''''''
     class Meta:
         model = TestResult
-        fields = '__all__'
+        exclude = ['course']
 
 # OTHER
 class NotificationSerializer(serializers.ModelSerializer):
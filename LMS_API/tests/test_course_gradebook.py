@@ -0,0 +1,156 @@
+import csv
+import io
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from xml.etree import ElementTree
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from LMS import gradebook
+from LMS.models import Course, CourseElement, Task, TaskAnswer, TaskAnswerMark, Test
+
+
+class CourseGradebookApiTestCase(APITestCase):
+    ''''''
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.URL = '/api-lms/course-gradebook/'
+        self.client = APIClient()
+
+        self.user_owner = User.objects.create(username='user_owner', email='user_owner@example.com')
+        self.token_owner = Token.objects.create(user=self.user_owner)
+        self.students = [ User.objects.create(username=f'student{i}') for i in range(2) ]
+        self.token_student = Token.objects.create(user=self.students[0])
+
+        self.course = Course.objects.create(title='курс')
+        self.course.owners.add(self.user_owner)
+        for student in self.students:
+            self.course.students.add(student)
+
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+        self.task = Task.objects.create(
+            course_element=self.course_element,
+            title='задача',
+            deadline_visible=timezone.now() + timedelta(days=1),
+            deadline_true=timezone.now() + timedelta(days=1),
+            mark_outer=Decimal(5),
+            mark_max=Decimal(10),
+        )
+        # тест закончился без попыток: 0 баллов
+        self.test = Test.objects.create(
+            course_element=self.course_element,
+            title='тест',
+            mark_outer=Decimal(10),
+            test_type='one',
+            start=timezone.now() - timedelta(days=2),
+            end=timezone.now() - timedelta(days=1),
+            duration=timedelta(hours=1),
+        )
+
+        task_answer = TaskAnswer.objects.create(task=self.task, student=self.students[0])
+        TaskAnswerMark.objects.create(task_answer=task_answer, teacher=self.user_owner, mark=Decimal(7))
+        gradebook.rebuild()
+
+    def test_GET_without_authorization(self):
+        ''''''
+        response = self.client.get(f'{self.URL}{self.course.id}/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_GET_with_authorization_not_owner(self):
+        ''''''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_student.key)
+        response = self.client.get(f'{self.URL}{self.course.id}/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_GET_with_authorization_owner(self):
+        '''оценки и суммы по элементам как на странице оценок'''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_owner.key)
+        response = self.client.get(f'{self.URL}{self.course.id}/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertJSONEqual(response.content.decode('utf-8'), {
+            'elements': [{
+                'id': self.course_element.id,
+                'title': 'элемент курса',
+                'tasks': [{ 'id': self.task.id, 'title': 'задача', 'mark_max': 5.0 }],
+                'tests': [{ 'id': self.test.id, 'title': 'тест', 'mark_max': 10.0 }],
+                'mark_max': 15.0,
+            }],
+            'students': [
+                {
+                    'id': self.students[0].id,
+                    'username': 'student0',
+                    'tasks': { str(self.task.id): 3.5 },
+                    'tests': { str(self.test.id): 0 },
+                    'elements': { str(self.course_element.id): 3.5 },
+                    'mark': 3.5,
+                },
+                {
+                    'id': self.students[1].id,
+                    'username': 'student1',
+                    'tasks': { str(self.task.id): None },
+                    'tests': { str(self.test.id): 0 },
+                    'elements': { str(self.course_element.id): 0 },
+                    'mark': 0,
+                },
+            ],
+        })
+
+    def test_GET_queries(self):
+        '''кол-во запросов не зависит от кол-ва студентов'''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_owner.key)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(f'{self.URL}{self.course.id}/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(context.captured_queries)
+
+        queries = count_queries()
+        for i in range(10):
+            self.course.students.add(User.objects.create(username=f'new_student{i}'))
+        self.assertEqual(count_queries(), queries)
+
+    def test_GET_csv(self):
+        ''''''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_owner.key)
+        response = self.client.get(f'{self.URL}{self.course.id}/?format=csv')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="gradebook-{self.course.id}.csv"')
+
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(rows, [
+            ['id', 'пользователь', 'задача', 'тест', 'элемент курса: итого', 'итого'],
+            ['', 'максимум', '5.00', '10.00', '15.00', '15.00'],
+            [str(self.students[0].id), 'student0', '3.50', '0.00', '3.50', '3.50'],
+            [str(self.students[1].id), 'student1', '', '0.00', '0.00', '0.00'],
+        ])
+
+    def test_GET_xlsx(self):
+        ''''''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_owner.key)
+        response = self.client.get(f'{self.URL}{self.course.id}/?format=xlsx')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        self.assertIn('xl/workbook.xml', archive.namelist())
+
+        ns = { 'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main' }
+        sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        rows = [ [ ''.join(cell.itertext()) for cell in row.findall('x:c', ns) ] for row in sheet.iter(f'{{{ns["x"]}}}row') ]
+        self.assertEqual(rows[0], ['id', 'пользователь', 'задача', 'тест', 'элемент курса: итого', 'итого'])
+        self.assertEqual(rows[2], [str(self.students[0].id), 'student0', '3.50', '0.00', '3.50', '3.50'])
+        self.assertEqual(rows[3], [str(self.students[1].id), 'student1', '', '0.00', '0.00', '0.00'])
@@ -0,0 +1,37 @@
+from django.contrib.auth.models import User
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+
+class JudgeStatusApiTestCase(APITestCase):
+    ''''''
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.URL = '/api-lms/judge-status/'
+
+        self.client = APIClient()
+        self.user = User.objects.create(username='user', email='user1@example.com')
+        self.user_staff = User.objects.create(username='staff', email='user2@example.com', is_staff=True)
+
+        self.token = Token.objects.create(user=self.user)
+        self.token_staff = Token.objects.create(user=self.user_staff)
+
+    def test_GET_without_authorization(self):
+        ''''''
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_GET_with_authorization_not_staff(self):
+        ''''''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_GET_with_authorization_staff(self):
+        ''''''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_staff.key)
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data.keys()), {'mode', 'workers', 'leases', 'expired_leases', 'pending_age', 'running', 'running_lag', 'queued', 'in_flight', 'job_duration', 'results_waiting', 'ingest_lag', 'quarantined', 'cache_hits', 'cache_misses'})
@@ -0,0 +1,98 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from LMS import progress
+from LMS.models import Course, CourseElement, Task, TaskAnswer, TaskTest, TaskTestExecution
+
+
+@override_settings(JUDGE_PROGRESS_BACKEND='local')
+class TaskAnswerProgressApiTestCase(APITestCase):
+    ''''''
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.client = APIClient()
+        self.teacher = User.objects.create(username='teacher', email='teacher@example.com')
+        self.student = User.objects.create(username='student', email='student@example.com')
+        self.other = User.objects.create(username='other', email='other@example.com')
+
+        self.token_teacher = Token.objects.create(user=self.teacher)
+        self.token_student = Token.objects.create(user=self.student)
+        self.token_other = Token.objects.create(user=self.other)
+
+        self.course = Course.objects.create(title='курс')
+        self.course.owners.add(self.teacher)
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+        self.task = Task.objects.create(
+            course_element=self.course_element,
+            title='задача',
+            execute_answer=True,
+            deadline_visible=timezone.now() + timedelta(hours=1),
+            deadline_true=timezone.now() + timedelta(hours=1),
+            mark_outer=Decimal(10),
+            mark_max=Decimal(10),
+        )
+        self.task_test = TaskTest.objects.create(task=self.task, input='1\n', output='2\n', hidden=False)
+        self.task_answer = TaskAnswer.objects.create(task=self.task, student=self.student, language='1', code='print(2)', is_running=False)
+        TaskTestExecution.objects.create(task_answer=self.task_answer, task_test=self.task_test, stdout='2\n', stderr='', returncode=0, execution_result='0', duration=timedelta(0), memory_Kbyte=0)
+
+        self.URL = f'/api-lms/task-answer-progress/{self.task_answer.id}/'
+
+    def get_events(self, response) -> list:
+        content = response.content.decode('utf-8')
+        return [ json.loads(line[len('data: '):]) for line in content.split('\n') if line.startswith('data: ') ]
+
+    def test_GET_without_authorization(self):
+        ''''''
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_GET_with_authorization_other(self):
+        ''''''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_other.key)
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_GET_not_found(self):
+        ''''''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_student.key)
+        response = self.client.get(f'/api-lms/task-answer-progress/{self.task_answer.id + 1}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_GET_with_authorization_student(self):
+        ''''''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_student.key)
+        response = self.client.get(self.URL, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(self.get_events(response), [{ 'event': 'done', 'executions': ['0'], 'mark': None }])
+
+    def test_GET_with_authorization_teacher(self):
+        ''''''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_teacher.key)
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_events(response), [{ 'event': 'done', 'executions': ['0'], 'mark': None }])
+
+    def test_GET_last_event_id(self):
+        '''выполняющийся ответ: события после Last-Event-ID'''
+        TaskAnswer.objects.filter(pk=self.task_answer.pk).update(is_running=True)
+        progress._backends.clear()
+        progress.publish(self.task_answer.id, { 'event': 'start', 'tests': 1 })
+        progress.publish(self.task_answer.id, { 'event': 'test', 'test': 0, 'execution_result': '0' })
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_student.key)
+        response = self.client.get(self.URL, HTTP_LAST_EVENT_ID='1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_events(response), [{ 'event': 'test', 'test': 0, 'execution_result': '0' }])
+
+        response = self.client.get(self.URL + '?after=0')
+        self.assertEqual([ x['event'] for x in self.get_events(response) ], ['start', 'test'])
@@ -0,0 +1,77 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from LMS.models import Course, CourseElement, JudgeJob, Task, TaskAnswer
+
+
+@override_settings(JUDGE_MODE='queue')
+class TaskRejudgeApiTestCase(APITestCase):
+    ''''''
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.client = APIClient()
+        self.teacher = User.objects.create(username='teacher', email='teacher@example.com')
+        self.student = User.objects.create(username='student', email='student@example.com')
+
+        self.token_teacher = Token.objects.create(user=self.teacher)
+        self.token_student = Token.objects.create(user=self.student)
+
+        self.course = Course.objects.create(title='курс')
+        self.course.owners.add(self.teacher)
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+        self.task = Task.objects.create(
+            course_element=self.course_element,
+            title='задача',
+            execute_answer=True,
+            deadline_visible=timezone.now() + timedelta(hours=1),
+            deadline_true=timezone.now() + timedelta(hours=1),
+            mark_outer=Decimal(10),
+            mark_max=Decimal(10),
+        )
+        TaskAnswer.objects.create(task=self.task, student=self.student, language='1', code='print(2)', is_running=False)
+
+        self.URL = f'/api-lms/task-rejudge/{self.task.id}/'
+
+    def test_POST_without_authorization(self):
+        ''''''
+        response = self.client.post(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_POST_with_authorization_student(self):
+        ''''''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_student.key)
+        response = self.client.post(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(JudgeJob.objects.exists())
+
+    def test_POST_not_found(self):
+        ''''''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_teacher.key)
+        response = self.client.post(f'/api-lms/task-rejudge/{self.task.id + 1}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_POST_with_authorization_teacher(self):
+        ''''''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_teacher.key)
+        response = self.client.post(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, { 'queued': 1 })
+
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, { 'total': 1, 'remaining': 1, 'changed': 0 })
+
+    def test_POST_spool(self):
+        ''''''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_teacher.key)
+        with override_settings(JUDGE_MODE='spool'):
+            response = self.client.post(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
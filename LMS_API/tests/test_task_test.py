@@ -151,6 +151,9 @@ class TaskTestRetrieveTestCase(APITestCase):
             'input': 'input',
             'output': 'output',
             'hidden': True,
+            'weight': 1,
+            'checker': '1',
+            'tolerance': 1e-6,
         })
 
 
@@ -271,8 +274,34 @@ class TaskTestCreateApiTestCase(APITestCase):
             "input": "input",
             "output": "output",
             "hidden": True,
+            "weight": 1,
+            "checker": "1",
+            "tolerance": 1e-6,
         })
 
+    def test_POST_authorization_teacher_EXEC_ON_empty_fields(self):
+        '''пустые необязательные поля получают значения по умолчанию'''
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_teacher.key)
+
+        data = {
+            "task": self.task_exec_ON.id,
+            "input": "input",
+            "output": "output",
+            "hidden": True,
+            "weight": "",
+            "checker": "",
+            "tolerance": "",
+        }
+        response = self.client.post(self.URL, data=data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['weight'], response.data['checker'], response.data['tolerance']), (1, '1', 1e-6))
+
+        data.update(weight=0, checker='3', tolerance=0)
+        response = self.client.post(self.URL, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['weight'], response.data['checker'], response.data['tolerance']), (0, '3', 0))
+
     def test_POST_authorization_teacher_EXEC_ON_empty_data(self):
         """"""
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_teacher.key)
@@ -1,15 +1,20 @@
 from datetime import timedelta
+import json
 from decimal import Decimal
+from os import listdir, path
+from tempfile import TemporaryDirectory
 from time import sleep
+from unittest import mock
 
 from django.utils import timezone
 from django.contrib.auth.models import User
+from django.test import override_settings
 
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 
-from LMS.models import Course, CourseElement, Task, TaskAnswer, TaskAnswerMark
+from LMS.models import Course, CourseElement, JudgeJob, Task, TaskAnswer, TaskAnswerMark, TaskTest
 
 # todo: check code и clean() модели Task)
 class TaskUploadCodeApiTestCase(APITestCase):
@@ -177,6 +182,31 @@ class TaskUploadCodeApiTestCase(APITestCase):
             "detail": 'Задание оценили.'
         })
 
+    def test_with_authorization_subscriber_auto_evaluated(self):
+        '''автоматическая оценка не мешает загрузить новый код'''
+        Task.objects.filter(pk=self.task.pk).update(deadline_true=timezone.now() + timedelta(hours=1))
+        task_answer = TaskAnswer.objects.create(
+            task=self.task,
+            student=self.user_subscriber,
+            code="print()",
+            language="1",
+            is_running=False,
+        )
+        TaskAnswerMark.objects.create(task_answer=task_answer, teacher=None, mark=Decimal(5))
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_subscriber.key)
+
+        data = {
+            "language": "1",
+            "code": "print(1)"
+        }
+        url = f'{self.URL}{self.task.id}/'
+        with mock.patch('LMS.celery_tasks.execute_task_answer.delay'):
+            response = self.client.post(url, data=data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(TaskAnswerMark.objects.filter(task_answer__task=self.task).exists())
+
     def test_with_authorization_subscriber_running(self):
         '''код исполняется'''
         # ответили на задание
@@ -261,4 +291,109 @@ class TaskUploadCodeApiTestCase(APITestCase):
         url = f'{self.URL}{self.task.id}/'
         response = self.client.post(url, data=data, format='json')
 
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_dispatch_queue(self):
+        '''в режиме queue id ответа передаётся рабочему процессу после завершения транзакции'''
+        Task.objects.filter(pk=self.task.pk).update(deadline_true=timezone.now() + timedelta(hours=1))
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_subscriber.key)
+
+        data = {
+            "language": "1",
+            "code": "print(1)"
+        }
+        url = f'{self.URL}{self.task.id}/'
+        with override_settings(JUDGE_MODE='queue'), mock.patch('LMS.celery_tasks.execute_task_answer.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, data=data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        task_answer = TaskAnswer.objects.get(task=self.task, student=self.user_subscriber)
+        self.assertTrue(task_answer.is_running)
+        self.assertEqual(response.data, { 'id': task_answer.id, 'queue_position': 0, 'estimated_wait': 0 })
+        delay.assert_called_once_with(task_answer.id)
+        self.assertEqual(JudgeJob.objects.get(task_answer=task_answer).state, '1')
+
+    def test_dispatch_queue_limit(self):
+        '''ответ не принимается, если у студента JUDGE_MAX_QUEUED_PER_USER ответов ждут проверки'''
+        Task.objects.filter(pk=self.task.pk).update(deadline_true=timezone.now() + timedelta(hours=1))
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_subscriber.key)
+
+        data = {
+            "language": "1",
+            "code": "print(1)"
+        }
+        url = f'{self.URL}{self.task.id}/'
+        with override_settings(JUDGE_MODE='queue', JUDGE_MAX_QUEUED_PER_USER=0):
+            response = self.client.post(url, data=data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertFalse(TaskAnswer.objects.filter(task=self.task, student=self.user_subscriber).exists())
+
+    def test_dispatch_spool(self):
+        '''в режиме spool код и входные данные тестов записываются в каталог'''
+        Task.objects.filter(pk=self.task.pk).update(deadline_true=timezone.now() + timedelta(hours=1))
+        TaskTest.objects.create(task=self.task, input='1', output='1', hidden=True)
+        TaskTest.objects.create(task=self.task, input='2', output='2', hidden=True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_subscriber.key)
+
+        data = {
+            "language": "1",
+            "code": "print(input())"
+        }
+        url = f'{self.URL}{self.task.id}/'
+        with TemporaryDirectory() as spool_dir, override_settings(JUDGE_MODE='spool', JUDGE_SPOOL_DIR=spool_dir):
+            response = self.client.post(url, data=data, format='json')
+            task_answer = TaskAnswer.objects.get(task=self.task, student=self.user_subscriber)
+
+            dir_path = path.join(spool_dir, f'{task_answer.id}+')
+            self.assertEqual(sorted(listdir(dir_path)), ['0', '1', 'code.py', 'limits.json'])
+            with open(path.join(dir_path, '1'), 'rt') as fin:
+                self.assertEqual(fin.read(), '2')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_dispatch_spool_language(self):
+        '''имя файла с кодом и язык в limits.json зависят от языка ответа'''
+        Task.objects.filter(pk=self.task.pk).update(deadline_true=timezone.now() + timedelta(hours=1), languages='2')
+        TaskTest.objects.create(task=self.task, input='1', output='1', hidden=True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_subscriber.key)
+
+        data = {
+            "language": "2",
+            "code": "#include <stdio.h>\nint main(void) { int n; scanf(\"%d\", &n); printf(\"%d\\n\", n); return 0; }"
+        }
+        url = f'{self.URL}{self.task.id}/'
+        settings = { 'JUDGE_MODE': 'spool', 'JUDGE_LANGUAGES': ['1', '2'], 'JUDGE_SANDBOX_USER': 'nobody' }
+        with TemporaryDirectory() as spool_dir, override_settings(JUDGE_SPOOL_DIR=spool_dir, **settings):
+            response = self.client.post(url, data=data, format='json')
+            task_answer = TaskAnswer.objects.get(task=self.task, student=self.user_subscriber)
+
+            dir_path = path.join(spool_dir, f'{task_answer.id}+')
+            self.assertEqual(sorted(listdir(dir_path)), ['0', 'code.c', 'limits.json'])
+            with open(path.join(dir_path, 'limits.json'), 'rt') as fin:
+                self.assertEqual(json.load(fin)['language'], '2')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_language_disabled(self):
+        '''C доступен только в заданиях с Task.languages и при включённом на сервере языке и пользователе песочницы'''
+        Task.objects.filter(pk=self.task.pk).update(deadline_true=timezone.now() + timedelta(hours=1))
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_subscriber.key)
+
+        data = {
+            "language": "2",
+            "code": "int main(void) { return 0; }"
+        }
+        url = f'{self.URL}{self.task.id}/'
+        for languages, settings in (
+            ('2', {}),
+            ('2', { 'JUDGE_LANGUAGES': ['1', '2'] }),
+            ('', { 'JUDGE_LANGUAGES': ['1', '2'], 'JUDGE_SANDBOX_USER': 'nobody' }),
+        ):
+            Task.objects.filter(pk=self.task.pk).update(languages=languages)
+            with override_settings(JUDGE_MODE='spool', **settings):
+                response = self.client.post(url, data=data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, settings)
+            self.assertIn('language', response.data)
+        self.assertFalse(TaskAnswer.objects.filter(task=self.task, student=self.user_subscriber).exists())
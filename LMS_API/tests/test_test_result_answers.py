@@ -0,0 +1,171 @@
+from decimal import Decimal
+from datetime import timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth.models import User
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from LMS.models import Course, CourseElement, GradebookEntry, Test, TestQuestion, TestQuestionAnswer, TestResult
+
+
+class TestResultAnswersApiTestCase(APITestCase):
+    ''''''
+    def setUp(self):
+        """Method called to prepare the test fixture. This is called immediately before calling the test method"""
+        self.URL = '/api-lms/test-result-answers/'
+        self.client = APIClient()
+
+        self.user_subscriber = User.objects.create(username='subscriber', email='user1@example.com')
+        self.user_not_owner = User.objects.create(username='not owner', email='user2@example.com')
+        self.token_subscriber = Token.objects.create(user=self.user_subscriber)
+        self.token_not_owner = Token.objects.create(user=self.user_not_owner)
+
+        self.course = Course.objects.create(title='курс')
+        self.course.students.add(self.user_subscriber, self.user_not_owner)
+        self.course_element = CourseElement.objects.create(course=self.course, title='элемент курса')
+        self.test = self.create_test('many')
+        self.test_result = self.test.start_new_test(self.user_subscriber)
+        self.answers = list(self.test_result.test_result_questions_answers.order_by('id'))
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_subscriber.key)
+
+    def create_test(self, test_type, questions=1):
+        test = Test.objects.create(
+            course_element=self.course_element,
+            title=f'тест {test_type} {questions}',
+            mark_outer=Decimal(10),
+            test_type=test_type,
+            shuffle=False,
+            start=timezone.now() - timedelta(minutes=1),
+            end=timezone.now() + timedelta(hours=1),
+            duration=timedelta(minutes=30)
+        )
+        for _ in range(questions):
+            TestQuestion.objects.create(test=test, question_text='баг или фича?', max_mark=Decimal(1), answer_type='one', answer_values='баг\nфича', answer_true='1')
+            TestQuestion.objects.create(test=test, question_text='что изменяемое?', max_mark=Decimal(2), answer_type='many1', answer_values='int\nstr\nlist\ndict', answer_true='2 3')
+            TestQuestion.objects.create(test=test, question_text='ответ?', max_mark=Decimal(3), answer_type='free', answer_true='42')
+        return test
+
+    def patch(self, test_result, data):
+        return self.client.patch(f'{self.URL}{test_result.id}/', data=data, format='json')
+
+    def test_PATCH(self):
+        '''баллы те же, что при ответах по одному'''
+        one, many, free = self.answers
+        response = self.patch(self.test_result, [
+            { 'id': free.id, 'answer': '42' },
+            { 'id': one.id, 'answer': '0' },
+            { 'id': many.id, 'answer': '1 2 3' },
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), [
+            { 'id': one.id, 'answer': '0' },
+            { 'id': many.id, 'answer': '1 2 3' },
+            { 'id': free.id, 'answer': '42' },
+        ])
+
+        marks = dict(TestQuestionAnswer.objects.filter(test_result=self.test_result).values_list('id', 'mark'))
+        self.assertEqual(marks, { one.id: Decimal(0), many.id: Decimal(1), free.id: Decimal(3) })
+
+        # изменение ответа
+        response = self.patch(self.test_result, [ { 'id': one.id, 'answer': '1' } ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(TestQuestionAnswer.objects.get(pk=one.id).mark, Decimal(1))
+
+    def test_PATCH_gradebook(self):
+        '''bulk_update не посылает сигналы: журнал оценок пересчитывается'''
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patch(self.test_result, [ { 'id': x.id, 'answer': answer } for x, answer in zip(self.answers, ['1', '2 3', '42']) ])
+        self.assertTrue(GradebookEntry.objects.filter(user=self.user_subscriber, test=self.test).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api-lms/test-result-complete/{self.test_result.id}/')
+        entry = GradebookEntry.objects.get(user=self.user_subscriber, test=self.test)
+        self.assertEqual(entry.mark, self.test.get_user_mark(self.user_subscriber))
+        self.assertEqual(entry.mark, Decimal(10))
+
+    def test_PATCH_queries(self):
+        '''кол-во запросов не зависит от кол-ва ответов'''
+        def count_queries(test_result):
+            data = [ { 'id': x.id, 'answer': '42' } for x in test_result.test_result_questions_answers.filter(test_question__answer_type='free') ]
+            with CaptureQueriesContext(connection) as context:
+                response = self.patch(test_result, data)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(context.captured_queries)
+
+        big_test_result = self.create_test('many', questions=20).start_new_test(self.user_not_owner)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_not_owner.key)
+        queries = count_queries(big_test_result)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_subscriber.key)
+        self.assertEqual(count_queries(self.test_result), queries)
+
+    def test_PATCH_invalid_data(self):
+        ''''''
+        one, many, free = self.answers
+
+        for data in ({}, [], [ { 'id': one.id } ], [ { 'id': one.id, 'answer': '' } ], [ { 'id': free.id, 'answer': 'x' * 51 } ]):
+            response = self.patch(self.test_result, data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+
+        response = self.patch(self.test_result, [ { 'id': one.id, 'answer': '0' }, { 'id': one.id, 'answer': '1' } ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # неверный формат: ничего не сохраняется
+        response = self.patch(self.test_result, [ { 'id': one.id, 'answer': '1' }, { 'id': many.id, 'answer': '1 1' } ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), { str(many.id): ['incorrect'] })
+        self.assertEqual(TestQuestionAnswer.objects.get(pk=one.id).answer, '')
+
+        # ответ другой попытки
+        other = self.test.start_new_test(self.user_not_owner).test_result_questions_answers.first()
+        response = self.patch(self.test_result, [ { 'id': other.id, 'answer': '1' } ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), { str(other.id): ['not found'] })
+
+    def test_PATCH_permissions(self):
+        ''''''
+        data = [ { 'id': self.answers[0].id, 'answer': '1' } ]
+
+        self.client.credentials()
+        self.assertEqual(self.patch(self.test_result, data).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_not_owner.key)
+        self.assertEqual(self.patch(self.test_result, data).status_code, status.HTTP_403_FORBIDDEN)
+
+        # завершённая попытка
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token_subscriber.key)
+        self.client.patch(f'/api-lms/test-result-complete/{self.test_result.id}/')
+        self.assertEqual(self.patch(self.test_result, data).status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.patch(f'{self.URL}100500/', data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_PATCH_not_subscriber(self):
+        '''отписавшийся от курса студент не отвечает'''
+        self.course.students.remove(self.user_subscriber)
+        response = self.patch(self.test_result, [ { 'id': self.answers[0].id, 'answer': '1' } ])
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_PATCH_test_type_one(self):
+        '''тест 'one': отвечать только по порядку, на отвеченные вопросы ответ не меняется'''
+        test_result = self.create_test('one').start_new_test(self.user_subscriber)
+        one, many, free = test_result.test_result_questions_answers.order_by('id')
+
+        for data in ([ { 'id': many.id, 'answer': '1' } ], [ { 'id': one.id, 'answer': '1' }, { 'id': free.id, 'answer': '42' } ]):
+            self.assertEqual(self.patch(test_result, data).status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.patch(test_result, [ { 'id': many.id, 'answer': '2 3' }, { 'id': one.id, 'answer': '1' } ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.patch(test_result, [ { 'id': one.id, 'answer': '0' } ]).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.patch(test_result, [ { 'id': free.id, 'answer': '42' } ]).status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            list(TestQuestionAnswer.objects.filter(test_result=test_result).order_by('id').values_list('mark', flat=True)),
+            [ Decimal(1), Decimal(2), Decimal(3) ],
+        )
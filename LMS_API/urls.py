@@ -20,15 +20,20 @@ from .views import (
     CurrentUserDataView,
     CourseSubscribeView,
     CourseSubscribersView,
+    CourseGradebookView,
     TaskAnswerEvaluateView,
     TestCreateView,
     TestResultListView,
     TestResultCreateView,
     TestResultCompleteView,
+    TestResultAnswersView,
     TestResultEvaluateView,
     UploadFilesCourseElementView,
     UploadFilesTaskView,
     UploadCodeTaskView,
+    TaskAnswerProgressView,
+    TaskRejudgeView,
+    JudgeStatusView,
     DeleteFileView,
 )
 
@@ -54,10 +59,14 @@ urlpatterns = router.urls + [
     path('current_user_data/', CurrentUserDataView.as_view()),
     path('course_subscribe/', CourseSubscribeView.as_view()),
     path('course_subscribers/<int:pk>/', CourseSubscribersView.as_view()),
+    path('course-gradebook/<int:pk>/', CourseGradebookView.as_view()),
     path('course-element-upload-files/<int:pk>/', UploadFilesCourseElementView.as_view()),
     path('task/', TaskViewSet.as_view({'post': 'create'})),
     path('task/<int:pk>/', TaskViewSet.as_view({'get': 'retrieve', 'patch': 'partial_update', 'delete': 'destroy'})),
     path('task-upload-code/<int:pk>/', UploadCodeTaskView.as_view()),
+    path('task-answer-progress/<int:pk>/', TaskAnswerProgressView.as_view()),
+    path('task-rejudge/<int:pk>/', TaskRejudgeView.as_view()),
+    path('judge-status/', JudgeStatusView.as_view()),
     path('task-upload-files/<int:pk>/', UploadFilesTaskView.as_view()),
     path('task-answer-evaluate/<int:pk>/', TaskAnswerEvaluateView.as_view()),
     path('test/', TestCreateView.as_view()),
@@ -68,6 +77,7 @@ urlpatterns = router.urls + [
     path('test-result-list/', TestResultListView.as_view()),
     path('test-result-create/', TestResultCreateView.as_view()),
     path('test-result-complete/<int:pk>/', TestResultCompleteView.as_view()),
+    path('test-result-answers/<int:pk>/', TestResultAnswersView.as_view()),
     path('test-result-evaluate/<int:pk>/', TestResultEvaluateView.as_view()),
     path('file-delete/<int:pk>/', DeleteFileView.as_view()),
 ]
\ No newline at end of file
@@ -1,9 +1,10 @@
+import json
 import logging
-import random
-from os import mkdir, rename, path
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 
 from rest_framework import status
@@ -13,6 +14,7 @@ from rest_framework.response import Response
 from rest_framework import generics
 from rest_framework import permissions
 from rest_framework.parsers import MultiPartParser, FormParser #FileUploadParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.authentication import TokenAuthentication, SessionAuthentication
 
 from LMS.models import (
@@ -28,6 +30,14 @@ from LMS.models import (
     TestResult,
     FileStorage,
 )
+from LMS import membership
+from LMS.answers import save_answers
+from LMS.attempts import AttemptError, start_attempt
+from LMS.celery_tasks import judge_status
+from LMS.dispatch import can_enqueue, dispatch_task_answer, get_rejudge_progress, rejudge_task
+from LMS.export import XLSX_CONTENT_TYPE, stream_csv, stream_xlsx
+from LMS.gradebook import course_elements, course_marks, course_rows
+from LMS.progress import poll_task_answer
 from LMS.forms import (
     TaskAnswerCodeModelForm,
     TaskAnswerMarkModelForm,
@@ -45,10 +55,12 @@ from LMS_API.serializers import (
     TestCreateSerializer,
     TestResultRetrieveSerializer,
     TestResultListSerializer,
+    TestQuestionAnswerBulkSerializer,
     FileStorageShortSerializer,
 )
 from LMS_API.permissions import (
     CourseOwnerPermission,
+    CourseSubscriberPermission,
     TestResultCompletePermission,
     TestResultEvaluatePermission,
     DeleteFilePermission,
@@ -143,7 +155,7 @@ class CourseSubscribeView(APIView):
             response_data = { "course": "Курс не найден." }
             return Response(status=status.HTTP_400_BAD_REQUEST, data=response_data)
 
-        if subscribe_state and course.excluded.filter(id=request.user.id).exists():
+        if subscribe_state and membership.is_excluded(request.user, course.id):
             response_data = { "detail": "Вам ограничена запись на данный курс." }
             return Response(status=status.HTTP_403_FORBIDDEN, data=response_data)
 
@@ -237,7 +249,7 @@ class TaskAnswerEvaluateView(APIView):
         except:
             return Response({ "detail": "Ответ на задание не найден." }, status.HTTP_404_NOT_FOUND)
 
-        if not task_answer.task.course_element.course.owners.filter(pk=request.user.pk).exists():
+        if not membership.is_owner(request.user, task_answer.course_id):
             return Response({"detail": "У вас недостаточно прав для выполнения данного действия."}, status.HTTP_403_FORBIDDEN)
 
         task_answer_mark = task_answer.get_TaskAnswerMark()
@@ -300,7 +312,7 @@ class TestCreateView(APIView):
         except:
             return Response({'detail':'Страница не найдена.'}, status.HTTP_400_BAD_REQUEST)
 
-        if not course_element.course.owners.filter(pk=request.user.pk).exists():
+        if not membership.is_owner(request.user, course_element.course_id):
             return Response({"detail": "У вас недостаточно прав для выполнения данного действия."}, status.HTTP_403_FORBIDDEN)
 
         # пустой тест заходит в clean() модели
@@ -351,7 +363,10 @@ class TestCreateView(APIView):
             test.delete()
             return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
 
-        questions = TestQuestion.objects.bulk_create(form.save(commit=False) for form in question_forms)
+        questions = [ form.save(commit=False) for form in question_forms ]
+        for question in questions:
+            question.course_id = test.course_id # bulk_create не посылает сигналы
+        questions = TestQuestion.objects.bulk_create(questions)
 
         serializer = TestSerializer(test)
         return Response(serializer.data, status.HTTP_201_CREATED)
@@ -379,10 +394,10 @@ class TestResultListView(generics.ListAPIView):
             return Response({"test_id": "Страница не найдена."}, status.HTTP_404_NOT_FOUND)
 
         # проверка прав. через permission?
-        if not test.course_element.course.students.filter(pk=request.user.pk).exists():
+        if not membership.is_student(request.user, test.course_id):
             return Response({"detail": "У вас недостаточно прав для выполнения данного действия."}, status.HTTP_403_FORBIDDEN)
 
-        queryset = self.get_queryset().filter(test=test_id, user=request.user).order_by('id')
+        queryset = self.get_queryset().with_marks().filter(test=test_id, user=request.user).order_by('id')
 
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -414,6 +429,33 @@ class TestResultCompleteView(generics.GenericAPIView):
         serializer = TestResultRetrieveSerializer(instance)
         return Response(serializer.data, status.HTTP_200_OK)
 
+# todo: OPTIONS)
+class TestResultAnswersView(generics.GenericAPIView):
+    """ответить на несколько вопросов активного прохождения теста: [{"id": id ответа, "answer": ответ}, ...]"""
+    queryset = TestResult.objects.select_related('test')
+
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    permission_classes = [permissions.IsAuthenticated, CourseSubscriberPermission, TestResultCompletePermission]
+
+    def patch(self, request, *args, **kwargs):
+        instance = self.get_object() # Testresult
+
+        serializer = TestQuestionAnswerBulkSerializer(data=request.data, many=True, allow_empty=False)
+        serializer.is_valid(raise_exception=True)
+
+        answers = { x['id']: x['answer'] for x in serializer.validated_data }
+        if len(answers) != len(serializer.validated_data):
+            return Response({'detail': 'Повторяющиеся id ответов.'}, status.HTTP_400_BAD_REQUEST)
+
+        # проверка ответов (clean() модели) и баллы в памяти, запись одним запросом
+        try:
+            test_question_answers = save_answers(instance, answers)
+        except ValidationError as e:
+            return Response(e.message_dict, status.HTTP_400_BAD_REQUEST)
+
+        serializer = TestQuestionAnswerBulkSerializer(test_question_answers, many=True)
+        return Response(serializer.data, status.HTTP_200_OK)
+
 # todo: OPTIONS)
 class TestResultEvaluateView(generics.GenericAPIView):
     """оценить вручную завершённое прохождение теста"""
@@ -471,40 +513,14 @@ class TestResultCreateView(APIView):
             return Response({'test':'Страница не найдена.'}, status.HTTP_400_BAD_REQUEST)
 
         # проверяем что подписан на курс
-        if not test.course_element.course.students.filter(pk=request.user.pk).exists():
+        if not membership.is_student(request.user, test.course_id):
             return Response({"detail": "У вас недостаточно прав для выполнения данного действия."}, status.HTTP_403_FORBIDDEN)
 
-        # проверяем что тест не завершился, есть попытки и нет активных прохождений
-        if timezone.now() < test.start:
-            return Response({"detail": "Тестирование не началось."}, status.HTTP_403_FORBIDDEN)
-
-        if test.end < timezone.now():
-            return Response({"detail": "Тестирование завершено."}, status.HTTP_403_FORBIDDEN)
-
-        test_results = list(TestResult.objects.filter(test=test, user=request.user))
-        if any(not r.is_finished() for r in test_results):
-            return Response({"detail": "Есть активное прохождение теста."}, status.HTTP_403_FORBIDDEN)
-
-        if test.number_of_attempts <= len(test_results):
-            return Response({"detail": "Закончились попытки."}, status.HTTP_403_FORBIDDEN)
-
-        # можно подловить тайминг, когда проверки выше пройдут, а здесь выскочит исключение?
-        # в save() создадутся TestQuestionAnswer
-        test_result = TestResult.objects.create(test=test, user=request.user)
-
-        # определяем порядок вопросов в прохождении
-        questions = test_result.test.test_questions.all().order_by('id')
-
-        if test.shuffle:
-            questions_order = list(range(test.test_questions.count()))
-            random.shuffle(questions_order)
-
-            questions_initial = list(questions)
-            questions = [questions_initial[i] for i in questions_order]
-
-        # создаём записи под ответы для данного прохождения теста
-        test_question_answers = (TestQuestionAnswer(test_result=test_result, test_question=q) for q in questions)
-        TestQuestionAnswer.objects.bulk_create(test_question_answers)
+        # проверяем что тест не завершился, есть попытки и нет активных прохождений, создаём прохождение
+        try:
+            test_result = start_attempt(test, request.user)
+        except AttemptError as e:
+            return Response({"detail": str(e)}, status.HTTP_403_FORBIDDEN)
 
         serializer = TestResultListSerializer(test_result, many=False)
         return Response(serializer.data, status.HTTP_201_CREATED)
@@ -527,7 +543,7 @@ class UploadFilesCourseElementView(APIView):
             return Response({'detail':'Страница не найдена.'}, status.HTTP_400_BAD_REQUEST)
 
         # проверка прав. через permission?
-        if not course_element.course.owners.filter(pk=request.user.pk).exists():
+        if not membership.is_owner(request.user, course_element.course_id):
             return Response({"detail": "У вас недостаточно прав для выполнения данного действия."}, status.HTTP_403_FORBIDDEN)
 
         if 'files' not in request.FILES:
@@ -570,7 +586,7 @@ class UploadFilesTaskView(APIView):
             return Response({'detail':'Страница не найдена.'}, status.HTTP_400_BAD_REQUEST)
 
         # проверка прав. через permission?
-        if not task.course_element.course.is_subscriber(request.user):
+        if not membership.is_student(request.user, task.course_id):
             return Response({"detail": "У вас недостаточно прав для выполнения данного действия."}, status.HTTP_403_FORBIDDEN)
 
         if task.execute_answer:
@@ -634,7 +650,7 @@ class UploadCodeTaskView(APIView):
             return Response({'detail':'Страница не найдена.'}, status.HTTP_400_BAD_REQUEST)
 
         # проверка прав. через permission?
-        if not task.course_element.course.is_subscriber(request.user):
+        if not membership.is_student(request.user, task.course_id):
             return Response({"detail": "У вас недостаточно прав для выполнения данного действия."}, status.HTTP_403_FORBIDDEN)
 
         if not task.execute_answer:
@@ -644,12 +660,15 @@ class UploadCodeTaskView(APIView):
             return Response({"detail": "deadline"}, status.HTTP_403_FORBIDDEN)
 
         taskAnswer = TaskAnswer.objects.filter(task=task, student=request.user).first()
-        if taskAnswer and taskAnswer.get_TaskAnswerMark():
+        if taskAnswer and taskAnswer.is_marked_by_teacher():
             return Response({"detail": "Задание оценили."}, status.HTTP_403_FORBIDDEN)
 
         if taskAnswer and taskAnswer.is_running:
             return Response({"detail": "Новый код можно загрузить только после выполнения предыдущего."}, status.HTTP_403_FORBIDDEN)
 
+        if not can_enqueue(request.user):
+            return Response({"detail": "Слишком много ответов ожидают проверки."}, status.HTTP_429_TOO_MANY_REQUESTS)
+
         code = request.data.get('code')
         language = request.data.get('language')
 
@@ -671,19 +690,150 @@ class UploadCodeTaskView(APIView):
         task_answer = form.save()
         #TaskTestExecution.objects.filter(task_answer=taskAnswer).delete()
 
-        #execute_python.delay(taskAnswer.id)  # .run ?
-        dir_path = path.join('/test_dir_execute', str(task_answer.id))
-        mkdir(dir_path)
+        queue = dispatch_task_answer(task_answer)
+        return Response({ 'id': task_answer.id, **queue }, status.HTTP_200_OK)
+
+class EventStreamRenderer(BaseRenderer):
+    """для text/event-stream. события отдаёт HttpResponse, а рендерер нужен для согласования формата и ошибок"""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data)
+
+class TaskAnswerProgressView(APIView):
+    """
+    API для получения хода проверки ответа на задание в виде server-sent events (см. LMS/progress.py)
+    long-poll: события после Last-Event-ID (или ?after=), ответ возвращается при первом новом событии или через JUDGE_PROGRESS_TIMEOUT
+    """
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+
+    def get(self, request, pk):
+        task_answer = TaskAnswer.objects.select_related('task__course_element__course').filter(pk=pk).first()
+        if task_answer is None:
+            return Response({ "detail": "Ответ на задание не найден." }, status.HTTP_404_NOT_FOUND)
+
+        if task_answer.student != request.user and not membership.is_owner(request.user, task_answer.course_id):
+            return Response({"detail": "У вас недостаточно прав для выполнения данного действия."}, status.HTTP_403_FORBIDDEN)
+
+        after = request.headers.get('Last-Event-ID') or request.query_params.get('after') or ''
+        after = int(after) if after.isdigit() else 0
+
+        response = HttpResponse(poll_task_answer(task_answer, after), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+class TaskRejudgeView(APIView):
+    """API для повторной проверки всех ответов на задание после изменения тестов (см. LMS/dispatch.py rejudge_task)"""
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_task(self, request, pk):
+        task = Task.objects.select_related('course_element__course').filter(pk=pk).first()
+        if task is None:
+            return None, Response({'detail': 'Страница не найдена.'}, status.HTTP_404_NOT_FOUND)
+
+        if not membership.is_owner(request.user, task.course_id):
+            return None, Response({"detail": "У вас недостаточно прав для выполнения данного действия."}, status.HTTP_403_FORBIDDEN)
+
+        return task, None
+
+    def get(self, request, pk):
+        """ход повторной проверки"""
+        task, error = self.get_task(request, pk)
+        if error:
+            return error
+        return Response(get_rejudge_progress(task), status.HTTP_200_OK)
+
+    def post(self, request, pk):
+        """поставить ответы в очередь повторной проверки"""
+        task, error = self.get_task(request, pk)
+        if error:
+            return error
+
+        if not task.execute_answer:
+            return Response({"detail": "Задание с ручной проверкой."}, status.HTTP_400_BAD_REQUEST)
+
+        if settings.JUDGE_MODE != 'queue':
+            return Response({"detail": "Повторная проверка доступна только в режиме очереди."}, status.HTTP_400_BAD_REQUEST)
+
+        return Response({ 'queued': rejudge_task(task) }, status.HTTP_200_OK)
 
-        with open(path.join(dir_path, 'code.py'), 'wt') as fout:
-            fout.write(task_answer.code)
+class CsvRenderer(BaseRenderer):
+    """для ?format=csv. таблицу отдаёт StreamingHttpResponse, рендерер нужен для согласования формата и ошибок"""
+    media_type = 'text/csv'
+    format = 'csv'
 
-        for i, test in enumerate(task.task_tests.all().order_by('id')):
-            with open(path.join(dir_path, str(i)), 'wt') as fout:
-                fout.write(test.input)
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data)
 
-        rename(dir_path, dir_path+'+')
-        return Response(status.HTTP_200_OK)
+class XlsxRenderer(BaseRenderer):
+    """для ?format=xlsx (см. CsvRenderer)"""
+    media_type = XLSX_CONTENT_TYPE
+    format = 'xlsx'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data)
+
+class CourseGradebookView(generics.RetrieveAPIView):
+    """
+    API журнала оценок курса для преподавателя: студенты × (задания + тесты) с суммами по элементам курса (см. LMS/gradebook.py)
+    ?format=csv и ?format=xlsx - потоковая выгрузка таблицы, студенты читаются частями
+    """
+    queryset = Course.objects.all()
+
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    permission_classes = [permissions.IsAuthenticated, CourseOwnerPermission]
+    renderer_classes = [JSONRenderer, CsvRenderer, XlsxRenderer]
+
+    def retrieve(self, request, *args, **kwargs):
+        course = self.get_object()
+
+        format = request.accepted_renderer.format
+        if format in ('csv', 'xlsx'):
+            if format == 'csv':
+                response = StreamingHttpResponse(stream_csv(course_rows(course)), content_type='text/csv; charset=utf-8')
+            else:
+                response = StreamingHttpResponse(stream_xlsx(course_rows(course), 'оценки'), content_type=XLSX_CONTENT_TYPE)
+            response['Content-Disposition'] = f'attachment; filename="gradebook-{course.id}.{format}"'
+            return response
+
+        elements = course_elements(course)
+        students = [
+            {
+                'id': student.id,
+                'username': student.username,
+                'tasks': task_marks,
+                'tests': test_marks,
+                'elements': element_marks,
+                'mark': mark,
+            }
+            for student, task_marks, test_marks, element_marks, mark in course_marks(course, elements)
+        ]
+        data = {
+            'elements': [
+                {
+                    'id': elem.id,
+                    'title': elem.title,
+                    'tasks': [ { 'id': x.id, 'title': x.title, 'mark_max': x.mark_outer } for x in elem.task_list ],
+                    'tests': [ { 'id': x.id, 'title': x.title, 'mark_max': x.mark_outer } for x in elem.test_list ],
+                    'mark_max': sum(x.mark_outer for x in elem.task_list + elem.test_list),
+                }
+                for elem in elements
+            ],
+            'students': students,
+        }
+        return Response(data, status.HTTP_200_OK)
+
+class JudgeStatusView(APIView):
+    """API для наблюдения за автоматической проверкой: сколько ответов и результатов ждут обработки и как долго"""
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(judge_status(), status.HTTP_200_OK)
 
 
 class DeleteFileView(generics.DestroyAPIView):
@@ -1,59 +1,147 @@
-import subprocess
-from os import listdir, mkdir, path, rename
-from time import sleep
-from datetime import datetime
-from shutil import rmtree
+import argparse
+import json
+import sys
+from os import listdir, makedirs, mkdir, path, rename
+from threading import Thread
+from time import sleep, time
+from shutil import move, rmtree
 
-# последовательно считывает каталоги и выполняет код
+from LMS.checkers import output_checker
+from LMS.judge import JudgePool
+from LMS.languages import get_language
+from LMS import spool
 
-def run_code(filepath, input) -> str:
+# запасной режим автоматической проверки (settings.JUDGE_MODE = 'spool')
+# считывает каталоги и выполняет код. несколько ответов и тесты одного ответа выполняются параллельно
+# в основном режиме (JUDGE_MODE = 'queue') код выполняют рабочие процессы celery
+
+# python execute_code.py --workers 4 --cpus 0 1 2 3 --max-submissions 8
+# python execute_code.py --preload string re math random  (запуск через fork server, см. LMS/forkserver.py)
+# sudo python execute_code.py --user judge  (программы выполняются от пользователя песочницы, см. LMS/judge.py)
+# процесс сообщает о себе и продлевает аренду взятых каталогов каждую секунду (см. LMS/spool.py),
+# каталоги с просроченной арендой после сбоя другого процесса берутся заново
+# python execute_code.py --spool-dir /tmp/spool --result-dir /tmp/results  (другие каталоги, см. manage.py pipeline_bench)
+# каталог, который не удалось прочитать, переносится в --quarantine-dir, ответ снимает с проверки reap_judge_jobs
+
+# ограничения для каталогов без limits.json (записаны до его появления): значения judge.run_code по умолчанию
+DEFAULT_LIMITS = { 'limit_time': 1, 'limit_memory_Mbyte': 256 }
+
+def write_results(spool_dir, result_dir, dir, filenames, future, in_progress) -> None:
+    '''
+    записывает результаты запуска (json) в result_dir и помечает каталоги как обработанные
+    для незапущенных тестов (fail fast) файлы не создаются
+    если запуск или запись завершились ошибкой, каталог остаётся необработанным, и аренда больше не продлевается:
+    после её истечения каталог берётся заново со следующей попыткой, после JUDGE_MAX_ATTEMPTS ответ снимает reap_judge_jobs
+    '''
+    try:
+        results = future.result()
+
+        dir_tests = path.join(spool_dir, dir)
+        dir_res = path.join(result_dir, dir[:-1])
+
+        if path.exists(dir_res):
+            rmtree(dir_res)
+        mkdir(dir_res)
+
+        for filename, result in zip(filenames, results):
+            if result is None:
+                continue
+            with open(path.join(dir_res, filename), 'wt') as fout:
+                json.dump(result, fout)
+
+        rename(dir_res, dir_res+'+')
+        rename(dir_tests, dir_tests[:-1])
+    finally:
+        # иначе heartbeat продлевает аренду каталога бесконечно
+        in_progress.discard(dir)
+
+def quarantine(spool_dir, quarantine_dir, dir, reason) -> None:
+    '''переносит каталог в quarantine_dir, чтобы цикл не брал его снова'''
+    print(f'{dir} quarantined: {reason!r}', file=sys.stderr)
+    dir_quarantine = path.join(quarantine_dir, f'spool-{dir[:-1]}')
+    try:
+        makedirs(quarantine_dir, exist_ok=True)
+        if path.exists(dir_quarantine):
+            rmtree(dir_quarantine)
+        move(path.join(spool_dir, dir), dir_quarantine)
+    except OSError as e:
+        print(f'{dir} not quarantined: {e!r}', file=sys.stderr)
+
+def submit_dir(pool, spool_dir, result_dir, dir, in_progress) -> None:
+    '''передаёт код и тесты каталога в пул, результаты записывает write_results'''
+    dir_tests = path.join(spool_dir, dir)
+    # тесты обозначаются от 0 до n-1, порядок важен для fail fast
+    filenames = sorted([ x for x in listdir(dir_tests) if x.isdigit() ], key=int)
+
+    limits = dict(DEFAULT_LIMITS)
+    if path.exists(path.join(dir_tests, 'limits.json')):
+        with open(path.join(dir_tests, 'limits.json'), 'rt') as fin:
+            limits.update(json.load(fin))
+    # в каталогах от предыдущей версии языка нет, код на python
+    language = get_language(limits.get('language'))
+
+    # файл с ожидаемыми выводами есть только у заданий с Task.fail_fast
+    accepted = None
+    if path.exists(path.join(dir_tests, 'outputs.json')):
+        with open(path.join(dir_tests, 'outputs.json'), 'rt') as fin:
+            accepted = output_checker(json.load(fin))
+
+    inputs = []
+    for filename in filenames:
+        with open(path.join(dir_tests, filename), 'rt') as fin:
+            inputs.append(fin.read())
+
+    # если пул занят, то ждём освобождения места
+    in_progress.add(dir)
+    future = pool.submit(path.join(dir_tests, language.source_name), inputs, limits['limit_time'], limits['limit_memory_Mbyte'], accepted=accepted, language=language.code)
+    future.add_done_callback(lambda f: write_results(spool_dir, result_dir, dir, filenames, f, in_progress))
+
+def handle_dir(pool, args, dir, worker, in_progress) -> None:
+    '''
+    берёт каталог в аренду и передаёт в пул, args - аргументы командной строки
+    ошибка в одном каталоге (повреждённый limits.json, неизвестный язык) не останавливает цикл: каталог переносится в карантин
+    '''
     try:
-        start = datetime.now()
-        p = subprocess.run(
-            ["python3.9", filepath],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            input=input,
-            timeout=1, # секунды
-            encoding='utf-8',
-        )
-        duration = datetime.now() - start
-
-        #p.stdout, p.stderr, p.returncode
-        return p.stdout
+        # каталог выполняет другой процесс
+        if spool.claim(path.join(args.spool_dir, dir), worker, args.lease_timeout):
+            submit_dir(pool, args.spool_dir, args.result_dir, dir, in_progress)
     except Exception as e:
-        print('exception!')
-        duration = datetime.now() - start
-        return None
+        in_progress.discard(dir)
+        quarantine(args.spool_dir, args.quarantine_dir, dir, e)
+
+def heartbeat(spool_dir, worker, started, in_progress) -> None:
+    '''heartbeat процесса и продление аренды каталогов, которые выполняются'''
+    while True:
+        dirs = list(in_progress)
+        spool.write_heartbeat(spool_dir, worker, { 'started': started, 'in_progress': len(dirs) })
+        for dir in dirs:
+            spool.renew(path.join(spool_dir, dir))
+        sleep(1)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='выполнение кода из каталогов /test_dir_execute')
+    parser.add_argument('--spool-dir', default='/test_dir_execute', help='каталог с кодом и тестами (settings.JUDGE_SPOOL_DIR)')
+    parser.add_argument('--result-dir', default='/test_dir_executed', help='каталог для результатов (settings.JUDGE_SPOOL_RESULT_DIR)')
+    parser.add_argument('--quarantine-dir', default='/test_dir_quarantine', help='каталог для каталогов, которые не удалось прочитать (settings.JUDGE_SPOOL_QUARANTINE_DIR)')
+    parser.add_argument('--workers', type=int, default=None, help='сколько программ выполняется одновременно')
+    parser.add_argument('--cpus', type=int, nargs='+', default=None, help='CPU за которыми закрепляются программы')
+    parser.add_argument('--max-submissions', type=int, default=None, help='сколько ответов выполняется одновременно')
+    parser.add_argument('--preload', nargs='*', default=None, help='запуск через fork server с заранее импортированными модулями')
+    parser.add_argument('--user', default=None, help='пользователь песочницы (settings.JUDGE_SANDBOX_USER), без него код на C не выполняется')
+    parser.add_argument('--lease-timeout', type=float, default=60, help='через сколько секунд без продления аренды каталог может взять другой процесс (settings.JUDGE_LEASE_TIMEOUT)')
+    args = parser.parse_args()
+
+    pool = JudgePool(workers=args.workers, cpus=args.cpus, max_submissions=args.max_submissions, preload=args.preload, user=args.user)
+    in_progress = set() # каталоги переданные в пул
+    worker = spool.worker_name()
+    Thread(target=heartbeat, args=(args.spool_dir, worker, time(), in_progress), daemon=True).start()
+
     while True:
         # работа с каталогами
-        dirs = [ x for x in listdir('/test_dir_execute') if x.endswith('+') and path.isdir(path.join('/test_dir_execute', x)) ]
-        print(dirs)
+        dirs = [ x for x in listdir(args.spool_dir) if x.endswith('+') and x not in in_progress and path.isdir(path.join(args.spool_dir, x)) ]
 
         if len(dirs) == 0:
             sleep(1)
 
         for dir in dirs:
-            dir_tests = path.join('/test_dir_execute', dir)
-            dir_res = path.join('/test_dir_executed', dir[:-1])
-
-            if path.exists(dir_res):
-                rmtree(dir_res)
-            mkdir(dir_res)
-
-            filenames = [ x for x in listdir(dir_tests) if x != 'code.py' ]
-
-            code_path = path.join(dir_tests, 'code.py')
-            for filename in filenames:
-                with open(path.join(dir_tests, filename), 'rt') as fin:
-                    input = fin.read()
-                
-                output = run_code(code_path, input)
-
-                with open(path.join(dir_res, filename), 'wt') as fout:
-                    fout.write(output)
-
-            rename(dir_res, dir_res+'+')
-            rename(dir_tests, dir_tests[:-1])
\ No newline at end of file
+            handle_dir(pool, args, dir, worker, in_progress)
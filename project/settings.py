@@ -200,6 +200,18 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'LMS.celery_tasks.everyday',
         'schedule': crontab(hour=3, minute=0), # кажд. день в 03:00
     },
+    'judge-ingest-results': {
+        'task': 'LMS.celery_tasks.check_files', # только при JUDGE_MODE = 'spool'
+        'schedule': timedelta(seconds=1),
+    },
+    'judge-schedule-jobs': {
+        'task': 'LMS.celery_tasks.schedule_judge_jobs', # только при JUDGE_MODE = 'queue'
+        'schedule': timedelta(seconds=5),
+    },
+    'judge-reap-jobs': {
+        'task': 'LMS.celery_tasks.reap_judge_jobs',
+        'schedule': timedelta(seconds=30),
+    },
 }
 
 # логирование
@@ -244,6 +256,48 @@ TIMEOUT_TASK_NONAUTOMATIC = timedelta(seconds=5)
 DAILY_COMMENTS = 5
 FILE_MAX_SIZE = 128 * 1024 * 1024
 
+# автоматическая проверка кода
+# 'queue' - id ответа передаётся через брокер celery рабочим процессам (celery -A project worker)
+# 'spool' - запасной режим. код и тесты записываются в каталоги, их выполняет execute_code.py
+# для локального запуска без брокера можно поставить CELERY_TASK_ALWAYS_EAGER = True
+JUDGE_MODE = 'queue'
+JUDGE_SPOOL_DIR = '/test_dir_execute'
+JUDGE_SPOOL_RESULT_DIR = '/test_dir_executed'
+JUDGE_SPOOL_QUARANTINE_DIR = '/test_dir_quarantine' # результаты, которые не удалось занести в БД
+JUDGE_INGEST_SUBMISSIONS = 50 # сколько ответов заносится в БД одной транзакцией
+JUDGE_INGEST_BATCH_SIZE = 500 # batch_size для bulk_create TaskTestExecution
+# параллельный запуск тестов в каждом рабочем процессе (None - по числу доступных CPU)
+# при celery worker --concurrency=N одновременно может выполняться N*JUDGE_WORKERS программ
+JUDGE_WORKERS = None
+JUDGE_CPUS = None # список CPU за которыми закрепляются программы, например [2, 3]
+JUDGE_MAX_SUBMISSIONS = None
+# запуск программ через fork server с заранее импортированными SAFE_IMPORTS вместо нового интерпретатора на каждый тест
+JUDGE_FORKSERVER = False
+# пользователь, от которого выполняются программы (см. LMS/judge.py): рабочие процессы запускаются от root,
+# а файлы проекта этому пользователю недоступны. None - от пользователя рабочего процесса
+JUDGE_SANDBOX_USER = None
+# языки, доступные в заданиях (коды LMS/languages.py, в задании ещё Task.languages).
+# '2' (C) выполняется без статической проверки кода и включается только вместе с JUDGE_SANDBOX_USER
+JUDGE_LANGUAGES = ['1']
+# очередь проверки (JUDGE_MODE = 'queue', см. LMS/scheduler.py)
+JUDGE_MAX_IN_FLIGHT = 8 # сколько ответов одновременно передано рабочим процессам (по concurrency celery worker)
+JUDGE_MAX_IN_FLIGHT_PER_USER = 1 # сколько ответов одного студента проверяются одновременно
+JUDGE_MAX_QUEUED_PER_USER = 5 # сколько ответов студента может ждать проверки, новые отклоняются (429)
+JUDGE_DEADLINE_PRIORITY = timedelta(hours=1) # ответы на задания с дедлайном в ближайший час проверяются раньше
+JUDGE_QUEUE_POSITION_LIMIT = 200 # для скольких первых ответов очереди место вычисляется точно (LMS/scheduler.py)
+JUDGE_JOB_DURATION = 2 # начальная оценка продолжительности проверки одного ответа (сек)
+JUDGE_REJUDGE_MAX_IN_FLIGHT = 2 # сколько мест занимает повторная проверка после изменения тестов
+JUDGE_RESULT_CACHE_MAX_AGE = timedelta(days=7) # сколько действуют результаты в кэше проверки (LMS/result_cache.py)
+# восстановление после сбоев рабочих процессов (см. LMS/health.py)
+JUDGE_HEARTBEAT_INTERVAL = 5 # сек
+JUDGE_WORKER_TIMEOUT = timedelta(seconds=30) # рабочий процесс без сигнала дольше этого считается остановленным
+JUDGE_LEASE_TIMEOUT = timedelta(seconds=60) # должно быть больше времени выполнения одного теста (для execute_code.py --lease-timeout)
+JUDGE_MAX_ATTEMPTS = 3 # после стольких просроченных аренд ответ снимается с проверки
+# передача хода проверки клиентам (LMS/progress.py): 'local' - внутри процесса, 'redis' - между процессами
+JUDGE_PROGRESS_BACKEND = 'redis'
+JUDGE_PROGRESS_REDIS_URL = 'redis://localhost:6379'
+JUDGE_PROGRESS_TIMEOUT = 5 # сек, сколько запрос хода проверки ждёт новое событие (занимает рабочий процесс WSGI, см. LMS/progress.py)
+
 
 # улучшить запросы к БД
 #LOGGING = {